@@ -13,18 +13,30 @@ from pydantic import BaseModel
 
 from browzee_agent.agent.message_manager.views import MessageMetadata
 from browzee_agent.agent.prompts import AgentMessagePrompt
-from browzee_agent.agent.views import ActionResult, AgentOutput, AgentStepInfo, MessageManagerState
+from browzee_agent.agent.views import ActionResult, AgentOutput, AgentStepInfo, ElementFormat, MessageManagerState
 from browzee_agent.browser.views import BrowserState
+from browzee_agent.dom.delta.service import ElementDeltaBuilder
+from browzee_agent.dom.delta.views import ElementDelta, ElementSnapshot
 from browzee_agent.utils import time_execution_sync
 
 logger = logging.getLogger(__name__)
 
+# a delta longer than this share of the element list is replaced by a new list
+DELTA_MAX_RATIO = 0.5
+
 
 class MessageManagerSettings(BaseModel):
 	max_input_tokens: int = 128000
 	estimated_characters_per_token: int = 3
 	image_tokens: int = 800
 	include_attributes: list[str] = []
+	max_elements_tokens: int | None = None
+	max_element_text_length: int | None = None
+	compress_repeated_elements: bool = False
+	max_ranked_elements: int | None = None
+	element_format: ElementFormat = 'html'
+	delta_state_messages: bool = False
+	delta_refresh_interval: int = 10
 	message_context: str | None = None
 	sensitive_data: dict[str, str] | None = None
 	available_file_paths: list[str] | None = None
@@ -43,6 +55,11 @@ class MessageManager:
 		self.state = state
 		self.system_prompt = system_message
 
+		# element list kept in the history for the delta state messages, and the number of deltas sent since
+		self._element_base: ElementSnapshot | None = None
+		self._element_base_length = 0
+		self._element_base_age = 0
+
 		# Only initialize messages if state is empty
 		if len(self.state.history.messages) == 0:
 			self._init_messages()
@@ -125,6 +142,7 @@ class MessageManager:
 		result: list[ActionResult] | None = None,
 		step_info: AgentStepInfo | None = None,
 		use_vision=True,
+		next_goal: str | None = None,
 	) -> None:
 		"""Add browser state as human message"""
 
@@ -146,14 +164,74 @@ class MessageManager:
 					result = None  # if result in history, we dont want to add it again
 
 		# otherwise add state message and result to next message (which will not stay in memory)
-		state_message = AgentMessagePrompt(
+		prompt = AgentMessagePrompt(
 			state,
 			result,
 			include_attributes=self.settings.include_attributes,
 			step_info=step_info,
-		).get_user_message(use_vision)
+			max_elements_tokens=self.settings.max_elements_tokens,
+			max_element_text_length=self.settings.max_element_text_length,
+			compress_repeated_elements=self.settings.compress_repeated_elements,
+			max_ranked_elements=self.settings.max_ranked_elements,
+			element_format=self.settings.element_format,
+			task=self.task,
+			next_goal=next_goal,
+		)
+		if self.settings.delta_state_messages:
+			prompt.element_delta = self._get_element_delta(state, prompt)
+		state_message = prompt.get_user_message(use_vision)
 		self._add_message_with_tokens(state_message)
 
+	def _get_element_delta(self, state: BrowserState, prompt: AgentMessagePrompt) -> str:
+		"""
+		Changes of the interactive elements since the element list kept in the history. The list is sent
+		again, replacing the previous one, after a navigation, every delta_refresh_interval steps, when it
+		left the history, or when the changes would be too long. Like the list, the changes leave out the
+		elements the relevance ranking omits; a list cut by the token budget is sent in the state message
+		instead.
+		"""
+		snapshot = ElementDeltaBuilder.snapshot(
+			state.element_tree,
+			state.url,
+			self.settings.include_attributes,
+			self.settings.max_element_text_length,
+			self.settings.element_format,
+		)
+		# the elements the list would show, the others are not reported as added
+		keep = prompt.selection.keep if prompt.selection else None
+		base = self._element_base
+		if (
+			base is not None
+			and base.url == snapshot.url
+			and self._element_base_age < self.settings.delta_refresh_interval
+			and any(m.metadata.message_type == 'element_list' for m in self.state.history.messages)
+		):
+			delta = ElementDeltaBuilder.diff(base, snapshot, keep).to_string()
+			if len(delta) <= DELTA_MAX_RATIO * self._element_base_length:
+				self._element_base_age += 1
+				return delta
+
+		elements_text = prompt.get_elements_text()
+		self.state.history.remove_messages_of_type('element_list')
+		if prompt.elements_truncated:
+			# the elements cut by the token budget would be taken for unchanged ones: no delta while the
+			# list does not fit, it is sent in the state message as without delta_state_messages
+			self._element_base = None
+			return elements_text
+
+		message = HumanMessage(
+			content=f'Interactive elements of {state.url}{prompt.elements_description}, '
+			f'the next state messages only list the changes:\n{elements_text or "empty page"}'
+		)
+		self._add_message_with_tokens(message, message_type='element_list')
+		if keep is not None:
+			# the base is what the list shows, the elements the ranking left out are not in it
+			snapshot.elements = {identity: entry for identity, entry in snapshot.elements.items() if entry[0] in keep}
+		self._element_base = snapshot
+		self._element_base_length = len(elements_text)
+		self._element_base_age = 0
+		return ElementDelta().to_string()
+
 	def add_model_output(self, model_output: AgentOutput) -> None:
 		"""Add model output as AI message"""
 		tool_calls = [
@@ -120,6 +120,126 @@ def test_add_state_with_non_memory_result(message_manager: MessageManager):
 	assert isinstance(messages[2], HumanMessage)
 
 
+def test_add_truncated_state_message(message_manager: MessageManager):
+	"""Test that a state cut at the DOM extraction budget is flagged to the model"""
+	state = BrowserState(
+		url='https://test.com',
+		title='Test Page',
+		element_tree=DOMElementNode(
+			tag_name='div',
+			attributes={},
+			children=[],
+			is_visible=True,
+			parent=None,
+			xpath='//div',
+		),
+		selector_map={},
+		tabs=[TabInfo(page_id=1, url='https://test.com', title='Test Page')],
+		truncated=True,
+	)
+	message_manager.add_state_message(state)
+
+	messages = message_manager.get_messages()
+	assert 'only part of it was extracted' in messages[-1].content
+
+
+def button_page(url: str, labels: list[str]) -> BrowserState:
+	root = DOMElementNode(tag_name='body', attributes={}, children=[], is_visible=True, parent=None, xpath='html/body')
+	selector_map = {}
+	for index, label in enumerate(labels):
+		button = DOMElementNode(
+			tag_name='button',
+			attributes={},
+			children=[],
+			is_visible=True,
+			parent=root,
+			xpath=f'html/body/button[{index + 1}]',
+			highlight_index=index,
+		)
+		button.children.append(DOMTextNode(text=label, is_visible=True, parent=button))
+		root.children.append(button)
+		selector_map[index] = button
+	return BrowserState(
+		url=url,
+		title='Test Page',
+		element_tree=root,
+		selector_map=selector_map,
+		tabs=[TabInfo(page_id=1, url=url, title='Test Page')],
+	)
+
+
+def delta_step(message_manager: MessageManager, browser_state: BrowserState) -> tuple[list[str], str]:
+	"""The element lists in the history and the state message after adding the state"""
+	message_manager.add_state_message(browser_state)
+	messages = message_manager.get_messages()
+	state_message = messages[-1].content
+	message_manager._remove_last_state_message()
+	element_lists = [m.content for m in messages if 'the next state messages only list the changes' in str(m.content)]
+	return element_lists, state_message
+
+
+def test_delta_state_messages():
+	"""Test that on the same page only the element changes are sent, with a refresh on navigation"""
+	message_manager = MessageManager(
+		task='Test task',
+		system_message=SystemMessage(content='Test actions'),
+		settings=MessageManagerSettings(delta_state_messages=True, delta_refresh_interval=2),
+	)
+
+	def step(browser_state: BrowserState) -> tuple[list[str], str]:
+		return delta_step(message_manager, browser_state)
+
+	labels = [f'Button {i}' for i in range(20)]
+	element_lists, state_message = step(button_page('https://test.com', labels))
+	assert len(element_lists) == 1 and '[19]<button >Button 19 />' in element_lists[0]
+	assert 'No changes since the element list above.' in state_message
+
+	labels[3] = 'Saved'
+	element_lists, state_message = step(button_page('https://test.com', labels))
+	assert len(element_lists) == 1
+	assert 'changed:\n\t[3]<button >Saved />' in state_message and 'Button 19' not in state_message
+
+	# the refresh interval is reached, the list is sent again and replaces the old one
+	step(button_page('https://test.com', labels))
+	element_lists, state_message = step(button_page('https://test.com', labels))
+	assert len(element_lists) == 1 and '[3]<button >Saved />' in element_lists[0]
+
+	# navigation
+	element_lists, state_message = step(button_page('https://other.com', labels[:2]))
+	assert len(element_lists) == 1 and 'https://other.com' in element_lists[0]
+	assert 'No changes since the element list above.' in state_message
+
+
+def test_delta_base_is_the_element_list():
+	"""Test that the changes are relative to the elements the list showed, not to the whole page"""
+	labels = [f'Search flights to city {i}' for i in range(8)] + ['Cookie settings', 'Privacy policy', 'Careers', 'Press']
+	ranked = MessageManager(
+		task='search flights',
+		system_message=SystemMessage(content='Test actions'),
+		settings=MessageManagerSettings(delta_state_messages=True, max_ranked_elements=8),
+	)
+	element_lists, state_message = delta_step(ranked, button_page('https://test.com', labels))
+	assert 'city 7' in element_lists[0] and 'Careers' not in element_lists[0]
+	assert 'No changes since the element list above.' in state_message
+
+	# the elements the ranking leaves out are neither added nor changed, a shown one is
+	labels[0], labels[10] = 'Search cheap flights', 'Jobs'
+	element_lists, state_message = delta_step(ranked, button_page('https://test.com', labels))
+	assert len(element_lists) == 1
+	assert 'changed:\n\t[0]<button >Search cheap flights />' in state_message and 'Jobs' not in state_message
+
+	# a list cut by the token budget would make the cut elements look unchanged, it is sent in full
+	budgeted = MessageManager(
+		task='Test task',
+		system_message=SystemMessage(content='Test actions'),
+		settings=MessageManagerSettings(delta_state_messages=True, max_elements_tokens=20),
+	)
+	for _ in range(2):
+		element_lists, state_message = delta_step(budgeted, button_page('https://test.com', labels))
+		assert element_lists == []
+		assert '[0]<button >Search cheap flights />' in state_message and 'content truncated' in state_message
+
+
 @pytest.mark.skip('not sure how to fix this')
 @pytest.mark.parametrize('max_tokens', [100000, 10000, 5000])
 def test_token_overflow_handling_with_real_flow(message_manager: MessageManager, max_tokens):
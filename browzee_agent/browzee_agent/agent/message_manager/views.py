@@ -119,6 +119,12 @@ class MessageHistory(BaseModel):
 				self.messages.pop(i)
 				break
 
+	def remove_messages_of_type(self, message_type: str) -> None:
+		"""Remove all messages added with this message type"""
+		for msg in [m for m in self.messages if m.metadata.message_type == message_type]:
+			self.current_tokens -= msg.metadata.tokens
+			self.messages.remove(msg)
+
 	def remove_last_state_message(self) -> None:
 		"""Remove last state message from history"""
 		if len(self.messages) > 2 and isinstance(self.messages[-1].message, HumanMessage):
@@ -1,13 +1,19 @@
 import datetime
 import importlib.resources
 from datetime import datetime
+from functools import cached_property
 from typing import TYPE_CHECKING, List, Optional
 
 from langchain_core.messages import HumanMessage, SystemMessage
 
+from browzee_agent.dom.accessibility.service import AccessibilityTreeSerializer
+from browzee_agent.dom.relevance.service import ElementRelevanceRanker
+from browzee_agent.dom.views import ELEMENTS_TRUNCATED
+
 if TYPE_CHECKING:
-	from browzee_agent.agent.views import ActionResult, AgentStepInfo
+	from browzee_agent.agent.views import ActionResult, AgentStepInfo, ElementFormat
 	from browzee_agent.browser.views import BrowserState
+	from browzee_agent.dom.relevance.views import RelevanceSelection
 
 
 class SystemPrompt:
@@ -66,14 +72,76 @@ class AgentMessagePrompt:
 		result: list['ActionResult'] | None = None,
 		include_attributes: list[str] | None = None,
 		step_info: Optional['AgentStepInfo'] = None,
+		max_elements_tokens: int | None = None,
+		max_element_text_length: int | None = None,
+		compress_repeated_elements: bool = False,
+		max_ranked_elements: int | None = None,
+		element_format: 'ElementFormat' = 'html',
+		task: str | None = None,
+		next_goal: str | None = None,
+		element_delta: str | None = None,
 	):
 		self.state = state
 		self.result = result
 		self.include_attributes = include_attributes or []
 		self.step_info = step_info
+		self.max_elements_tokens = max_elements_tokens
+		self.max_element_text_length = max_element_text_length
+		self.compress_repeated_elements = compress_repeated_elements
+		self.max_ranked_elements = max_ranked_elements
+		self.element_format = element_format
+		self.task = task
+		self.next_goal = next_goal
+		# replaces the element list when the list itself is kept earlier in the history
+		self.element_delta = element_delta
+		# whether the token budget cut the last get_elements_text
+		self.elements_truncated = False
+
+	@property
+	def elements_description(self) -> str:
+		if self.element_format == 'accessibility':
+			return ' (accessibility tree, one [index] role "name" states line per element)'
+		return ''
+
+	@cached_property
+	def selection(self) -> Optional['RelevanceSelection']:
+		"""The elements most relevant to the task, when max_ranked_elements limits the list"""
+		if self.max_ranked_elements is None or not self.task:
+			return None
+		return ElementRelevanceRanker.select(self.state.selector_map, self.task, self.next_goal, self.max_ranked_elements)
+
+	def get_elements_text(self) -> str:
+		"""The interactive elements of the state, without the scroll position"""
+		selection = self.selection
+		keep = selection.keep if selection else None
+		if self.element_format == 'accessibility':
+			elements_text = AccessibilityTreeSerializer.serialize(
+				self.state.element_tree,
+				max_tokens=self.max_elements_tokens,
+				max_text_length=self.max_element_text_length,
+				keep=keep,
+			)
+		else:
+			elements_text = self.state.element_tree.clickable_elements_to_string(
+				include_attributes=self.include_attributes,
+				max_tokens=self.max_elements_tokens,
+				max_text_length=self.max_element_text_length,
+				compress_repeated=self.compress_repeated_elements,
+				keep=keep,
+				# only the compressed runs are cached
+				fragment_cache=self.state.fragment_cache if self.compress_repeated_elements else None,
+			)
+
+		self.elements_truncated = elements_text.endswith(ELEMENTS_TRUNCATED)
+		if selection and selection.omitted:
+			elements_text += (
+				f'\n... {selection.omitted} more elements less relevant to the task omitted - scroll or extract content to see more ...'
+			)
+		return elements_text.strip('\n')
 
 	def get_user_message(self, use_vision: bool = True) -> HumanMessage:
-		elements_text = self.state.element_tree.clickable_elements_to_string(include_attributes=self.include_attributes)
+		elements_text = self.element_delta if self.element_delta is not None else self.get_elements_text()
+		elements_description = self.elements_description
 
 		has_content_above = (self.state.pixels_above or 0) > 0
 		has_content_below = (self.state.pixels_below or 0) > 0
@@ -94,6 +162,9 @@ class AgentMessagePrompt:
 		else:
 			elements_text = 'empty page'
 
+		if self.state.truncated:
+			elements_text += '\n... page too large, only part of it was extracted - scroll or extract content to see more ...'
+
 		if self.step_info:
 			step_info_description = f'Current step: {self.step_info.step_number + 1}/{self.step_info.max_steps}'
 		else:
@@ -108,7 +179,7 @@ The following is one-time information - if you need to remember it write it to m
 Current url: {self.state.url}
 Available tabs:
 {self.state.tabs}
-Interactive elements from top layer of the current page inside the viewport:
+Interactive elements from top layer of the current page inside the viewport{elements_description}:
 {elements_text}
 {step_info_description}
 """
@@ -40,6 +40,7 @@ from browzee_agent.agent.views import (
 	AgentSettings,
 	AgentState,
 	AgentStepInfo,
+	ElementFormat,
 	StepMetadata,
 	ToolCallingMethod,
 )
@@ -152,6 +153,13 @@ class Agent(Generic[Context]):
 			'data-date-format',
 		],
 		max_actions_per_step: int = 10,
+		max_elements_tokens: int | None = None,
+		max_element_text_length: int | None = None,
+		compress_repeated_elements: bool = False,
+		max_ranked_elements: int | None = None,
+		element_format: ElementFormat = 'html',
+		delta_state_messages: bool = False,
+		delta_refresh_interval: int = 10,
 		tool_calling_method: ToolCallingMethod | None = 'auto',
 		page_extraction_llm: BaseChatModel | None = None,
 		planner_llm: BaseChatModel | None = None,
@@ -195,6 +203,13 @@ class Agent(Generic[Context]):
 			available_file_paths=available_file_paths,
 			include_attributes=include_attributes,
 			max_actions_per_step=max_actions_per_step,
+			max_elements_tokens=max_elements_tokens,
+			max_element_text_length=max_element_text_length,
+			compress_repeated_elements=compress_repeated_elements,
+			max_ranked_elements=max_ranked_elements,
+			element_format=element_format,
+			delta_state_messages=delta_state_messages,
+			delta_refresh_interval=delta_refresh_interval,
 			tool_calling_method=tool_calling_method,
 			page_extraction_llm=page_extraction_llm,
 			planner_llm=planner_llm,
@@ -267,6 +282,13 @@ class Agent(Generic[Context]):
 			settings=MessageManagerSettings(
 				max_input_tokens=self.settings.max_input_tokens,
 				include_attributes=self.settings.include_attributes,
+				max_elements_tokens=self.settings.max_elements_tokens,
+				max_element_text_length=self.settings.max_element_text_length,
+				compress_repeated_elements=self.settings.compress_repeated_elements,
+				max_ranked_elements=self.settings.max_ranked_elements,
+				element_format=self.settings.element_format,
+				delta_state_messages=self.settings.delta_state_messages,
+				delta_refresh_interval=self.settings.delta_refresh_interval,
 				message_context=self.settings.message_context,
 				sensitive_data=sensitive_data,
 				available_file_paths=self.settings.available_file_paths,
@@ -489,7 +511,14 @@ class Agent(Generic[Context]):
 					updated_context = f'Available actions: {all_actions}'
 				self._message_manager.settings.message_context = updated_context
 
-			self._message_manager.add_state_message(state, self.state.last_result, step_info, self.settings.use_vision)
+			thoughts = self.state.history.model_thoughts()
+			self._message_manager.add_state_message(
+				state,
+				self.state.last_result,
+				step_info,
+				self.settings.use_vision,
+				next_goal=thoughts[-1].next_goal if thoughts else None,
+			)
 			# Run planner at specified intervals if planner is configured
 			if self.settings.planner_llm and self.state.n_steps % self.settings.planner_interval == 0:
 				plan = await self._run_planner(user_responses)
@@ -988,7 +1017,8 @@ class Agent(Generic[Context]):
 		cached_selector_map = await self.browser_context.get_selector_map()
 		cached_path_hashes = (e.hash.branch_path_hash for e in cached_selector_map.values())
 
-		await self.browser_context.remove_highlights()
+		if not self.browser_context.uses_set_of_marks:
+			await self.browser_context.remove_highlights()
 
 		for i, action in enumerate(actions):
 			if action.get_index() is not None and i != 0:
@@ -1064,6 +1094,10 @@ class Agent(Generic[Context]):
 				state=state,
 				result=self.state.last_result,
 				include_attributes=self.settings.include_attributes,
+				max_elements_tokens=self.settings.max_elements_tokens,
+				max_element_text_length=self.settings.max_element_text_length,
+				compress_repeated_elements=self.settings.compress_repeated_elements,
+				element_format=self.settings.element_format,
 			)
 			msg = [SystemMessage(content=system_msg), content.get_user_message(self.settings.use_vision)]
 		else:
@@ -1202,7 +1236,14 @@ class Agent(Generic[Context]):
 		if not historical_element or not current_state.element_tree:
 			return action
 
-		current_element = HistoryTreeProcessor.find_history_element_in_tree(historical_element, current_state.element_tree)
+		current_element = HistoryTreeProcessor.find_history_element_in_tree(
+			historical_element, current_state.element_tree, current_state.lookup_index
+		)
+		if current_element is None:
+			# its attributes, text or position changed, match the most similar element instead
+			current_element = current_state.reidentification_index.find(historical_element)
+			if current_element is not None:
+				logger.debug(f'Matched changed element {historical_element.tag_name} {historical_element.xpath} by similarity')
 
 		if not current_element or current_element.highlight_index is None:
 			return None
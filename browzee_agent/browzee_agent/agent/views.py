@@ -25,6 +25,8 @@ from browzee_agent.dom.history_tree_processor.service import (
 from browzee_agent.dom.views import SelectorMap
 
 ToolCallingMethod = Literal['function_calling', 'json_mode', 'raw', 'auto', 'tools']
+# 'html': [index]<tag attributes>text /> lines, 'accessibility': [index] role "name" states lines
+ElementFormat = Literal['html', 'accessibility']
 REQUIRED_LLM_API_ENV_VARS = {
 	'ChatOpenAI': ['OPENAI_API_KEY'],
 	'AzureChatOpenAI': ['AZURE_OPENAI_ENDPOINT', 'AZURE_OPENAI_KEY'],
@@ -66,6 +68,13 @@ class AgentSettings(BaseModel):
 		'aria-expanded',
 	]
 	max_actions_per_step: int = 10
+	max_elements_tokens: int | None = None  # Token budget for the interactive elements of a state message
+	max_element_text_length: int | None = None  # Max characters of text shown per interactive element
+	compress_repeated_elements: bool = False  # Write runs of similar elements (grids, result lists) as a template and rows
+	max_ranked_elements: int | None = None  # Keep only the elements most relevant to the task and next goal, plus their context
+	element_format: ElementFormat = 'html'  # How the interactive elements are written in the state message
+	delta_state_messages: bool = False  # On the same page, only send the element changes since the last full list
+	delta_refresh_interval: int = 10  # Send the full element list again after this many delta messages
 
 	tool_calling_method: ToolCallingMethod | None = 'auto'
 	page_extraction_llm: BaseChatModel | None = None
@@ -12,7 +12,8 @@ import re
 import time
 import uuid
 from dataclasses import dataclass, field
-from typing import TYPE_CHECKING, Optional, TypedDict
+from typing import TYPE_CHECKING, Literal, Optional, TypedDict
+from weakref import WeakKeyDictionary
 import anyio
 import base64
 from selenium import webdriver
@@ -36,10 +37,16 @@ from browzee_agent.browser.views import (
 	TabInfo,
 	URLNotAllowedError,
 )
+from browzee_agent.browser.utils.page_readiness import PageReadinessTracker, ReadinessWait
+from browzee_agent.browser.utils.set_of_marks import draw_set_of_marks_async
+from browzee_agent.dom.extraction.service import get_dom_extraction_backend
+from browzee_agent.dom.extraction.views import DomBackendName
 from browzee_agent.dom.service import DomService
 from browzee_agent.dom.clickable_element_processor.service import ClickableElementProcessor
+from browzee_agent.dom.lookup_index.views import DOMLookupIndex
+from browzee_agent.dom.spatial_index.views import SpatialIndex
 
-from browzee_agent.dom.views import DOMElementNode, SelectorMap
+from browzee_agent.dom.views import DOMElementNode, SelectorMap, SerializedFragmentCache
 from browzee_agent.utils import time_execution_async, time_execution_sync
 
 if TYPE_CHECKING:
@@ -53,6 +60,26 @@ BROWSER_NAVBAR_HEIGHT = {
 	'darwin': 80,
 	'linux': 90,
 }.get(platform.system().lower(), 85)
+# Position of the viewport in the screenshots of take_screenshot, which capture the whole browser window
+SCREENSHOT_VIEWPORT_OFFSET = (0, BROWSER_NAVBAR_HEIGHT)
+
+REMOVE_HIGHLIGHTS_JS = """
+try {
+	// Remove the highlight container and all its contents
+	const container = document.getElementById('playwright-highlight-container');
+	if (container) {
+		container.remove();
+	}
+
+	// Remove highlight attributes from elements
+	const highlightedElements = document.querySelectorAll('[browser-user-highlight-id^="playwright-highlight-"]');
+	highlightedElements.forEach(el => {
+		el.removeAttribute('browser-user-highlight-id');
+	});
+} catch (e) {
+	console.error('Failed to remove highlights:', e);
+}
+"""
 import win32gui
 import win32ui
 import win32con
@@ -151,6 +178,42 @@ class BrowserContextConfig:
 
 	    include_dynamic_attributes: bool = True
 	        Include dynamic attributes in the CSS selector. If you want to reuse the css_selectors, it might be better to set this to False.
+
+	    incremental_dom_snapshots: False
+	        Keep a node registry in the page between steps and only transfer the nodes that changed since the last state. Unchanged pages skip the DOM walk entirely.
+
+	    dom_wire_format: 'json'
+	        Format in which the page returns the extracted DOM. 'columnar' sends interned tables and parallel arrays instead of one object per node, which is several times smaller on large pages.
+
+	    compact_dom_tree: False
+	        Store the DOM snapshot in parallel arrays and expose it through lightweight node views instead of one dataclass per node. Cuts the memory per snapshot on large pages. Ignored when incremental_dom_snapshots is enabled.
+
+	    dom_backend: 'js'
+	        How the DOM is extracted. 'js' injects buildDomTree.js, 'cdp' builds the tree from a CDP DOMSnapshot and the accessibility tree, which does not block the page's main thread (Chromium only, incremental_dom_snapshots does not apply).
+
+	    per_frame_dom_extraction: False
+	        Extract every frame concurrently with its own call, including cross-origin iframes that buildDomTree.js cannot enter from the main frame, and stitch the trees together. Replaces incremental_dom_snapshots, 'js' backend only.
+
+	    dom_tile_prefetch: False
+	        While the LLM decides on the next action, extract the DOM for one viewport below and above the current one in the background. The state after a scroll is then served from the matching tile, after a cheap check that the page did not change otherwise. 'js' backend only, ignored with per_frame_dom_extraction or viewport_expansion=-1.
+
+	    dom_max_nodes: None
+	        Stop the DOM extraction after visiting this many nodes. Nodes on screen and interactive candidates are visited first, and the state is marked as truncated. Bounds the extraction latency on huge pages, replaces incremental_dom_snapshots, 'js' backend only.
+
+	    dom_time_budget_ms: None
+	        Same as dom_max_nodes, with a time budget for the page-side walk in milliseconds.
+
+	    dom_chunk_slice_ms: None
+	        Walk the DOM in slices of this many milliseconds and yield the main thread to the page in between, so live pages keep their timers, animations and network callbacks running during the extraction. dom_time_budget_ms is then the deadline of the whole extraction. Replaces incremental_dom_snapshots, 'js' backend only.
+
+	    minimal_dom_extraction: False
+	        Only return the nodes the element list of the prompt needs from the page: the highlighted elements with their text, the text outside of them and their ancestors. The other wrappers and text nodes are dropped in the page instead of being transferred and built into the tree, and the tree is stored like compact_dom_tree. Replaces incremental_dom_snapshots, 'js' backend only.
+
+	    dom_fragment_cache_size: 2048
+	        Number of compressed runs of similar elements kept on the session, so the element list of the next steps reuses the ones that did not change. Only used with the compress_repeated_elements setting of the agent, the other lines are cheaper to write again than to look up. 0 disables the cache.
+
+	    set_of_marks_screenshot: False
+	        With highlight_elements, draw the index boxes and labels on the screenshot in Python instead of inserting overlays into the page. Saves the round trips to remove them and a relayout per step. Not used with per_frame_dom_extraction, disables dom_tile_prefetch.
 	"""
 	model_config = ConfigDict(
 		arbitrary_types_allowed=True,
@@ -183,6 +246,18 @@ class BrowserContextConfig:
 	viewport_expansion: int = 0
 	allowed_domains: list[str] | None = None
 	include_dynamic_attributes: bool = True
+	incremental_dom_snapshots: bool = False
+	dom_wire_format: Literal['json', 'columnar'] = 'json'
+	compact_dom_tree: bool = False
+	dom_backend: DomBackendName = 'js'
+	per_frame_dom_extraction: bool = False
+	dom_tile_prefetch: bool = False
+	dom_max_nodes: int | None = None
+	dom_time_budget_ms: int | None = None
+	dom_chunk_slice_ms: int | None = None
+	minimal_dom_extraction: bool = False
+	dom_fragment_cache_size: int = 2048
+	set_of_marks_screenshot: bool = False
 	http_credentials: dict[str, str] | None = None
 
 	keep_alive: bool = Field(default=False, alias='_force_keep_context_alive')  # used to be called _force_keep_context_alive
@@ -211,11 +286,39 @@ class CachedStateClickableElementsHashes:
 
 
 class BrowserSession:
-	def __init__(self, context: PlaywrightBrowserContext, cached_state: BrowserState | None = None):
+	def __init__(
+		self,
+		context: PlaywrightBrowserContext,
+		cached_state: BrowserState | None = None,
+		fragment_cache_size: int = 2048,
+	):
 		self.context = context
 		self.cached_state = cached_state
+		# serialized element subtrees reused by the state messages of the next steps
+		self.fragment_cache = SerializedFragmentCache(fragment_cache_size)
 
 		self.cached_state_clickable_elements_hashes: CachedStateClickableElementsHashes | None = None
+		# set after every action, the element boxes of the cached state may have moved since (see get_spatial_index)
+		self.boxes_stale = False
+
+		# one DomService per page, so incremental snapshots can reuse the previous tree
+		self.dom_services: WeakKeyDictionary[Page, DomService] = WeakKeyDictionary()
+		# request trackers attached for the lifetime of each page
+		self.readiness_trackers: WeakKeyDictionary[Page, PageReadinessTracker] = WeakKeyDictionary()
+
+	def get_dom_service(self, page: Page, backend: DomBackendName = 'js') -> DomService:
+		dom_service = self.dom_services.get(page)
+		if dom_service is None or dom_service.backend.name != backend:
+			dom_service = DomService(page, get_dom_extraction_backend(backend))
+			self.dom_services[page] = dom_service
+		return dom_service
+
+	def get_readiness_tracker(self, page: Page) -> PageReadinessTracker:
+		tracker = self.readiness_trackers.get(page)
+		if tracker is None:
+			tracker = PageReadinessTracker(page)
+			self.readiness_trackers[page] = tracker
+		return tracker
 
 
 
@@ -330,7 +433,12 @@ class BrowserContext:
 		self.session = BrowserSession(
 			context=context,
 			cached_state=None,
+			fragment_cache_size=self.config.dom_fragment_cache_size,
 		)
+		# track the requests of every page from its start, see _wait_for_stable_network
+		for page in pages:
+			self.session.get_readiness_tracker(page)
+		context.on('page', self.session.get_readiness_tracker)
 
 		current_page = None
 		if self.browser.config.cdp_url:
@@ -747,175 +855,18 @@ class BrowserContext:
 		except Exception as e:
 			logger.debug(f'Failed to set viewport size for page: {e}')
 
-	async def _wait_for_stable_network(self):
+	async def _wait_for_stable_network(self, min_wait: float = 0) -> ReadinessWait:
+		"""Wait until the relevant requests of the page settled, see PageReadinessTracker"""
 		page = await self.get_agent_current_page()
-
-		pending_requests = set()
-		last_activity = asyncio.get_event_loop().time()
-
-		# Define relevant resource types and content types
-		RELEVANT_RESOURCE_TYPES = {
-			'document',
-			'stylesheet',
-			'image',
-			'font',
-			'script',
-			'iframe',
-		}
-
-		RELEVANT_CONTENT_TYPES = {
-			'text/html',
-			'text/css',
-			'application/javascript',
-			'image/',
-			'font/',
-			'application/json',
-		}
-
-		# Additional patterns to filter out
-		IGNORED_URL_PATTERNS = {
-			# Analytics and tracking
-			'analytics',
-			'tracking',
-			'telemetry',
-			'beacon',
-			'metrics',
-			# Ad-related
-			'doubleclick',
-			'adsystem',
-			'adserver',
-			'advertising',
-			# Social media widgets
-			'facebook.com/plugins',
-			'platform.twitter',
-			'linkedin.com/embed',
-			# Live chat and support
-			'livechat',
-			'zendesk',
-			'intercom',
-			'crisp.chat',
-			'hotjar',
-			# Push notifications
-			'push-notifications',
-			'onesignal',
-			'pushwoosh',
-			# Background sync/heartbeat
-			'heartbeat',
-			'ping',
-			'alive',
-			# WebRTC and streaming
-			'webrtc',
-			'rtmp://',
-			'wss://',
-			# Common CDNs for dynamic content
-			'cloudfront.net',
-			'fastly.net',
-		}
-		
-
-		async def on_request(request):
-			# Filter by resource type
-			if request.resource_type not in RELEVANT_RESOURCE_TYPES:
-				return
-
-			# Filter out streaming, websocket, and other real-time requests
-			if request.resource_type in {
-				'websocket',
-				'media',
-				'eventsource',
-				'manifest',
-				'other',
-			}:
-				return
-
-			# Filter out by URL patterns
-			url = request.url.lower()
-			if any(pattern in url for pattern in IGNORED_URL_PATTERNS):
-				return
-
-			# Filter out data URLs and blob URLs
-			if url.startswith(('data:', 'blob:')):
-				return
-
-			# Filter out requests with certain headers
-			headers = request.headers
-			if headers.get('purpose') == 'prefetch' or headers.get('sec-fetch-dest') in [
-				'video',
-				'audio',
-			]:
-				return
-
-			nonlocal last_activity
-			pending_requests.add(request)
-			last_activity = asyncio.get_event_loop().time()
-			# logger.debug(f'Request started: {request.url} ({request.resource_type})')
-
-		async def on_response(response):
-			request = response.request
-			if request not in pending_requests:
-				return
-
-			# Filter by content type if available
-			content_type = response.headers.get('content-type', '').lower()
-
-			# Skip if content type indicates streaming or real-time data
-			if any(
-				t in content_type
-				for t in [
-					'streaming',
-					'video',
-					'audio',
-					'webm',
-					'mp4',
-					'event-stream',
-					'websocket',
-					'protobuf',
-				]
-			):
-				pending_requests.remove(request)
-				return
-
-			# Only process relevant content types
-			if not any(ct in content_type for ct in RELEVANT_CONTENT_TYPES):
-				pending_requests.remove(request)
-				return
-
-			# Skip if response is too large (likely not essential for page load)
-			content_length = response.headers.get('content-length')
-			if content_length and int(content_length) > 5 * 1024 * 1024:  # 5MB
-				pending_requests.remove(request)
-				return
-
-			nonlocal last_activity
-			pending_requests.remove(request)
-			last_activity = asyncio.get_event_loop().time()
-			# logger.debug(f'Request resolved: {request.url} ({content_type})')
-
-		# Attach event listeners
-		page.on('request', on_request)
-		page.on('response', on_response)
-
-		try:
-			# Wait for idle time
-			start_time = asyncio.get_event_loop().time()
-			while True:
-				await asyncio.sleep(0.1)
-				now = asyncio.get_event_loop().time()
-				if len(pending_requests) == 0 and (now - last_activity) >= self.config.wait_for_network_idle_page_load_time:
-					break
-				if now - start_time > self.config.maximum_wait_page_load_time:
-					logger.debug(
-						f'Network timeout after {self.config.maximum_wait_page_load_time}s with {len(pending_requests)} '
-						f'pending requests: {[r.url for r in pending_requests]}'
-					)
-					break
-
-		finally:
-			# Clean up event listeners
-			page.remove_listener('request', on_request)
-			page.remove_listener('response', on_response)
-
-		logger.debug(f'Network stabilized for {self.config.wait_for_network_idle_page_load_time} seconds')
+		session = await self.get_session()
+		wait = await session.get_readiness_tracker(page).wait_until_settled(
+			idle_time=self.config.wait_for_network_idle_page_load_time,
+			timeout=self.config.maximum_wait_page_load_time,
+			min_wait=min_wait,
+		)
+		if not wait.timed_out:
+			logger.debug(f'Network stabilized after {wait.waited:.2f}s and {wait.requests} requests')
+		return wait
 
 	async def _wait_for_page_and_frames_load(self, timeout_overwrite: float | None = None):
 		"""
@@ -925,10 +876,11 @@ class BrowserContext:
 		"""
 		# Start timing
 		start_time = time.time()
+		min_wait = timeout_overwrite or self.config.minimum_wait_page_load_time
 
-		# Wait for page load
+		# Wait for page load, the minimum wait is part of the same wait
 		try:
-			await self._wait_for_stable_network()
+			await self._wait_for_stable_network(min_wait)
 
 			# Check if the loaded URL is allowed
 			page = await self.get_current_page()
@@ -939,10 +891,9 @@ class BrowserContext:
 			logger.warning('Page load failed, continuing...')
 			pass
 
-		# Calculate remaining time to meet minimum WAIT_TIME
+		# Calculate remaining time to meet minimum WAIT_TIME, only left when the wait above failed
 		elapsed = time.time() - start_time
-		remaining = max((timeout_overwrite or self.config.minimum_wait_page_load_time) - elapsed, 0)
-		print("remaining", remaining)
+		remaining = max(min_wait - elapsed, 0)
 		logger.debug(f'--Page loaded in {elapsed:.2f} seconds, waiting for additional {remaining:.2f} seconds')
 
 		# Sleep remaining time if needed
@@ -1145,6 +1096,7 @@ class BrowserContext:
 			)
 
 		session.cached_state = updated_state
+		session.boxes_stale = False
 
 		# Save cookies if a file is specified
 		if self.config.cookies_file:
@@ -1173,12 +1125,35 @@ class BrowserContext:
 				raise BrowserError('Browser closed: no valid pages available')
 
 		try:
-			dom_service = DomService(page)
-			content = await dom_service.get_clickable_elements(
-				focus_element=focus_element,
-				viewport_expansion=self.config.viewport_expansion,
-				highlight_elements=self.config.highlight_elements,
+			dom_service = session.get_dom_service(page, self.config.dom_backend)
+			tile_prefetch = (
+				self.config.dom_tile_prefetch
+				and self.config.dom_backend == 'js'
+				and not self.config.per_frame_dom_extraction
+				and self.config.viewport_expansion != -1
+				and not self.uses_set_of_marks
 			)
+			content = None
+			if tile_prefetch:
+				content = await dom_service.take_prefetched_state(self.config.highlight_elements, focus_element)
+			if content is None:
+				content = await dom_service.get_clickable_elements(
+					focus_element=focus_element,
+					viewport_expansion=self.config.viewport_expansion,
+					# with set-of-marks the elements are highlighted the same way, only drawn on the screenshot
+					highlight_elements=self.config.highlight_elements,
+					draw_highlights=not self.uses_set_of_marks,
+					incremental=self.config.incremental_dom_snapshots,
+					wire_format=self.config.dom_wire_format,
+					compact=self.config.compact_dom_tree,
+					per_frame=self.config.per_frame_dom_extraction,
+					max_nodes=self.config.dom_max_nodes,
+					time_budget_ms=self.config.dom_time_budget_ms,
+					# also backs the spatial index of the state, see get_spatial_index
+					collect_marks=True,
+					chunk_slice_ms=self.config.dom_chunk_slice_ms,
+					minimal=self.config.minimal_dom_extraction,
+				)
 
 			tabs_info = await self.get_tabs_info()
 
@@ -1202,7 +1177,12 @@ class BrowserContext:
 			# 		)
 			# 	)
 
-			screenshot_b64 = await self.take_screenshot()
+			if self.uses_set_of_marks:
+				screenshot_b64 = await self.take_screenshot(clear_highlights=False)
+				if content.marks is not None:
+					screenshot_b64 = await draw_set_of_marks_async(screenshot_b64, content.marks, SCREENSHOT_VIEWPORT_OFFSET)
+			else:
+				screenshot_b64 = await self.take_screenshot()
 			pixels_above, pixels_below = await self.get_scroll_info(page)
 			# Find the agent's active tab ID
 			agent_current_page_id = 0
@@ -1221,8 +1201,16 @@ class BrowserContext:
 				screenshot=screenshot_b64,
 				pixels_above=pixels_above,
 				pixels_below=pixels_below,
+				truncated=content.truncated,
+				marks=content.marks,
+				fragment_cache=session.fragment_cache if self.config.dom_fragment_cache_size > 0 else None,
 			)
-			await self.remove_highlights()
+			if not self.uses_set_of_marks:
+				await self.remove_highlights()
+			if tile_prefetch:
+				dom_service.schedule_tile_prefetch(
+					self.config.highlight_elements, self.config.viewport_expansion, self.config.compact_dom_tree
+				)
 			return self.current_state
 		except Exception as e:
 			logger.error(f'❌  Failed to update state: {str(e)}')
@@ -1232,7 +1220,7 @@ class BrowserContext:
 			raise
 
 	@time_execution_async('--take_screenshot')
-	async def take_screenshot(self, full_page: bool = False) -> str:
+	async def take_screenshot(self, full_page: bool = False, clear_highlights: bool = True) -> str:
 		"""
 		Returns a base64 encoded screenshot of the current page.
 		"""
@@ -1250,10 +1238,20 @@ class BrowserContext:
 		title = await page.title()
 		hwnd = win32gui.FindWindow(None, title)
 		screenshot_b64 = background_screenshot(hwnd, 1280, 780)
-		await self.remove_highlights()
+		if clear_highlights:
+			await self.remove_highlights()
 
 		return screenshot_b64
 
+	@property
+	def uses_set_of_marks(self) -> bool:
+		"""Highlights are drawn on the screenshot instead of into the page, so there is nothing to remove"""
+		return (
+			self.config.highlight_elements
+			and self.config.set_of_marks_screenshot
+			and not self.config.per_frame_dom_extraction
+		)
+
 	@time_execution_async('--remove_highlights')
 	async def remove_highlights(self):
 		"""
@@ -1262,24 +1260,10 @@ class BrowserContext:
 		"""
 		try:
 			page = await self.get_agent_current_page()
-			await page.evaluate(
-				"""
-                try {
-                    // Remove the highlight container and all its contents
-                    const container = document.getElementById('playwright-highlight-container');
-                    if (container) {
-                        container.remove();
-                    }
-
-                    // Remove highlight attributes from elements
-                    const highlightedElements = document.querySelectorAll('[browser-user-highlight-id^="playwright-highlight-"]');
-                    highlightedElements.forEach(el => {
-                        el.removeAttribute('browser-user-highlight-id');
-                    });
-                } catch (e) {
-                    console.error('Failed to remove highlights:', e);
-                }
-                """
+			# overlays of per-frame extractions are drawn inside each frame
+			await asyncio.gather(
+				*(frame.evaluate(REMOVE_HIGHLIGHTS_JS) for frame in page.frames if not frame.is_detached()),
+				return_exceptions=True,
 			)
 		except Exception as e:
 			logger.debug(f'Failed to remove highlights (this is usually ok): {str(e)}')
@@ -1460,6 +1444,13 @@ class BrowserContext:
 	@time_execution_async('--get_locate_element')
 	async def get_locate_element(self, element: DOMElementNode) -> ElementHandle | None:
 		current_frame = await self.get_agent_current_page()
+		dom_service = self.session.dom_services.get(current_frame) if self.session else None
+
+		# One call through the elements the extraction kept by highlight index, the selectors below are the fallback
+		if dom_service is not None:
+			element_handle = await dom_service.get_element_handle(element)
+			if element_handle is not None:
+				return element_handle
 
 		# Start with the target element and collect all parents
 		parents: list[DOMElementNode] = []
@@ -1474,6 +1465,18 @@ class BrowserContext:
 
 		# Process all iframe parents in sequence
 		iframes = [item for item in parents if item.tag_name == 'iframe']
+
+		# Frames extracted on their own can be queried directly, without the frame_locator chain
+		for position in reversed(range(len(iframes))):
+			frame_id = iframes[position].frame_id
+			if frame_id is None or dom_service is None:
+				continue
+			frame = dom_service.frames.get(frame_id)
+			if frame is not None and not frame.is_detached():
+				current_frame = frame
+				iframes = iframes[position + 1 :]
+			break
+
 		for parent in iframes:
 			css_selector = self._enhanced_css_selector_for_element(
 				parent,
@@ -1776,6 +1779,28 @@ class BrowserContext:
 			return {}
 		return session.cached_state.selector_map
 
+	async def get_lookup_index(self) -> DOMLookupIndex | None:
+		"""Secondary indexes of the cached state, see DOMState.lookup_index"""
+		session = await self.get_session()
+		if session.cached_state is None:
+			return None
+		return session.cached_state.lookup_index
+
+	async def get_spatial_index(self) -> SpatialIndex | None:
+		"""
+		Boxes of the highlighted elements of the cached state, see DOMState.spatial_index. None once an
+		action ran since the state was taken: a click, a scroll or typing can move every box.
+		"""
+		session = await self.get_session()
+		if session.cached_state is None or session.boxes_stale:
+			return None
+		return session.cached_state.spatial_index
+
+	def invalidate_spatial_index(self) -> None:
+		"""Marks the element boxes of the cached state as stale until the next state"""
+		if self.session is not None:
+			self.session.boxes_stale = True
+
 	async def get_element_by_index(self, index: int) -> ElementHandle | None:
 		selector_map = await self.get_selector_map()
 		element_handle = await self.get_locate_element(selector_map[index])
@@ -1813,6 +1838,11 @@ class BrowserContext:
 		if not isinstance(element_node, DOMElementNode):
 			return False
 
+		# Elements of the cached state are answered by its index, without walking the subtree
+		lookup_index = await self.get_lookup_index()
+		if lookup_index is not None and element_node in lookup_index:
+			return lookup_index.is_file_uploader(element_node, max_depth - current_depth)
+
 		# Check for file input attributes
 		if element_node.tag_name == 'input':
 			is_uploader = element_node.attributes.get('type') == 'file' or element_node.attributes.get('accept') is not None
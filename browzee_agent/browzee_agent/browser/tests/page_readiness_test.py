@@ -0,0 +1,67 @@
+import asyncio
+
+from browzee_agent.browser.utils.page_readiness import PageReadinessTracker
+
+
+class FakePage:
+	url = 'https://example.com/'
+
+	def __init__(self):
+		self.listeners = {}
+
+	def on(self, event, listener):
+		self.listeners[event] = listener
+
+	def emit(self, event, value):
+		self.listeners[event](value)
+
+
+class FakeRequest:
+	def __init__(self, url, resource_type='script'):
+		self.url = url
+		self.resource_type = resource_type
+		self.headers = {}
+
+
+class FakeResponse:
+	def __init__(self, request, content_type='application/javascript'):
+		self.request = request
+		self.headers = {'content-type': content_type}
+
+
+def test_settles_once_idle_after_the_last_request():
+	async def scenario():
+		page = FakePage()
+		tracker = PageReadinessTracker(page)
+		loop = asyncio.get_running_loop()
+
+		script = FakeRequest('https://example.com/app.js')
+		page.emit('request', script)
+		# polling and analytics requests do not count
+		page.emit('request', FakeRequest('https://example.com/api/poll', resource_type='xhr'))
+		page.emit('request', FakeRequest('https://example.com/analytics.js'))
+		loop.call_later(0.05, page.emit, 'response', FakeResponse(script))
+
+		start = loop.time()
+		wait = await tracker.wait_until_settled(idle_time=0.05, timeout=1)
+		# 0.05s until the response and 0.05s of idle time after it, no polling granularity on top
+		assert 0.09 <= loop.time() - start < 0.2
+		assert not wait.timed_out
+		assert (wait.requests, wait.pending) == (0, 0)
+
+		# a failed request ends like a response, one that never ends hits the timeout
+		failed, hung = FakeRequest('https://example.com/a.css', 'stylesheet'), FakeRequest('https://example.com/b.png', 'image')
+		page.emit('request', failed)
+		page.emit('request', hung)
+		loop.call_later(0.01, page.emit, 'requestfailed', failed)
+		wait = await tracker.wait_until_settled(idle_time=0.05, timeout=0.1)
+		assert wait.timed_out
+		assert wait.pending == 1
+		assert list(tracker.waits) == [tracker.waits[0], wait]
+
+		# it outlived a whole wait, the next one does not wait for it again
+		wait = await tracker.wait_until_settled(idle_time=0.01, timeout=0.05, min_wait=0.03)
+		assert not wait.timed_out
+		assert 0.03 <= wait.waited < 0.05
+
+	asyncio.run(scenario())
@@ -0,0 +1,40 @@
+import base64
+from io import BytesIO
+
+from PIL import Image
+
+from browzee_agent.browser.utils.set_of_marks import draw_set_of_marks
+from browzee_agent.dom.views import HighlightMarks
+
+
+def blank_screenshot(width=400, height=300) -> str:
+	buffer = BytesIO()
+	Image.new('RGB', (width, height), 'white').save(buffer, format='PNG')
+	return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+def decode(screenshot_b64: str) -> Image.Image:
+	return Image.open(BytesIO(base64.b64decode(screenshot_b64))).convert('RGB')
+
+
+def test_boxes_are_drawn_scaled_and_offset():
+	# index 3 is orange, index 4 purple
+	marks = HighlightMarks(boxes=[[3, 10, 20, 100, 40], [4, 200, 150, 5, 5]], device_pixel_ratio=1.5)
+	image = decode(draw_set_of_marks(blank_screenshot(), marks, offset=(0, 30)))
+
+	# box 3 spans x 15..165 and y 60..120 in screenshot pixels
+	assert image.getpixel((15, 90)) == (255, 165, 0)
+	assert image.getpixel((16, 90)) == (255, 165, 0)
+	# tinted inside, away from the label in the top right corner
+	assert image.getpixel((40, 110)) == (255, 246, 229)
+	assert image.getpixel((14, 90)) == (255, 255, 255)
+	assert image.getpixel((100, 40)) == (255, 255, 255)
+
+	# the label of a box too small for it goes above the box, which spans y 255..263
+	label = {image.getpixel((x, y)) for x in range(280, 310) for y in range(225, 254)}
+	assert (128, 0, 128) in label and (255, 255, 255) in label
+
+
+def test_no_marks_returns_the_screenshot_unchanged():
+	screenshot = blank_screenshot()
+	assert draw_set_of_marks(screenshot, HighlightMarks(boxes=[])) is screenshot
@@ -0,0 +1,29 @@
+import asyncio
+
+from browzee_agent.browser.context import BrowserContext, BrowserContextConfig, BrowserSession
+from browzee_agent.browser.views import BrowserState
+from browzee_agent.dom.views import DOMElementNode, HighlightMarks
+
+
+def test_spatial_index_is_dropped_after_an_action():
+	button = DOMElementNode(
+		tag_name='button', xpath='html/body/button', attributes={}, children=[], is_visible=True, parent=None, highlight_index=0
+	)
+	root = DOMElementNode(tag_name='body', xpath='html/body', attributes={}, children=[button], is_visible=True, parent=None)
+	state = BrowserState(
+		element_tree=root,
+		selector_map={0: button},
+		url='https://example.com/',
+		title='Example',
+		tabs=[],
+		marks=HighlightMarks(boxes=[[0, 10, 20, 100, 40]]),
+	)
+	browser_context = BrowserContext(browser=None, config=BrowserContextConfig())  # type: ignore
+	browser_context.session = BrowserSession(context=None, cached_state=state)  # type: ignore
+
+	spatial_index = asyncio.run(browser_context.get_spatial_index())
+	assert spatial_index is not None and spatial_index.center_of(0) == (60, 40)
+
+	# e.g. a click or a scroll of the controller, the boxes may have moved
+	browser_context.invalidate_spatial_index()
+	assert asyncio.run(browser_context.get_spatial_index()) is None
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+	from patchright.async_api import Page, Request, Response
+
+logger = logging.getLogger(__name__)
+
+# Requests a page needs to render, the others (xhr polling, media, beacons) do not delay a step
+RELEVANT_RESOURCE_TYPES = {
+	'document',
+	'stylesheet',
+	'image',
+	'font',
+	'script',
+	'iframe',
+}
+
+RELEVANT_CONTENT_TYPES = {
+	'text/html',
+	'text/css',
+	'application/javascript',
+	'image/',
+	'font/',
+	'application/json',
+}
+
+STREAMING_CONTENT_TYPES = {
+	'streaming',
+	'video',
+	'audio',
+	'webm',
+	'mp4',
+	'event-stream',
+	'websocket',
+	'protobuf',
+}
+
+IGNORED_URL_PATTERNS = {
+	# Analytics and tracking
+	'analytics',
+	'tracking',
+	'telemetry',
+	'beacon',
+	'metrics',
+	# Ad-related
+	'doubleclick',
+	'adsystem',
+	'adserver',
+	'advertising',
+	# Social media widgets
+	'facebook.com/plugins',
+	'platform.twitter',
+	'linkedin.com/embed',
+	# Live chat and support
+	'livechat',
+	'zendesk',
+	'intercom',
+	'crisp.chat',
+	'hotjar',
+	# Push notifications
+	'push-notifications',
+	'onesignal',
+	'pushwoosh',
+	# Background sync/heartbeat
+	'heartbeat',
+	'ping',
+	'alive',
+	# WebRTC and streaming
+	'webrtc',
+	'rtmp://',
+	'wss://',
+	# Common CDNs for dynamic content
+	'cloudfront.net',
+	'fastly.net',
+}
+
+# Responses above this size are not essential for the page load
+MAX_RELEVANT_CONTENT_LENGTH = 5 * 1024 * 1024
+
+
+def is_relevant_request(request: 'Request') -> bool:
+	if request.resource_type not in RELEVANT_RESOURCE_TYPES:
+		return False
+
+	url = request.url.lower()
+	if any(pattern in url for pattern in IGNORED_URL_PATTERNS) or url.startswith(('data:', 'blob:')):
+		return False
+
+	headers = request.headers
+	return headers.get('purpose') != 'prefetch' and headers.get('sec-fetch-dest') not in ('video', 'audio')
+
+
+def is_relevant_response(response: 'Response') -> bool:
+	content_type = response.headers.get('content-type', '').lower()
+	if any(streaming in content_type for streaming in STREAMING_CONTENT_TYPES):
+		return False
+	if not any(relevant in content_type for relevant in RELEVANT_CONTENT_TYPES):
+		return False
+	content_length = response.headers.get('content-length')
+	return not (content_length and content_length.isdigit() and int(content_length) > MAX_RELEVANT_CONTENT_LENGTH)
+
+
+@dataclass
+class ReadinessWait:
+	"""One wait of `PageReadinessTracker.wait_until_settled`"""
+
+	url: str
+	# seconds until the page settled or the timeout hit
+	waited: float
+	timed_out: bool
+	# relevant requests started during the wait, and the ones still in flight at its end
+	requests: int
+	pending: int
+
+
+class PageReadinessTracker:
+	"""
+	Tracks the relevant requests in flight of one page for its whole lifetime, so a step only has to
+	wait on `wait_until_settled` instead of attaching listeners and polling.
+
+	The page is settled once no relevant request is in flight and none started or finished for the idle
+	time. Waiters sleep until that moment or the next request event, whichever comes first.
+	"""
+
+	def __init__(self, page: 'Page', history_size: int = 100):
+		self.page = page
+		# relevant requests in flight -> loop time they started at
+		self.pending: dict['Request', float] = {}
+		self.last_activity = 0.0
+		self.requests_seen = 0
+		self.waits: deque[ReadinessWait] = deque(maxlen=history_size)
+		self._changed = asyncio.Event()
+
+		page.on('request', self._on_request)
+		page.on('response', self._on_response)
+		page.on('requestfailed', self._on_request_failed)
+
+	def _now(self) -> float:
+		return asyncio.get_running_loop().time()
+
+	def _on_request(self, request: 'Request') -> None:
+		if not is_relevant_request(request):
+			return
+		self.last_activity = self._now()
+		self.pending[request] = self.last_activity
+		self.requests_seen += 1
+		self._changed.set()
+
+	def _on_response(self, response: 'Response') -> None:
+		if self.pending.pop(response.request, None) is None:
+			return
+		# streaming or irrelevant content ends the request without counting as activity
+		if is_relevant_response(response):
+			self.last_activity = self._now()
+		self._changed.set()
+
+	def _on_request_failed(self, request: 'Request') -> None:
+		if self.pending.pop(request, None) is not None:
+			self._changed.set()
+
+	async def wait_until_settled(self, idle_time: float, timeout: float, min_wait: float = 0) -> ReadinessWait:
+		"""
+		Wait until no relevant request was in flight for `idle_time` seconds since the call, and at least
+		`min_wait` seconds, or until `timeout` seconds passed.
+		"""
+		start = self._now()
+		deadline = start + timeout
+		requests_before = self.requests_seen
+		# requests that already outlived a whole wait (hung, long-polling) would only make every wait time out
+		for request, started in list(self.pending.items()):
+			if start - started > timeout:
+				del self.pending[request]
+
+		while True:
+			now = self._now()
+			if not self.pending:
+				settled_at = max(max(self.last_activity, start) + idle_time, start + min_wait)
+				if now >= settled_at:
+					timed_out = False
+					break
+				wake_at = min(settled_at, deadline)
+			else:
+				wake_at = deadline
+			if now >= deadline:
+				timed_out = True
+				break
+
+			self._changed.clear()
+			try:
+				await asyncio.wait_for(self._changed.wait(), wake_at - now)
+			except asyncio.TimeoutError:
+				pass
+
+		wait = ReadinessWait(
+			url=self.page.url,
+			waited=self._now() - start,
+			timed_out=timed_out,
+			requests=self.requests_seen - requests_before,
+			pending=len(self.pending),
+		)
+		self.waits.append(wait)
+		if timed_out:
+			logger.debug(
+				f'Network timeout after {timeout}s with {len(self.pending)} pending requests: {[r.url for r in self.pending]}'
+			)
+		return wait
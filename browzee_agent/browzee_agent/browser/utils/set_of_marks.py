@@ -0,0 +1,101 @@
+import asyncio
+import base64
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from browzee_agent.dom.extraction.views import HIGHLIGHT_COLORS
+from browzee_agent.dom.views import HighlightMarks
+
+# Same look as highlightElement in buildDomTree.js: 2px border, 10% tint, label in the top right corner
+BORDER_WIDTH = 2
+TINT_OPACITY = 0.1
+LABEL_PADDING = (4, 1)
+
+_PALETTE = np.array([[int(color[i : i + 2], 16) for i in (1, 3, 5)] for color in HIGHLIGHT_COLORS], dtype=np.float32)
+
+
+def draw_set_of_marks(screenshot_b64: str, marks: HighlightMarks, offset: tuple[int, int] = (0, 0)) -> str:
+	"""
+	Draw the highlight boxes and index labels on a base64 PNG screenshot.
+
+	Boxes are in CSS pixels of the viewport, they are scaled by the device pixel ratio and shifted by
+	`offset`, the position of the viewport in the screenshot (e.g. below the browser toolbar).
+	"""
+	if not marks.boxes:
+		return screenshot_b64
+
+	image = Image.open(BytesIO(base64.b64decode(screenshot_b64))).convert('RGB')
+	pixels = np.asarray(image, dtype=np.float32).copy()
+	height, width = pixels.shape[:2]
+
+	boxes = np.asarray(marks.boxes, dtype=np.float64).reshape(-1, 5)
+	indices = boxes[:, 0].astype(np.int64)
+	scale = marks.device_pixel_ratio
+	left = np.clip(np.floor(boxes[:, 1] * scale + offset[0]), 0, width).astype(np.int64)
+	top = np.clip(np.floor(boxes[:, 2] * scale + offset[1]), 0, height).astype(np.int64)
+	right = np.clip(np.ceil((boxes[:, 1] + boxes[:, 3]) * scale + offset[0]), 0, width).astype(np.int64)
+	bottom = np.clip(np.ceil((boxes[:, 2] + boxes[:, 4]) * scale + offset[1]), 0, height).astype(np.int64)
+	colors = _PALETTE[indices % len(_PALETTE)]
+	visible = (right > left) & (bottom > top)
+
+	border = max(1, round(BORDER_WIDTH * scale))
+	for x0, y0, x1, y1, color in zip(left[visible], top[visible], right[visible], bottom[visible], colors[visible]):
+		box = pixels[y0:y1, x0:x1]
+		box *= 1 - TINT_OPACITY
+		box += color * TINT_OPACITY
+		box[:border] = color
+		box[-border:] = color
+		box[:, :border] = color
+		box[:, -border:] = color
+
+	image = Image.fromarray(pixels.astype(np.uint8))
+	_draw_labels(image, indices[visible], left[visible], top[visible], right[visible], bottom[visible], scale)
+
+	buffer = BytesIO()
+	image.save(buffer, format='PNG')
+	return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+def _draw_labels(
+	image: Image.Image,
+	indices: np.ndarray,
+	left: np.ndarray,
+	top: np.ndarray,
+	right: np.ndarray,
+	bottom: np.ndarray,
+	scale: float,
+) -> None:
+	draw = ImageDraw.Draw(image)
+	try:
+		font = ImageFont.load_default(size=round(12 * scale))
+	except TypeError:
+		# Pillow < 10.1 only has the fixed size bitmap font
+		font = ImageFont.load_default()
+	padding_x, padding_y = (round(padding * scale) for padding in LABEL_PADDING)
+
+	for index, x0, y0, x1, y1 in zip(indices.tolist(), left.tolist(), top.tolist(), right.tolist(), bottom.tolist()):
+		text = str(index)
+		text_left, text_top, text_right, text_bottom = draw.textbbox((0, 0), text, font=font)
+		label_width = text_right - text_left + 2 * padding_x
+		label_height = text_bottom - text_top + 2 * padding_y
+
+		# inside the top right corner, or above the box when it is too small
+		label_left, label_top = x1 - label_width - 2, y0 + 2
+		if x1 - x0 < label_width + 4 or y1 - y0 < label_height + 4:
+			label_left, label_top = x1 - label_width, y0 - label_height - 2
+		label_left = max(0, min(label_left, image.width - label_width))
+		label_top = max(0, min(label_top, image.height - label_height))
+
+		draw.rounded_rectangle(
+			(label_left, label_top, label_left + label_width, label_top + label_height),
+			radius=round(4 * scale),
+			fill=HIGHLIGHT_COLORS[index % len(HIGHLIGHT_COLORS)],
+		)
+		draw.text((label_left + padding_x - text_left, label_top + padding_y - text_top), text, font=font, fill='white')
+
+
+async def draw_set_of_marks_async(screenshot_b64: str, marks: HighlightMarks, offset: tuple[int, int] = (0, 0)) -> str:
+	"""`draw_set_of_marks` in a worker thread, decoding and encoding the PNG would block the event loop"""
+	return await asyncio.to_thread(draw_set_of_marks, screenshot_b64, marks, offset)
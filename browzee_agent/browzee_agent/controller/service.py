@@ -1,12 +1,13 @@
 import asyncio
 import json
 import logging
-from typing import Dict, Generic, Optional, Type, TypeVar
+from typing import Dict, Generic, Optional, Type, TypeVar, cast
 
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.prompts import PromptTemplate
 
 # from lmnr.sdk.laminar import Laminar
+from playwright.async_api import ElementHandle, Page
 from pydantic import BaseModel
 
 from browzee_agent.agent.views import ActionModel, ActionResult
@@ -27,6 +28,7 @@ from browzee_agent.controller.views import (
 	SendKeysAction,
 	SwitchTabAction,
 )
+from browzee_agent.dom.spatial_index.views import SpatialIndex
 from browzee_agent.utils import time_execution_sync
 from browzee_agent.app_services import send_to_websockets
 
@@ -330,26 +332,27 @@ class Controller(Generic[Context]):
 		async def scroll_to_text(text: str, browser: BrowserContext):  # type: ignore
 			page = await browser.get_current_page()
 			try:
-				# Try different locator strategies
-				locators = [
-					page.get_by_text(text, exact=False),
-					page.locator(f'text={text}'),
-					page.locator(f"//*[contains(text(), '{text}')]"),
-				]
-
-				for locator in locators:
-					try:
-						# First check if element exists and is visible
-						if await locator.count() > 0 and await locator.first.is_visible():
-							await locator.first.scroll_into_view_if_needed()
-							await asyncio.sleep(0.5)  # Wait for scroll to complete
-							msg = f'🔍  Scrolled to text: {text}'
-							logger.info(msg)
-							await send_to_websockets("Scrolled to text")
-							return ActionResult(extracted_content=msg, include_in_memory=True)
-					except Exception as e:
-						logger.debug(f'Locator attempt failed: {str(e)}')
-						continue
+				# Text of the last snapshot is found in its index and the element is located directly
+				lookup_index = await browser.get_lookup_index()
+				candidates = [node for node in lookup_index.find_by_text(text) if node.is_visible] if lookup_index else []
+				element_handle = await browser.get_locate_element(candidates[0]) if candidates else None
+				if element_handle is not None:
+					await element_handle.scroll_into_view_if_needed()
+					found = True
+				else:
+					# not in the snapshot (e.g. outside of the extracted viewport), a single text locator
+					# get_by_text already covers the case insensitive substring matches of `text=` and xpath contains()
+					locator = page.get_by_text(text, exact=False).first
+					found = await locator.count() > 0 and await locator.is_visible()
+					if found:
+						await locator.scroll_into_view_if_needed()
+
+				if found:
+					await asyncio.sleep(0.5)  # Wait for scroll to complete
+					msg = f'🔍  Scrolled to text: {text}'
+					logger.info(msg)
+					await send_to_websockets("Scrolled to text")
+					return ActionResult(extracted_content=msg, include_in_memory=True)
 
 				msg = f"Text '{text}' not found or not visible on page"
 				logger.info(msg)
@@ -610,6 +613,33 @@ class Controller(Generic[Context]):
 
 				return source_coords, target_coords
 
+			async def get_index_coordinates(
+				index: int, offset: Position | None, spatial_index: SpatialIndex | None
+			) -> tuple[int, int] | None:
+				"""
+				Coordinates of an indexed element from the boxes of the current state. The page is only asked
+				when the box is missing or an earlier action of the step made the boxes stale.
+				"""
+				box = spatial_index.box_of(index) if spatial_index else None
+				if box is None:
+					if index not in await browser.get_selector_map():
+						return None
+					element = await browser.get_element_by_index(index)
+					bounding_box = await element.bounding_box() if element else None
+					if not bounding_box:
+						return None
+					box = (
+						bounding_box['x'],
+						bounding_box['y'],
+						bounding_box['x'] + bounding_box['width'],
+						bounding_box['y'] + bounding_box['height'],
+					)
+
+				left, top, right, bottom = box
+				if offset:
+					return int(left + offset.x), int(top + offset.y)
+				return int((left + right) / 2), int((top + bottom) / 2)
+
 			async def execute_drag_operation(
 				page: Page,
 				source_x: int,
@@ -658,6 +688,7 @@ class Controller(Generic[Context]):
 					return False, f'Error during drag operation: {str(e)}'
 
 			page = await browser.get_current_page()
+			spatial_index = await browser.get_spatial_index()
 
 			try:
 				# Initialize variables
@@ -670,8 +701,21 @@ class Controller(Generic[Context]):
 				steps = max(1, params.steps or 10)
 				delay_ms = max(0, params.delay_ms or 5)
 
-				# Case 1: Element selectors provided
-				if params.element_source and params.element_target:
+				# Case 1: Element indices provided
+				if params.index_source is not None and params.index_target is not None:
+					logger.debug('Using index-based approach with the element boxes of the current state')
+					source_coords = await get_index_coordinates(params.index_source, params.element_source_offset, spatial_index)
+					target_coords = await get_index_coordinates(params.index_target, params.element_target_offset, spatial_index)
+
+					if not source_coords or not target_coords:
+						error_msg = f'Failed to determine {"source" if not source_coords else "target"} coordinates'
+						return ActionResult(error=error_msg, include_in_memory=True)
+
+					source_x, source_y = source_coords
+					target_x, target_y = target_coords
+
+				# Case 2: Element selectors provided
+				elif params.element_source and params.element_target:
 					logger.debug('Using element-based approach with selectors')
 
 					source_element, target_element = await get_drag_elements(
@@ -695,7 +739,7 @@ class Controller(Generic[Context]):
 					source_x, source_y = source_coords
 					target_x, target_y = target_coords
 
-				# Case 2: Coordinates provided directly
+				# Case 3: Coordinates provided directly
 				elif all(
 					coord is not None
 					for coord in [params.coord_source_x, params.coord_source_y, params.coord_target_x, params.coord_target_y]
@@ -706,7 +750,7 @@ class Controller(Generic[Context]):
 					target_x = params.coord_target_x
 					target_y = params.coord_target_y
 				else:
-					error_msg = 'Must provide either source/target selectors or source/target coordinates'
+					error_msg = 'Must provide either source/target indices, source/target selectors or source/target coordinates'
 					return ActionResult(error=error_msg, include_in_memory=True)
 
 				# Validate coordinates
@@ -730,10 +774,17 @@ class Controller(Generic[Context]):
 					return ActionResult(error=message, include_in_memory=True)
 
 				# Create descriptive message
-				if params.element_source and params.element_target:
+				if params.index_source is not None and params.index_target is not None:
+					msg = f'🖱️ Dragged element {params.index_source} to element {params.index_target}'
+				elif params.element_source and params.element_target:
 					msg = f"🖱️ Dragged element '{params.element_source}' to '{params.element_target}'"
 				else:
 					msg = f'🖱️ Dragged from ({source_x}, {source_y}) to ({target_x}, {target_y})'
+					# name the elements at both points when the boxes of the state are still current
+					source_node = spatial_index.element_at(cast(int, source_x), cast(int, source_y)) if spatial_index else None
+					target_node = spatial_index.element_at(cast(int, target_x), cast(int, target_y)) if spatial_index else None
+					if source_node is not None and target_node is not None:
+						msg += f' (element {source_node.highlight_index} to element {target_node.highlight_index})'
 
 				logger.info(msg)
 				return ActionResult(extracted_content=msg, include_in_memory=True)
@@ -855,15 +906,19 @@ class Controller(Generic[Context]):
 					# 	},
 					# 	span_type='TOOL',
 					# ):
-					result = await self.registry.execute_action(
-						action_name,
-						params,
-						browser=browser_context,
-						page_extraction_llm=page_extraction_llm,
-						sensitive_data=sensitive_data,
-						available_file_paths=available_file_paths,
-						context=context,
-					)
+					try:
+						result = await self.registry.execute_action(
+							action_name,
+							params,
+							browser=browser_context,
+							page_extraction_llm=page_extraction_llm,
+							sensitive_data=sensitive_data,
+							available_file_paths=available_file_paths,
+							context=context,
+						)
+					finally:
+						# the action may have scrolled or changed the page
+						browser_context.invalidate_spatial_index()
 
 					# Laminar.set_span_output(result)
 
@@ -67,6 +67,10 @@ class Position(BaseModel):
 
 
 class DragDropAction(BaseModel):
+	# Index-based approach, resolved from the element boxes of the current state
+	index_source: int | None = Field(None, description='Index of the element to drag from')
+	index_target: int | None = Field(None, description='Index of the element to drop onto')
+
 	# Element-based approach
 	element_source: str | None = Field(None, description='CSS selector or XPath of the element to drag from')
 	element_target: str | None = Field(None, description='CSS selector or XPath of the element to drop onto')
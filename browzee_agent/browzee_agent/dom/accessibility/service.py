@@ -0,0 +1,163 @@
+from browzee_agent.dom.views import (
+	ELEMENTS_TRUNCATED,
+	ESTIMATED_CHARACTERS_PER_TOKEN,
+	DOMElementNode,
+	DOMTextNode,
+	ElementText,
+	iter_element_texts,
+)
+from browzee_agent.utils import time_execution_sync
+
+# implicit ARIA roles of the tags, see https://www.w3.org/TR/html-aria/
+TAG_ROLES = {
+	'button': 'button',
+	'summary': 'button',
+	'textarea': 'textbox',
+	'option': 'option',
+	'img': 'img',
+	'li': 'listitem',
+	'ul': 'list',
+	'ol': 'list',
+	'nav': 'navigation',
+	'form': 'form',
+	'dialog': 'dialog',
+	'details': 'group',
+	'fieldset': 'group',
+	'table': 'table',
+	'tr': 'row',
+	'td': 'cell',
+	'th': 'columnheader',
+	'iframe': 'iframe',
+	'h1': 'heading',
+	'h2': 'heading',
+	'h3': 'heading',
+	'h4': 'heading',
+	'h5': 'heading',
+	'h6': 'heading',
+}
+INPUT_ROLES = {
+	'checkbox': 'checkbox',
+	'radio': 'radio',
+	'button': 'button',
+	'submit': 'button',
+	'reset': 'button',
+	'image': 'button',
+	'range': 'slider',
+	'number': 'spinbutton',
+	'search': 'searchbox',
+	'file': 'button',
+}
+# roles whose accessible name comes from their content before their title or placeholder
+NAME_FROM_CONTENT = frozenset(
+	'button cell checkbox columnheader generic heading link listitem menuitem menuitemcheckbox menuitemradio option '
+	'radio row switch tab treeitem tooltip'.split()
+)
+# roles that show their value, which is not part of the name
+VALUE_ROLES = frozenset('combobox searchbox slider spinbutton textbox'.split())
+BOOLEAN_STATES = ('checked', 'selected', 'disabled', 'required', 'readonly')
+ARIA_STATES = ('checked', 'selected', 'expanded', 'pressed', 'disabled')
+
+
+class AccessibilityTreeSerializer:
+	"""
+	Writes the highlighted elements of a DOM tree as an accessibility tree, one `[index] role "name" states`
+	line each, from the same tree as `clickable_elements_to_string` without another extraction.
+
+	Roles and names follow the implicit ARIA semantics of the tags and attributes buildDomTree.js kept.
+	Wrappers without a role or a name of their own that only hold other elements are collapsed into their
+	children, and the text outside of the highlighted elements is written as is.
+	"""
+
+	@staticmethod
+	@time_execution_sync('--accessibility_tree_to_string')
+	def serialize(
+		root: DOMElementNode,
+		max_tokens: int | None = None,
+		max_text_length: int | None = None,
+		keep: set[int] | None = None,
+	) -> str:
+		max_chars = max_tokens * ESTIMATED_CHARACTERS_PER_TOKEN if max_tokens is not None else None
+		formatted_text: list[str] = []
+		total_chars = 0
+		# levels the collapsed wrappers above an element remove from its depth
+		shifts: dict[ElementText, int] = {}
+		for item in iter_element_texts(root, keep):
+			element = item.node
+			if isinstance(element, DOMTextNode):
+				line = '\t' * item.depth + item.text
+			else:
+				shift = shifts[item.owner] if item.owner is not None else 0
+				role = AccessibilityTreeSerializer.role(element)
+				name = AccessibilityTreeSerializer.name(element, role, item.text, max_text_length)
+				if role == 'generic' and not name and item.wraps:
+					# layout wrapper: its children move up one level
+					shifts[item] = shift + 1
+					continue
+				shifts[item] = shift
+				line = AccessibilityTreeSerializer.line(element, item.depth - shift, role, name, max_text_length)
+
+			total_chars += len(line) + 1
+			if max_chars is not None and total_chars > max_chars:
+				formatted_text.append(ELEMENTS_TRUNCATED)
+				break
+			formatted_text.append(line)
+		return '\n'.join(formatted_text)
+
+	@staticmethod
+	def role(node: DOMElementNode) -> str:
+		explicit = node.attributes.get('role', '').split()
+		if explicit:
+			return explicit[0]
+		tag_name = node.tag_name
+		if tag_name == 'a':
+			return 'link' if 'href' in node.attributes else 'generic'
+		if tag_name == 'input':
+			return INPUT_ROLES.get(node.attributes.get('type', 'text').lower(), 'textbox')
+		if tag_name == 'select':
+			multiple = 'multiple' in node.attributes or node.attributes.get('size', '1') not in ('', '0', '1')
+			return 'listbox' if multiple else 'combobox'
+		if node.attributes.get('contenteditable') in ('', 'true', 'plaintext-only'):
+			return 'textbox'
+		return TAG_ROLES.get(tag_name, 'generic')
+
+	@staticmethod
+	def name(node: DOMElementNode, role: str, text: str, max_text_length: int | None = None) -> str:
+		attributes = node.attributes
+		name = attributes.get('aria-label', '')
+		if not name and (node.tag_name in ('img', 'area') or attributes.get('type') == 'image'):
+			name = attributes.get('alt', '')
+		if not name and node.tag_name == 'input' and attributes.get('type') in ('button', 'submit', 'reset'):
+			name = attributes.get('value', '')
+		if not name and role in NAME_FROM_CONTENT:
+			name = text
+		if not name:
+			# the text of the other roles is only used when nothing else names them
+			name = attributes.get('title') or attributes.get('placeholder') or text
+		name = ' '.join(name.split())
+		if max_text_length is not None and len(name) > max_text_length:
+			name = name[:max_text_length] + '...'
+		return name
+
+	@staticmethod
+	def line(node: DOMElementNode, depth: int, role: str, name: str, max_text_length: int | None) -> str:
+		attributes = node.attributes
+		parts = [f'*[{node.highlight_index}]*' if node.is_new else f'[{node.highlight_index}]', role]
+		if name:
+			parts.append('"' + name.replace('"', "'") + '"')
+
+		if role == 'heading' and node.tag_name[1:].isdigit():
+			parts.append(f'level={node.tag_name[1:]}')
+		for state in ARIA_STATES:
+			value = attributes.get(f'aria-{state}')
+			if value in ('true', 'false', 'mixed'):
+				parts.append(state if value == 'true' else f'{state}={value}')
+		for state in BOOLEAN_STATES:
+			if state in attributes and state not in parts:
+				parts.append(state)
+
+		value = attributes.get('value')
+		if role in VALUE_ROLES and value:
+			if max_text_length is not None and len(value) > max_text_length:
+				value = value[:max_text_length] + '...'
+			parts.append('value="' + value.replace('"', "'") + '"')
+		return '\t' * depth + ' '.join(parts)
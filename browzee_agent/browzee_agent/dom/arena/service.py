@@ -0,0 +1,125 @@
+import sys
+
+from browzee_agent.dom.arena.views import (
+	FLAG_IN_VIEWPORT,
+	FLAG_INTERACTIVE,
+	FLAG_SHADOW_ROOT,
+	FLAG_TEXT,
+	FLAG_TOP_ELEMENT,
+	FLAG_VISIBLE,
+	ArenaElementNode,
+	DOMArena,
+)
+from browzee_agent.dom.views import SelectorMap
+
+
+class DOMArenaBuilder:
+	"""
+	Builds a `DOMArena` straight from the buildDomTree.js result, without creating a node object per DOM node.
+	"""
+
+	@staticmethod
+	def from_eval_page(eval_page: dict) -> tuple[ArenaElementNode, SelectorMap]:
+		if 'columns' in eval_page:
+			rows = DOMArenaBuilder._rows_from_columns(eval_page['columns'])
+		else:
+			rows = DOMArenaBuilder._rows_from_map(eval_page['map'])
+
+		arena = DOMArena()
+		positions: dict[str, int] = {}
+		children_ids: list[list[str]] = []
+		intern = sys.intern
+
+		for id, flags, tag, string, highlight_index, attributes, child_ids, frame_id in rows:
+			if frame_id:
+				arena.frame_ids[len(arena.flags)] = frame_id
+			positions[id] = len(arena.flags)
+			arena.flags.append(flags)
+			arena.tags.append(intern(tag) if tag is not None else None)
+			arena.strings.append(string)
+			arena.highlight_indices.append(highlight_index)
+			for name, value in attributes:
+				arena.attr_names.append(intern(name))
+				arena.attr_values.append(intern(value) if len(value) < 64 else value)
+			arena.attr_offsets.append(len(arena.attr_names))
+			children_ids.append(child_ids)
+
+		# Link children once every node has a position, the order of the rows does not matter
+		arena.parents.extend([-1] * len(arena.flags))
+		for position, child_ids in enumerate(children_ids):
+			for child_id in child_ids:
+				child = positions.get(child_id)
+				if child is None:
+					continue
+				arena.children.append(child)
+				arena.parents[child] = position
+			arena.child_offsets.append(len(arena.children))
+
+		root = positions.get(str(eval_page['rootId']))
+		if root is None or arena.flags[root] & FLAG_TEXT:
+			raise ValueError('Failed to parse HTML to dictionary')
+		arena.root = root
+
+		selector_map: SelectorMap = {}
+		for position, highlight_index in enumerate(arena.highlight_indices):
+			if highlight_index >= 0:
+				selector_map[highlight_index] = ArenaElementNode(arena, position)
+
+		return arena.root_node(), selector_map
+
+	@staticmethod
+	def _rows_from_map(js_node_map: dict):
+		for id, node_data in js_node_map.items():
+			if not node_data:
+				continue
+
+			if node_data.get('type') == 'TEXT_NODE':
+				flags = FLAG_TEXT | (FLAG_VISIBLE if node_data['isVisible'] else 0)
+				yield id, flags, None, node_data['text'], -1, (), (), None
+				continue
+
+			flags = (
+				(FLAG_VISIBLE if node_data.get('isVisible') else 0)
+				| (FLAG_TOP_ELEMENT if node_data.get('isTopElement') else 0)
+				| (FLAG_INTERACTIVE if node_data.get('isInteractive') else 0)
+				| (FLAG_IN_VIEWPORT if node_data.get('isInViewport') else 0)
+				| (FLAG_SHADOW_ROOT if node_data.get('shadowRoot') else 0)
+			)
+			highlight_index = node_data.get('highlightIndex')
+			yield (
+				id,
+				flags,
+				node_data['tagName'],
+				node_data['xpath'],
+				highlight_index if highlight_index is not None else -1,
+				node_data.get('attributes', {}).items(),
+				node_data.get('children', []),
+				node_data.get('frameId'),
+			)
+
+	@staticmethod
+	def _rows_from_columns(columns: dict):
+		tag_table = columns['tagTable']
+		attr_name_table = columns['attrNameTable']
+		string_table = columns['stringTable']
+		attr_offsets = columns['attrOffsets']
+		attr_names = columns['attrNames']
+		attr_values = columns['attrValues']
+		child_offsets = columns['childOffsets']
+		child_ids = [str(i) for i in columns['childIds']]
+		frame_ids = dict(zip(columns.get('frameRows', []), (string_table[i] for i in columns.get('frameIds', []))))
+
+		for row, (id, flags, tag, string, highlight_index) in enumerate(
+			zip(columns['ids'], columns['flags'], columns['tags'], columns['strings'], columns['highlightIndices'])
+		):
+			attr_start, attr_end = attr_offsets[row], attr_offsets[row + 1]
+			yield (
+				str(id),
+				flags,
+				tag_table[tag] if tag >= 0 else None,
+				string_table[string],
+				highlight_index,
+				[(attr_name_table[attr_names[i]], string_table[attr_values[i]]) for i in range(attr_start, attr_end)],
+				child_ids[child_offsets[row] : child_offsets[row + 1]],
+				frame_ids.get(row),
+			)
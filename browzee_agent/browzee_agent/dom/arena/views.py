@@ -0,0 +1,222 @@
+from array import array
+from typing import Optional
+
+from browzee_agent.dom.history_tree_processor.view import HashedDomElement
+from browzee_agent.dom.views import DOMBaseNode, DOMElementNode, DOMTextNode
+
+# Flag bits per node, the first six match the columnar wire format of buildDomTree.js
+FLAG_TEXT = 1
+FLAG_VISIBLE = 2
+FLAG_TOP_ELEMENT = 4
+FLAG_INTERACTIVE = 8
+FLAG_IN_VIEWPORT = 16
+FLAG_SHADOW_ROOT = 32
+FLAG_IS_NEW_SET = 64
+FLAG_IS_NEW = 128
+
+
+class DOMArena:
+	"""
+	Whole DOM snapshot stored as parallel arrays indexed by arena position.
+
+	Nodes are only materialized as small `__slots__` views (`ArenaElementNode` / `ArenaTextNode`)
+	when they are accessed, so a snapshot costs a handful of arrays instead of one dataclass,
+	dict and list per node.
+
+	strings[i] holds the xpath of an element or the text of a text node.
+	Attributes and children of node i live in [offsets[i], offsets[i + 1]) of the flat arrays.
+	"""
+
+	__slots__ = (
+		'flags',
+		'tags',
+		'strings',
+		'highlight_indices',
+		'parents',
+		'attr_offsets',
+		'attr_names',
+		'attr_values',
+		'child_offsets',
+		'children',
+		'root',
+		'frame_ids',
+		'_hashes',
+		'_attributes',
+	)
+
+	def __init__(self) -> None:
+		self.flags = bytearray()
+		self.tags: list[str | None] = []
+		self.strings: list[str] = []
+		self.highlight_indices = array('i')
+		self.parents = array('i')
+		self.attr_offsets = array('i', [0])
+		self.attr_names: list[str] = []
+		self.attr_values: list[str] = []
+		self.child_offsets = array('i', [0])
+		self.children = array('i')
+		self.root = 0
+		# sparse, only <iframe> elements of per-frame extractions have one
+		self.frame_ids: dict[int, str] = {}
+		self._hashes: dict[int, HashedDomElement] = {}
+		# attribute dicts handed out by the views, so writes to them are kept
+		self._attributes: dict[int, dict[str, str]] = {}
+
+	def __len__(self) -> int:
+		return len(self.flags)
+
+	def node(self, index: int) -> DOMBaseNode:
+		if self.flags[index] & FLAG_TEXT:
+			return ArenaTextNode(self, index)
+		return ArenaElementNode(self, index)
+
+	def root_node(self) -> 'ArenaElementNode':
+		return ArenaElementNode(self, self.root)
+
+
+class _ArenaNode:
+	__slots__ = ('_arena', '_index')
+
+	def __init__(self, arena: DOMArena, index: int) -> None:
+		self._arena = arena
+		self._index = index
+
+	def __eq__(self, other: object) -> bool:
+		return isinstance(other, _ArenaNode) and other._arena is self._arena and other._index == self._index
+
+	def __hash__(self) -> int:
+		return hash((id(self._arena), self._index))
+
+	@property
+	def is_visible(self) -> bool:
+		return bool(self._arena.flags[self._index] & FLAG_VISIBLE)
+
+	@property
+	def parent(self) -> Optional['ArenaElementNode']:
+		parent = self._arena.parents[self._index]
+		if parent < 0:
+			return None
+		return ArenaElementNode(self._arena, parent)
+
+
+class ArenaTextNode(_ArenaNode):
+	"""Read-only view of a text node stored in a `DOMArena`, API compatible with `DOMTextNode`."""
+
+	__slots__ = ()
+
+	type = 'TEXT_NODE'
+
+	@property
+	def text(self) -> str:
+		return self._arena.strings[self._index]
+
+	has_parent_with_highlight_index = DOMTextNode.has_parent_with_highlight_index
+	is_parent_in_viewport = DOMTextNode.is_parent_in_viewport
+	is_parent_top_element = DOMTextNode.is_parent_top_element
+	__json__ = DOMTextNode.__json__
+
+	def __repr__(self) -> str:
+		return f'ArenaTextNode(text={self.text!r})'
+
+
+class ArenaElementNode(_ArenaNode):
+	"""View of an element stored in a `DOMArena`, API compatible with `DOMElementNode`."""
+
+	__slots__ = ()
+
+	# never filled by buildDomTree.js, kept for API compatibility
+	viewport_coordinates = None
+	page_coordinates = None
+	viewport_info = None
+
+	@property
+	def tag_name(self) -> str:
+		return self._arena.tags[self._index]
+
+	@property
+	def xpath(self) -> str:
+		return self._arena.strings[self._index]
+
+	@property
+	def attributes(self) -> dict[str, str]:
+		# built once and cached on the arena like the hash, the same dict is returned on every access
+		arena = self._arena
+		attributes = arena._attributes.get(self._index)
+		if attributes is None:
+			start, end = arena.attr_offsets[self._index], arena.attr_offsets[self._index + 1]
+			attributes = dict(zip(arena.attr_names[start:end], arena.attr_values[start:end]))
+			arena._attributes[self._index] = attributes
+		return attributes
+
+	@property
+	def children(self) -> tuple[DOMBaseNode, ...]:
+		# a tuple, the arena arrays cannot be changed through a view
+		arena = self._arena
+		start, end = arena.child_offsets[self._index], arena.child_offsets[self._index + 1]
+		return tuple(arena.node(child) for child in arena.children[start:end])
+
+	@property
+	def is_interactive(self) -> bool:
+		return bool(self._arena.flags[self._index] & FLAG_INTERACTIVE)
+
+	@property
+	def is_top_element(self) -> bool:
+		return bool(self._arena.flags[self._index] & FLAG_TOP_ELEMENT)
+
+	@property
+	def is_in_viewport(self) -> bool:
+		return bool(self._arena.flags[self._index] & FLAG_IN_VIEWPORT)
+
+	@property
+	def shadow_root(self) -> bool:
+		return bool(self._arena.flags[self._index] & FLAG_SHADOW_ROOT)
+
+	@property
+	def frame_id(self) -> str | None:
+		return self._arena.frame_ids.get(self._index)
+
+	@property
+	def highlight_index(self) -> int | None:
+		highlight_index = self._arena.highlight_indices[self._index]
+		return highlight_index if highlight_index >= 0 else None
+
+	@property
+	def is_new(self) -> bool | None:
+		flags = self._arena.flags[self._index]
+		if not flags & FLAG_IS_NEW_SET:
+			return None
+		return bool(flags & FLAG_IS_NEW)
+
+	@is_new.setter
+	def is_new(self, value: bool | None) -> None:
+		flags = self._arena.flags[self._index] & ~(FLAG_IS_NEW_SET | FLAG_IS_NEW)
+		if value is not None:
+			flags |= FLAG_IS_NEW_SET | (FLAG_IS_NEW if value else 0)
+		self._arena.flags[self._index] = flags
+
+	@property
+	def hash(self) -> HashedDomElement:
+		# views are short-lived, so the hash is cached on the arena instead of the instance
+		hashed = self._arena._hashes.get(self._index)
+		if hashed is None:
+			from browzee_agent.dom.history_tree_processor.service import HistoryTreeProcessor
+
+			hashed = HistoryTreeProcessor._hash_dom_element(self)
+			self._arena._hashes[self._index] = hashed
+		return hashed
+
+	@property
+	def cached_hash(self) -> HashedDomElement | None:
+		return self._arena._hashes.get(self._index)
+
+	get_all_text_till_next_clickable_element = DOMElementNode.get_all_text_till_next_clickable_element
+	clickable_elements_to_string = DOMElementNode.clickable_elements_to_string
+	_clickable_element_line = DOMElementNode._clickable_element_line
+	get_file_upload_element = DOMElementNode.get_file_upload_element
+	__json__ = DOMElementNode.__json__
+	__repr__ = DOMElementNode.__repr__
+
+
+# Make the views pass the isinstance checks spread over the codebase
+DOMTextNode.register(ArenaTextNode)
+DOMElementNode.register(ArenaElementNode)
@@ -1,12 +1,58 @@
-(
+async (
   args = {
     doHighlightElements: true,
     focusHighlightIndex: -1,
     viewportExpansion: 0,
     debugMode: false,
+    incremental: false,
+    incrementalBase: null,
+    wireFormat: 'json',
+    descendIntoIframes: true,
+    drawHighlights: true,
+    tileScrollPages: 0,
+    runName: null,
+    maxNodes: null,
+    timeBudgetMs: null,
+    collectMarks: false,
+    chunkSliceMs: null,
+    minimal: false,
   }
 ) => {
-  const { doHighlightElements, focusHighlightIndex, viewportExpansion, debugMode } = args;
+  const {
+    doHighlightElements, focusHighlightIndex, viewportExpansion, debugMode,
+    incremental, incrementalBase, wireFormat,
+  } = args;
+  // Per-frame extraction handles iframes itself and draws the overlays of sub-frames afterwards
+  const descendIntoIframes = args.descendIntoIframes ?? true;
+  const drawHighlights = args.drawHighlights ?? true;
+  // Prefetched tiles read the geometry as if the page was already scrolled by tileScrollPages
+  // viewports, clamped to the scrollable range like window.scrollBy
+  const tileScrollPages = args.tileScrollPages ?? 0;
+  const runName = args.runName ?? null;
+  const scrollingElement = document.scrollingElement || document.documentElement;
+  const tileScrollY = Math.min(
+    Math.max(0, scrollingElement.scrollHeight - window.innerHeight),
+    Math.max(0, window.scrollY + tileScrollPages * window.innerHeight)
+  );
+  const viewportOffset = tileScrollPages ? tileScrollY - window.scrollY : 0;
+  // Optional budget: once maxNodes nodes were visited or timeBudgetMs elapsed, the remaining nodes
+  // are skipped and the result is marked truncated
+  const maxNodes = args.maxNodes ?? null;
+  const timeBudgetMs = args.timeBudgetMs ?? null;
+  const budgeted = maxNodes !== null || timeBudgetMs !== null;
+  const deadline = timeBudgetMs !== null ? performance.now() + timeBudgetMs : Infinity;
+  let visitedNodes = 0;
+  let truncated = false;
+  // Return the boxes of the highlighted elements, for drawing the marks on a screenshot instead of in the page
+  const collectMarks = args.collectMarks ?? false;
+  // Chunked mode: the traversal runs in slices of chunkSliceMs and yields to the page in between,
+  // with timeBudgetMs as the deadline of the whole extraction
+  const chunkSliceMs = args.chunkSliceMs ?? null;
+  const chunked = chunkSliceMs !== null;
+  // Minimal mode: only return the nodes the element list of the prompt is made of, see pruneForPrompt
+  const minimal = args.minimal ?? false;
+  let sliceStart = performance.now();
+  let sliceNodes = 0;
   let highlightIndex = 0; // Reset highlight index
 
   // Add timing stack to handle recursion
@@ -59,6 +105,21 @@
       processedNodes: 0,
       skippedNodes: 0,
     },
+    // siblingsScanned grows linearly with the tree when the xpaths come from the traversal,
+    // quadratically on wide lists when each one is computed by getXPathTree
+    xpathMetrics: {
+      traversalXPaths: 0,
+      getXPathTreeCalls: 0,
+      siblingsScanned: 0,
+    },
+    // forcedLayouts counts the layout reads that followed a write to the page (an overlay drawn in the middle
+    // of the traversal), each of them makes the browser lay out the page again synchronously
+    layoutMetrics: {
+      forcedLayouts: 0,
+      elementFromPointCalls: 0,
+      hitTestCacheHits: 0,
+      batchedHighlights: 0,
+    },
     buildDomTreeBreakdown: {
       totalTime: 0,
       totalSelfTime: 0,
@@ -106,13 +167,30 @@
     boundingRects: new WeakMap(),
     clientRects: new WeakMap(),
     computedStyles: new WeakMap(),
+    // root (document or shadow root) -> Map of "x,y" -> element hit at that point
+    hitTests: new Map(),
     clearCache: () => {
       DOM_CACHE.boundingRects = new WeakMap();
       DOM_CACHE.clientRects = new WeakMap();
       DOM_CACHE.computedStyles = new WeakMap();
+      DOM_CACHE.hitTests = new Map();
     }
   };
 
+  // Set when the page was written to, the next layout read then forces a synchronous layout (debug mode only)
+  let layoutDirty = false;
+
+  function noteLayoutWrite() {
+    layoutDirty = true;
+  }
+
+  function noteLayoutRead() {
+    if (layoutDirty) {
+      layoutDirty = false;
+      PERF_METRICS.layoutMetrics.forcedLayouts++;
+    }
+  }
+
   // Cache helper functions
   function getCachedBoundingRect(element) {
     if (!element) return null;
@@ -126,6 +204,7 @@
 
     if (debugMode && PERF_METRICS) {
       PERF_METRICS.cacheMetrics.boundingRectCacheMisses++;
+      noteLayoutRead();
     }
 
     let rect;
@@ -159,6 +238,7 @@
 
     if (debugMode && PERF_METRICS) {
       PERF_METRICS.cacheMetrics.computedStyleCacheMisses++;
+      noteLayoutRead();
     }
 
     let style;
@@ -179,6 +259,36 @@
     }
     return style;
   }
+  const fixedPositionCache = new WeakMap();
+
+  /**
+   * Whether the element or one of its ancestors is fixed or sticky, so it stays on screen when the page scrolls.
+   */
+  function isFixedPosition(element) {
+    if (!element || element === document.documentElement) return false;
+    if (fixedPositionCache.has(element)) return fixedPositionCache.get(element);
+
+    const style = getCachedComputedStyle(element);
+    const fixed = (style && (style.position === 'fixed' || style.position === 'sticky')) ||
+      isFixedPosition(element.parentElement || element.getRootNode().host);
+    fixedPositionCache.set(element, fixed);
+    return fixed;
+  }
+
+  /**
+   * Checks if a rect of the element lies outside the expanded viewport, shifted for prefetched tiles.
+   */
+  function isRectOutsideViewport(rect, expansion, element) {
+    const shift = viewportOffset && element?.ownerDocument === document && !isFixedPosition(element) ?
+      viewportOffset : 0;
+    return (
+      rect.bottom - shift < -expansion ||
+      rect.top - shift > window.innerHeight + expansion ||
+      rect.right < -expansion ||
+      rect.left > window.innerWidth + expansion
+    );
+  }
+
 
   // Add a new function to get cached client rects
   function getCachedClientRects(element) {
@@ -193,6 +303,7 @@
     
     if (debugMode && PERF_METRICS) {
       PERF_METRICS.cacheMetrics.clientRectsCacheMisses++;
+      noteLayoutRead();
     }
     
     const rects = element.getClientRects();
@@ -203,6 +314,33 @@
     return rects;
   }
 
+  /**
+   * Element hit at a point of `root`, cached for the traversal: nested boxes of the same size
+   * (a link around a span, wrapper divs) share their center and need a single hit test.
+   * Only valid while nothing is written to the page, overlays are drawn after the traversal.
+   */
+  function getCachedElementFromPoint(root, x, y) {
+    let hits = DOM_CACHE.hitTests.get(root);
+    if (!hits) {
+      hits = new Map();
+      DOM_CACHE.hitTests.set(root, hits);
+    }
+
+    const key = `${x},${y}`;
+    if (hits.has(key)) {
+      if (debugMode) PERF_METRICS.layoutMetrics.hitTestCacheHits++;
+      return hits.get(key);
+    }
+
+    if (debugMode) {
+      PERF_METRICS.layoutMetrics.elementFromPointCalls++;
+      noteLayoutRead();
+    }
+    const topEl = root.elementFromPoint(x, y);
+    hits.set(key, topEl);
+    return topEl;
+  }
+
   /**
    * Hash map of DOM nodes indexed by their highlight index.
    *
@@ -210,10 +348,127 @@
    */
   const DOM_HASH_MAP = {};
 
+  /**
+   * Elements that received a highlight index in this pass, in index order.
+   */
+  const HIGHLIGHTED = [];
+
   const ID = { current: 0 };
 
   const HIGHLIGHT_CONTAINER_ID = "playwright-highlight-container";
 
+  /**
+   * Returns true if a mutation record only concerns our own highlight overlays.
+   */
+  function isHighlightMutation(record) {
+    if (record.type === 'attributes' && record.attributeName === 'browser-user-highlight-id') {
+      return true;
+    }
+    const target = record.target;
+    if (target && target.nodeType === Node.ELEMENT_NODE &&
+        (target.id === HIGHLIGHT_CONTAINER_ID || target.closest?.(`#${HIGHLIGHT_CONTAINER_ID}`))) {
+      return true;
+    }
+    if (record.type === 'childList') {
+      const changed = [...record.addedNodes, ...record.removedNodes];
+      return changed.length > 0 && changed.every(n => n.id === HIGHLIGHT_CONTAINER_ID);
+    }
+    return false;
+  }
+
+  /**
+   * Persistent node registry kept on the window between calls (incremental mode only).
+   *
+   * Nodes get stable ids through a WeakMap, and a MutationObserver flags the
+   * registry as dirty whenever the page changes, so an unchanged page can be
+   * answered without re-walking the DOM at all.
+   */
+  function getRegistry() {
+    let registry = window._domTreeRegistry;
+    if (!registry) {
+      registry = {
+        version: 0,
+        nodeIds: new WeakMap(),
+        nextId: 0,
+        // node data of the last snapshot by id
+        nodes: {},
+        rootId: null,
+        lastState: null,
+        highlighted: [],
+        dirty: true,
+        observedRoots: new WeakSet(),
+        observer: null,
+      };
+      registry.observer = new MutationObserver((records) => {
+        if (records.some(record => !isHighlightMutation(record))) {
+          registry.dirty = true;
+        }
+      });
+      // scrolling (of the window or any inner container) changes visibility without mutating the DOM
+      window.addEventListener('scroll', markRegistryDirty, true);
+      window.addEventListener('resize', markRegistryDirty);
+      window._domTreeRegistry = registry;
+    }
+    return registry;
+  }
+
+  /**
+   * Whether the node data of two snapshots are equal. Compared field by field, stopping at the first
+   * difference, instead of serializing every node of the page to compare the strings.
+   */
+  function sameNodeData(a, b) {
+    if (a === b) return true;
+    if (typeof a !== 'object' || typeof b !== 'object' || a === null || b === null) return false;
+    if (Array.isArray(a)) {
+      if (!Array.isArray(b) || a.length !== b.length) return false;
+      for (let i = 0; i < a.length; i++) {
+        if (!sameNodeData(a[i], b[i])) return false;
+      }
+      return true;
+    }
+    const keys = Object.keys(a);
+    if (keys.length !== Object.keys(b).length) return false;
+    for (const key of keys) {
+      if (!(key in b) || !sameNodeData(a[key], b[key])) return false;
+    }
+    return true;
+  }
+
+  function markRegistryDirty() {
+    if (window._domTreeRegistry) window._domTreeRegistry.dirty = true;
+  }
+
+  function observeRoot(root) {
+    if (!registry || !root || registry.observedRoots.has(root)) return;
+    try {
+      registry.observer.observe(root, { subtree: true, childList: true, attributes: true, characterData: true });
+      registry.observedRoots.add(root);
+    } catch (e) {
+      // cross-origin documents cannot be observed
+    }
+  }
+
+  function nextNodeId(node) {
+    if (!registry) return `${ID.current++}`;
+
+    let id = registry.nodeIds.get(node);
+    if (id === undefined) {
+      id = `${registry.nextId++}`;
+      registry.nodeIds.set(node, id);
+    }
+    return id;
+  }
+
+  // the page keeps changing while a chunked extraction yields, its mutations cannot be told from ours
+  const registry = incremental && !chunked ? getRegistry() : null;
+  if (registry) {
+    observeRoot(document);
+    // flush records that were queued but not yet delivered to the callback
+    if (registry.observer.takeRecords().some(record => !isHighlightMutation(record))) {
+      registry.dirty = true;
+    }
+  }
+
   // Add a WeakMap cache for XPath strings
   const xpathCache = new WeakMap();
 
@@ -229,8 +484,9 @@
 
   /**
    * Highlights an element in the DOM and returns the index of the next element.
+   * `geometry` ({ rects, iframeRect }) was read beforehand by highlightElements.
    */
-  function highlightElement(element, index, parentIframe = null) {
+  function highlightElement(element, index, parentIframe = null, geometry = null) {
     pushTiming('highlighting');
     
     if (!element) return index;
@@ -260,7 +516,7 @@
       }
 
       // Get element client rects
-      const rects = element.getClientRects(); // Use getClientRects()
+      const rects = geometry ? geometry.rects : element.getClientRects(); // Use getClientRects()
 
       if (!rects || rects.length === 0) return index; // Exit if no rects
 
@@ -286,7 +542,7 @@
       // Get iframe offset if necessary
       let iframeOffset = { x: 0, y: 0 };
       if (parentIframe) {
-        const iframeRect = parentIframe.getBoundingClientRect(); // Keep getBoundingClientRect for iframe offset
+        const iframeRect = geometry ? geometry.iframeRect : parentIframe.getBoundingClientRect(); // Keep getBoundingClientRect for iframe offset
         iframeOffset.x = iframeRect.left;
         iframeOffset.y = iframeRect.top;
       }
@@ -444,6 +700,7 @@
       
       // Then add fragment to container in one operation
       container.appendChild(fragment);
+      if (debugMode) noteLayoutWrite();
       
       return index + 1;
     } finally {
@@ -456,6 +713,23 @@
     }
   }
 
+  /**
+   * Draws the overlays of several { element, index, parentIframe }: the geometry of all of them is read
+   * first and the overlays are written afterwards, so no read has to lay out the overlays added before it.
+   */
+  function highlightElements(highlights) {
+    const geometries = highlights.map(({ element, parentIframe }) => ({
+      rects: element.getClientRects(),
+      box: element.getBoundingClientRect(),
+      iframeRect: parentIframe ? parentIframe.getBoundingClientRect() : null,
+    }));
+    highlights.forEach(({ element, index, parentIframe }, i) => {
+      highlightElement(element, index, parentIframe, geometries[i]);
+    });
+    if (debugMode) PERF_METRICS.layoutMetrics.batchedHighlights += highlights.length;
+    return geometries;
+  }
+
   // Add this function to perform cleanup when needed
   function cleanupHighlights() {
     if (window._highlightCleanupFunctions && window._highlightCleanupFunctions.length) {
@@ -477,6 +751,7 @@
   
     const siblings = Array.from(currentElement.parentElement.children)
       .filter((sib) => sib.nodeName.toLowerCase() === tagName);
+    if (debugMode) PERF_METRICS.xpathMetrics.siblingsScanned += currentElement.parentElement.children.length;
   
     if (siblings.length === 1) {
       return 0; // Only element of its type
@@ -491,7 +766,8 @@
    */
   function getXPathTree(element, stopAtBoundary = true) {
     if (xpathCache.has(element)) return xpathCache.get(element);
-    
+    if (debugMode) PERF_METRICS.xpathMetrics.getXPathTreeCalls++;
+
     const segments = [];
     let currentElement = element;
 
@@ -518,6 +794,51 @@
     return result;
   }
 
+  /**
+   * XPaths of the element children of `parent` given the xpath of the parent, the same strings as
+   * getXPathTree without its sibling scan per element: one pass counts the tags, one numbers them.
+   * Returns an array aligned with parent.childNodes, undefined for the non-element nodes.
+   */
+  function getChildXPaths(parent, parentXPath) {
+    const childNodes = parent.childNodes;
+    const xpaths = new Array(childNodes.length);
+
+    // getXPathTree stops at a shadow root, its children get an empty xpath and restart the paths
+    if (parent instanceof ShadowRoot) {
+      for (let i = 0; i < childNodes.length; i++) {
+        if (childNodes[i].nodeType === Node.ELEMENT_NODE) xpaths[i] = '';
+      }
+      return xpaths;
+    }
+
+    // only elements have a parentElement, the children of a document are never numbered
+    const tagCounts = new Map();
+    if (parent.nodeType === Node.ELEMENT_NODE) {
+      for (const child of parent.children) {
+        const tagName = child.nodeName.toLowerCase();
+        tagCounts.set(tagName, (tagCounts.get(tagName) || 0) + 1);
+      }
+      if (debugMode) PERF_METRICS.xpathMetrics.siblingsScanned += parent.children.length;
+    }
+
+    const tagPositions = new Map();
+    for (let i = 0; i < childNodes.length; i++) {
+      const child = childNodes[i];
+      if (child.nodeType !== Node.ELEMENT_NODE) continue;
+
+      const tagName = child.nodeName.toLowerCase();
+      let segment = tagName;
+      if (tagCounts.get(tagName) > 1) {
+        const position = (tagPositions.get(tagName) || 0) + 1;
+        tagPositions.set(tagName, position);
+        segment = `${tagName}[${position}]`;
+      }
+      xpaths[i] = parentXPath ? `${parentXPath}/${segment}` : segment;
+      if (debugMode) PERF_METRICS.xpathMetrics.traversalXPaths++;
+    }
+    return xpaths;
+  }
+
   /**
    * Checks if a text node is visible.
    */
@@ -560,12 +881,7 @@
           isAnyRectVisible = true;
 
           // Viewport check for this rect
-          if (!(
-            rect.bottom < -viewportExpansion ||
-            rect.top > window.innerHeight + viewportExpansion ||
-            rect.right < -viewportExpansion ||
-            rect.left > window.innerWidth + viewportExpansion
-          )) {
+          if (!isRectOutsideViewport(rect, viewportExpansion, textNode.parentElement)) {
             isAnyRectInViewport = true;
             break; // Found a visible rect in viewport, no need to check others
           }
@@ -868,12 +1184,8 @@
     let isAnyRectInViewport = false;
     for (const rect of rects) {
       // Use the same logic as isInExpandedViewport check
-      if (rect.width > 0 && rect.height > 0 && !( // Only check non-empty rects
-        rect.bottom < -viewportExpansion ||
-        rect.top > window.innerHeight + viewportExpansion ||
-        rect.right < -viewportExpansion ||
-        rect.left > window.innerWidth + viewportExpansion
-      )) {
+      if (rect.width > 0 && rect.height > 0 && // Only check non-empty rects
+        !isRectOutsideViewport(rect, viewportExpansion, element)) {
         isAnyRectInViewport = true;
         break;
       }
@@ -883,6 +1195,13 @@
       return false; // All rects are outside the viewport area
     }
 
+    // Parts of a prefetched tile that are not on screen yet cannot be hit-tested
+    if (viewportOffset) {
+      const rect = rects[Math.floor(rects.length / 2)];
+      const centerY = rect.top + rect.height / 2;
+      if (centerY < 0 || centerY > window.innerHeight) return true;
+    }
+
 
     // Find the correct document context and root element
     let doc = element.ownerDocument;
@@ -899,10 +1218,7 @@
       const centerY = rects[Math.floor(rects.length / 2)].top + rects[Math.floor(rects.length / 2)].height / 2;
 
       try {
-        const topEl = measureDomOperation(
-          () => shadowRoot.elementFromPoint(centerX, centerY),
-          'elementFromPoint'
-        );
+        const topEl = getCachedElementFromPoint(shadowRoot, centerX, centerY);
         if (!topEl) return false;
 
         let current = topEl;
@@ -921,7 +1237,7 @@
     const centerY = rects[Math.floor(rects.length / 2)].top + rects[Math.floor(rects.length / 2)].height / 2;
 
     try {
-      const topEl = document.elementFromPoint(centerX, centerY);
+      const topEl = getCachedElementFromPoint(document, centerX, centerY);
       if (!topEl) return false;
 
       let current = topEl;
@@ -952,24 +1268,14 @@
       if (!boundingRect || boundingRect.width === 0 || boundingRect.height === 0) {
         return false;
       }
-      return !(
-        boundingRect.bottom < -viewportExpansion ||
-        boundingRect.top > window.innerHeight + viewportExpansion ||
-        boundingRect.right < -viewportExpansion ||
-        boundingRect.left > window.innerWidth + viewportExpansion
-      );
+      return !isRectOutsideViewport(boundingRect, viewportExpansion, element);
     }
 
     // Check if *any* client rect is within the viewport
     for (const rect of rects) {
       if (rect.width === 0 || rect.height === 0) continue; // Skip empty rects
 
-      if (!(
-        rect.bottom < -viewportExpansion ||
-        rect.top > window.innerHeight + viewportExpansion ||
-        rect.right < -viewportExpansion ||
-        rect.left > window.innerWidth + viewportExpansion
-      )) {
+      if (!isRectOutsideViewport(rect, viewportExpansion, element)) {
         return true; // Found at least one rect in the viewport
       }
     }
@@ -1128,15 +1434,10 @@
       // regardless of viewport status
       if (nodeData.isInViewport || viewportExpansion === -1) {
         nodeData.highlightIndex = highlightIndex++;
+        HIGHLIGHTED.push({ element: node, index: nodeData.highlightIndex, parentIframe });
 
         if (doHighlightElements) {
-          if (focusHighlightIndex >= 0) {
-            if (focusHighlightIndex === nodeData.highlightIndex) {
-              highlightElement(node, nodeData.highlightIndex, parentIframe);
-            }
-          } else {
-            highlightElement(node, nodeData.highlightIndex, parentIframe);
-          }
+          // drawn after the traversal, or later through window._domTreeLastRun without drawHighlights
           return true; // Successfully highlighted
         }
       } else {
@@ -1147,10 +1448,101 @@
     return false; // Did not highlight
   }
 
+  /**
+   * Viewport boxes [index, left, top, width, height] of the highlighted elements, in CSS pixels.
+   * Pass the geometries highlightElements read for the same list once the overlays are drawn: reading
+   * the boxes again after those writes would force another layout.
+   */
+  function getMarks(highlighted, geometries = null) {
+    const boxes = [];
+    highlighted.forEach(({ element, index, parentIframe }, i) => {
+      if (focusHighlightIndex >= 0 && focusHighlightIndex !== index) return;
+      const rect = geometries ? geometries[i].box : element.getBoundingClientRect();
+      if (rect.width === 0 || rect.height === 0) return;
+      const iframeRect = geometries ? geometries[i].iframeRect : parentIframe ? parentIframe.getBoundingClientRect() : null;
+      boxes.push([index, rect.left + (iframeRect?.left ?? 0), rect.top + (iframeRect?.top ?? 0), rect.width, rect.height]);
+    });
+    return { boxes, devicePixelRatio: window.devicePixelRatio };
+  }
+
+  function isOverBudget() {
+    if (truncated) return true;
+    visitedNodes++;
+    // performance.now() is cheap but not free, read the clock every 64 nodes
+    if ((maxNodes !== null && visitedNodes > maxNodes) ||
+        ((visitedNodes & 63) === 0 && performance.now() > deadline)) {
+      truncated = true;
+    }
+    return truncated;
+  }
+
+  /**
+   * Whether the current slice of a chunked extraction is used up, the clock is read every 32 nodes.
+   */
+  function isSliceOver() {
+    return chunked && (++sliceNodes & 31) === 0 && performance.now() - sliceStart >= chunkSliceMs;
+  }
+
+  /**
+   * Gives the main thread back to the page: scheduler.yield keeps our place in the task queue,
+   * requestIdleCallback waits for the page to be idle and setTimeout is the fallback.
+   */
+  function yieldToPage() {
+    if (globalThis.scheduler?.yield) return globalThis.scheduler.yield();
+    if (window.requestIdleCallback) {
+      return new Promise(resolve => window.requestIdleCallback(resolve, { timeout: chunkSliceMs }));
+    }
+    return new Promise(resolve => setTimeout(resolve, 0));
+  }
+
+  /**
+   * Lower values are visited first when extracting with a budget:
+   * nodes on screen, then interactive candidates, then everything else.
+   */
+  function getVisitPriority(node) {
+    if (node.nodeType !== Node.ELEMENT_NODE) return 0;
+    const rect = getCachedBoundingRect(node);
+    if (rect && (isFixedPosition(node) || !isRectOutsideViewport(rect, Math.max(viewportExpansion, 0), node))) {
+      return 0;
+    }
+    return isInteractiveCandidate(node) ? 1 : 2;
+  }
+
+  /**
+   * Builds the child nodes of `parent` and appends their ids to `childIds`, in document order.
+   * With a budget the children are visited by priority, so the budget goes to what the agent can act on first.
+   */
+  function* buildChildren(parent, parentXPath, childIds, parentIframe, isParentHighlighted) {
+    const childNodes = parent.childNodes;
+    const xpaths = getChildXPaths(parent, parentXPath);
+    if (!budgeted) {
+      for (let i = 0; i < childNodes.length; i++) {
+        const domElement = yield* buildDomTree(childNodes[i], parentIframe, isParentHighlighted, xpaths[i]);
+        if (domElement) childIds.push(domElement);
+      }
+      return;
+    }
+
+    const children = Array.from(childNodes);
+    const visitOrder = children
+      .map((child, position) => [truncated ? 0 : getVisitPriority(child), position])
+      .sort((a, b) => a[0] - b[0] || a[1] - b[1]);
+    const results = new Array(children.length);
+    for (const [, position] of visitOrder) {
+      results[position] = yield* buildDomTree(children[position], parentIframe, isParentHighlighted, xpaths[position]);
+    }
+    for (const domElement of results) {
+      if (domElement) childIds.push(domElement);
+    }
+  }
+
   /**
    * Creates a node data object for a given node and its descendants.
+   *
+   * `xpath` is computed by the parent while building its children, getXPathTree is only the fallback
+   * for the root of the traversal. A generator so chunked extractions can pause between two nodes.
    */
-  function buildDomTree(node, parentIframe = null, isParentHighlighted = false) {
+  function* buildDomTree(node, parentIframe = null, isParentHighlighted = false, xpath = undefined) {
     // Fast rejection checks first
     if (!node || node.id === HIGHLIGHT_CONTAINER_ID || 
         (node.nodeType !== Node.ELEMENT_NODE && node.nodeType !== Node.TEXT_NODE)) {
@@ -1160,11 +1552,21 @@
 
     if (debugMode) PERF_METRICS.nodeMetrics.totalNodes++;
 
+    if (isSliceOver()) {
+      yield;
+      if (!node.isConnected) return null; // removed by the page in the meantime
+    }
+
     if (!node || node.id === HIGHLIGHT_CONTAINER_ID) {
       if (debugMode) PERF_METRICS.nodeMetrics.skippedNodes++;
       return null;
     }
 
+    if (budgeted && node !== document.body && isOverBudget()) {
+      if (debugMode) PERF_METRICS.nodeMetrics.skippedNodes++;
+      return null;
+    }
+
     // Special handling for root node (body)
     if (node === document.body) {
       const nodeData = {
@@ -1174,13 +1576,11 @@
         children: [],
       };
 
-      // Process children of body
-      for (const child of node.childNodes) {
-        const domElement = buildDomTree(child, parentIframe, false); // Body's children have no highlighted parent initially
-        if (domElement) nodeData.children.push(domElement);
-      }
+      // Process children of body, they have no highlighted parent initially
+      // their xpaths start from the real path of body (html/body), not from the '/body' it reports
+      yield* buildChildren(node, xpath ?? getXPathTree(node, true), nodeData.children, parentIframe, false);
 
-      const id = `${ID.current++}`;
+      const id = nextNodeId(node);
       DOM_HASH_MAP[id] = nodeData;
       if (debugMode) PERF_METRICS.nodeMetrics.processedNodes++;
       return id;
@@ -1207,7 +1607,7 @@
         return null;
       }
 
-      const id = `${ID.current++}`;
+      const id = nextNodeId(node);
       DOM_HASH_MAP[id] = {
         type: "TEXT_NODE",
         text: textContent,
@@ -1236,12 +1636,7 @@
 
       // Use getBoundingClientRect for the quick OUTSIDE check.
       // isInExpandedViewport will do the more accurate check later if needed.
-      if (!rect || (!isFixedOrSticky && !hasSize && (
-        rect.bottom < -viewportExpansion ||
-        rect.top > window.innerHeight + viewportExpansion ||
-        rect.right < -viewportExpansion ||
-        rect.left > window.innerWidth + viewportExpansion
-      ))) {
+      if (!rect || (!isFixedOrSticky && !hasSize && isRectOutsideViewport(rect, viewportExpansion, node))) {
         // console.log("Skipping node outside viewport (quick check):", node.tagName, rect);
         if (debugMode) PERF_METRICS.nodeMetrics.skippedNodes++;
         return null;
@@ -1252,7 +1647,7 @@
     const nodeData = {
       tagName: node.tagName.toLowerCase(),
       attributes: {},
-      xpath: getXPathTree(node, true),
+      xpath: xpath ?? getXPathTree(node, true),
       children: [],
     };
 
@@ -1285,12 +1680,10 @@
       // Handle iframes
       if (tagName === "iframe") {
         try {
-          const iframeDoc = node.contentDocument || node.contentWindow?.document;
+          const iframeDoc = descendIntoIframes ? (node.contentDocument || node.contentWindow?.document) : null;
           if (iframeDoc) {
-            for (const child of iframeDoc.childNodes) {
-              const domElement = buildDomTree(child, node, false);
-              if (domElement) nodeData.children.push(domElement);
-            }
+            observeRoot(iframeDoc);
+            yield* buildChildren(iframeDoc, '', nodeData.children, node, false);
           }
         } catch (e) {
           console.warn("Unable to access iframe:", e);
@@ -1305,27 +1698,17 @@
         (tagName === "body" && node.getAttribute("data-id")?.startsWith("mce_"))
       ) {
         // Process all child nodes to capture formatted text
-        for (const child of node.childNodes) {
-          const domElement = buildDomTree(child, parentIframe, nodeWasHighlighted);
-          if (domElement) nodeData.children.push(domElement);
-        }
+        yield* buildChildren(node, nodeData.xpath, nodeData.children, parentIframe, nodeWasHighlighted);
       }
       else {
         // Handle shadow DOM
         if (node.shadowRoot) {
           nodeData.shadowRoot = true;
-          for (const child of node.shadowRoot.childNodes) {
-            const domElement = buildDomTree(child, parentIframe, nodeWasHighlighted);
-            if (domElement) nodeData.children.push(domElement);
-          }
-        }
-        // Handle regular elements
-        for (const child of node.childNodes) {
-          // Pass the highlighted status of the *current* node to its children
-          const passHighlightStatusToChild = nodeWasHighlighted || isParentHighlighted;
-          const domElement = buildDomTree(child, parentIframe, passHighlightStatusToChild);
-          if (domElement) nodeData.children.push(domElement);
+          observeRoot(node.shadowRoot);
+          yield* buildChildren(node.shadowRoot, '', nodeData.children, parentIframe, nodeWasHighlighted);
         }
+        // Handle regular elements, passing the highlighted status of the *current* node to its children
+        yield* buildChildren(node, nodeData.xpath, nodeData.children, parentIframe, nodeWasHighlighted || isParentHighlighted);
       }
     }
 
@@ -1335,7 +1718,7 @@
       return null;
     }
 
-    const id = `${ID.current++}`;
+    const id = nextNodeId(node);
     DOM_HASH_MAP[id] = nodeData;
     if (debugMode) PERF_METRICS.nodeMetrics.processedNodes++;
     return id;
@@ -1351,7 +1734,38 @@
   isTextNodeVisible = measureTime(isTextNodeVisible);
   getEffectiveScroll = measureTime(getEffectiveScroll);
 
-  const rootId = buildDomTree(document.body);
+  const viewportState = JSON.stringify([
+    window.scrollX, window.scrollY, window.innerWidth, window.innerHeight,
+    doHighlightElements, focusHighlightIndex, viewportExpansion,
+  ]);
+
+  // Nothing changed since the snapshot the caller already holds: only redraw the overlays
+  if (registry && !registry.dirty && registry.rootId !== null &&
+      registry.lastState === viewportState && incrementalBase === registry.version) {
+    const highlights = registry.highlighted.filter(({ index }) => focusHighlightIndex < 0 || focusHighlightIndex === index);
+    const geometries = doHighlightElements ? highlightElements(highlights) : null;
+    registry.observer.takeRecords();
+    const unchanged = { rootId: registry.rootId, map: {}, removed: [], version: registry.version, full: false };
+    if (collectMarks) unchanged.marks = getMarks(highlights, geometries);
+    return unchanged;
+  }
+
+  // buildDomTree only yields when a slice is over, without chunking the traversal stays one synchronous task
+  const traversal = buildDomTree(document.body);
+  let step = traversal.next();
+  while (!step.done) {
+    await yieldToPage();
+    // the page may have scrolled or changed while it had the main thread
+    DOM_CACHE.clearCache();
+    sliceStart = performance.now();
+    step = traversal.next();
+  }
+  const rootId = step.value;
+
+  // The overlays are only written once the traversal is done, so its layout reads never follow a write
+  // and the marks reuse the boxes of that read phase
+  const highlights = HIGHLIGHTED.filter(({ index }) => focusHighlightIndex < 0 || focusHighlightIndex === index);
+  const overlayGeometries = doHighlightElements && drawHighlights ? highlightElements(highlights) : null;
 
   // Clear the cache before starting
   DOM_CACHE.clearCache();
@@ -1406,7 +1820,192 @@
     }
   }
 
+  /**
+   * Encodes a node map into parallel arrays so repeated keys, tag names,
+   * attribute names and values are only transferred once.
+   *
+   * flags: 1 text node, 2 visible, 4 top element, 8 interactive, 16 in viewport, 32 shadow root
+   * strings[i] is the xpath of an element or the text of a text node.
+   * Attributes and children of row i live in [offsets[i], offsets[i + 1]).
+   * Frame ids and viewports are sparse: frameIds[k] belongs to row frameRows[k], the width and height
+   * at viewportSizes[2k] to row viewportRows[k].
+   */
+  function encodeColumnar(map) {
+    const tagTable = [];
+    const tagIndex = new Map();
+    const attrNameTable = [];
+    const attrNameIndex = new Map();
+    const stringTable = [];
+    const stringIndex = new Map();
+
+    const intern = (value, table, index) => {
+      let i = index.get(value);
+      if (i === undefined) {
+        i = table.length;
+        table.push(value);
+        index.set(value, i);
+      }
+      return i;
+    };
+
+    const ids = [];
+    const flags = [];
+    const tags = [];
+    const strings = [];
+    const highlightIndices = [];
+    const attrOffsets = [0];
+    const attrNames = [];
+    const attrValues = [];
+    const childOffsets = [0];
+    const childIds = [];
+    const frameRows = [];
+    const frameIds = [];
+    const viewportRows = [];
+    const viewportSizes = [];
+
+    for (const [id, nodeData] of Object.entries(map)) {
+      ids.push(+id);
+      if (nodeData.type === "TEXT_NODE") {
+        flags.push(1 | (nodeData.isVisible ? 2 : 0));
+        tags.push(-1);
+        strings.push(intern(nodeData.text, stringTable, stringIndex));
+        highlightIndices.push(-1);
+        attrOffsets.push(attrNames.length);
+        childOffsets.push(childIds.length);
+        continue;
+      }
+
+      flags.push(
+        (nodeData.isVisible ? 2 : 0) |
+        (nodeData.isTopElement ? 4 : 0) |
+        (nodeData.isInteractive ? 8 : 0) |
+        (nodeData.isInViewport ? 16 : 0) |
+        (nodeData.shadowRoot ? 32 : 0)
+      );
+      tags.push(intern(nodeData.tagName, tagTable, tagIndex));
+      strings.push(intern(nodeData.xpath, stringTable, stringIndex));
+      highlightIndices.push(nodeData.highlightIndex ?? -1);
+
+      for (const [name, value] of Object.entries(nodeData.attributes || {})) {
+        attrNames.push(intern(name, attrNameTable, attrNameIndex));
+        attrValues.push(intern(value, stringTable, stringIndex));
+      }
+      attrOffsets.push(attrNames.length);
+
+      for (const childId of nodeData.children || []) childIds.push(+childId);
+      childOffsets.push(childIds.length);
+
+      if (nodeData.frameId) {
+        frameRows.push(ids.length - 1);
+        frameIds.push(intern(nodeData.frameId, stringTable, stringIndex));
+      }
+      if (nodeData.viewport) {
+        viewportRows.push(ids.length - 1);
+        viewportSizes.push(nodeData.viewport.width, nodeData.viewport.height);
+      }
+    }
+
+    return {
+      tagTable, attrNameTable, stringTable,
+      ids, flags, tags, strings, highlightIndices,
+      attrOffsets, attrNames, attrValues,
+      childOffsets, childIds,
+      frameRows, frameIds, viewportRows, viewportSizes,
+    };
+  }
+
+  /**
+   * Drops every node the element list of the prompt does not need. What is left are the highlighted
+   * elements with the text they own moved up to be their direct children, the loose text lines (text
+   * without a highlighted ancestor under a visible top element), the <iframe> elements and the
+   * ancestors of all of these, which the caller only reads when it walks up from an element.
+   */
+  function pruneForPrompt(map, rootId) {
+    const pruned = {};
+
+    // returns whether the node is kept, owned text is collected in ownerTexts instead
+    function visit(id, parentData, ownerTexts) {
+      const nodeData = map[id];
+      if (!nodeData) return false;
+      if (nodeData.type === 'TEXT_NODE') {
+        if (ownerTexts) {
+          pruned[id] = nodeData;
+          ownerTexts.push(id);
+          return false;
+        }
+        if (!parentData?.isVisible || !parentData.isTopElement) return false;
+        pruned[id] = nodeData;
+        return true;
+      }
+
+      const isOwner = nodeData.highlightIndex !== undefined && nodeData.highlightIndex !== null;
+      const texts = isOwner ? [] : ownerTexts;
+      const children = [];
+      for (const childId of nodeData.children || []) {
+        if (visit(childId, nodeData, texts)) children.push(childId);
+      }
+      if (isOwner) children.unshift(...texts);
+      if (!isOwner && !children.length && nodeData.tagName !== 'iframe' && id !== rootId) return false;
+      pruned[id] = { ...nodeData, children };
+      return true;
+    }
+
+    visit(rootId, null, null);
+    return pruned;
+  }
+
+  // In incremental mode only ship the nodes that differ from the snapshot the caller holds
+  let resultMap = DOM_HASH_MAP;
+  const delta = {};
+  if (registry) {
+    const sendFull = incrementalBase !== registry.version;
+    const removed = [];
+    if (!sendFull) {
+      resultMap = {};
+      for (const [id, nodeData] of Object.entries(DOM_HASH_MAP)) {
+        if (!sameNodeData(registry.nodes[id], nodeData)) resultMap[id] = nodeData;
+      }
+      for (const id of Object.keys(registry.nodes)) {
+        if (!(id in DOM_HASH_MAP)) removed.push(id);
+      }
+    }
+
+    registry.version++;
+    registry.nodes = DOM_HASH_MAP;
+    registry.rootId = rootId;
+    registry.lastState = viewportState;
+    registry.highlighted = HIGHLIGHTED;
+    registry.dirty = false;
+    // records queued during this pass are our own overlays
+    registry.observer.takeRecords();
+
+    Object.assign(delta, { removed, version: registry.version, full: sendFull });
+  }
+
+  // Lets the caller draw the overlays afterwards, e.g. with indices renumbered across frames
+  const run = { highlighted: HIGHLIGHTED, highlightElements };
+  if (runName) {
+    window._domTreeRuns = { ...window._domTreeRuns, [runName]: run };
+  } else {
+    window._domTreeLastRun = run;
+  }
+
+  if (minimal) resultMap = pruneForPrompt(resultMap, rootId);
+
+  const payload = wireFormat === 'columnar' ?
+    { columns: encodeColumnar(resultMap), highlightCount: highlightIndex } :
+    { map: resultMap, highlightCount: highlightIndex };
+  if (truncated) {
+    payload.truncated = true;
+  }
+  if (collectMarks) {
+    payload.marks = getMarks(highlights, overlayGeometries);
+  }
+  if (tileScrollPages) {
+    payload.tile = { fromScrollY: window.scrollY, scrollY: tileScrollY };
+  }
+
   return debugMode ?
-    { rootId, map: DOM_HASH_MAP, perfMetrics: PERF_METRICS } :
-    { rootId, map: DOM_HASH_MAP };
+    { rootId, ...payload, ...delta, perfMetrics: PERF_METRICS } :
+    { rootId, ...payload, ...delta };
 };
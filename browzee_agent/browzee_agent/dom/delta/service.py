@@ -0,0 +1,77 @@
+import re
+
+from browzee_agent.dom.accessibility.service import AccessibilityTreeSerializer
+from browzee_agent.dom.delta.views import ElementDelta, ElementSnapshot
+from browzee_agent.dom.views import DOMElementNode, DOMTextNode, iter_element_texts
+from browzee_agent.utils import time_execution_sync
+
+_INDEX_INDICATOR = re.compile(r'\*?\[\d+\]\*?')
+
+
+class ElementDeltaBuilder:
+	"""
+	Compares the interactive elements of two states of the same page, for the state messages that only
+	send what changed since the last full element list.
+
+	Elements are matched by the hash of their xpath and tag path (see `DOMElementNode.hash`), so an element
+	keeps its identity when the elements before it appear or disappear and its index changes.
+	"""
+
+	@staticmethod
+	@time_execution_sync('--element_snapshot')
+	def snapshot(
+		root: DOMElementNode,
+		url: str,
+		include_attributes: list[str] | None = None,
+		max_text_length: int | None = None,
+		element_format: str = 'html',
+	) -> ElementSnapshot:
+		elements: dict[str, tuple[int, str]] = {}
+		texts: dict[str, str] = {}
+
+		for item in iter_element_texts(root, max_text_length=max_text_length):
+			node = item.node
+			if isinstance(node, DOMTextNode):
+				text = item.text.strip()
+				if max_text_length is not None and len(text) > max_text_length:
+					text = text[:max_text_length] + '...'
+				texts[f'{node.parent.xpath}\n{text}'] = text  # type: ignore
+				continue
+
+			if element_format == 'accessibility':
+				role = AccessibilityTreeSerializer.role(node)
+				name = AccessibilityTreeSerializer.name(node, role, item.text, max_text_length)
+				line = AccessibilityTreeSerializer.line(node, 0, role, name, max_text_length)
+			else:
+				line = node._clickable_element_line(0, item.text, include_attributes, max_text_length)
+			hashed = node.hash
+			identity = f'{hashed.branch_path_hash}-{hashed.xpath_hash}'
+			# same xpath and tag path in two frames or shadow roots
+			while identity in elements:
+				identity += '+'
+			elements[identity] = (node.highlight_index, _INDEX_INDICATOR.sub('', line, count=1))
+
+		return ElementSnapshot(url=url, elements=elements, texts=texts)
+
+	@staticmethod
+	def diff(base: ElementSnapshot, current: ElementSnapshot, keep: set[int] | None = None) -> ElementDelta:
+		"""With keep, the elements missing from the base only count as added when their index is in it"""
+		delta = ElementDelta()
+		for identity, (index, line) in current.elements.items():
+			previous = base.elements.get(identity)
+			if previous is None:
+				if keep is None or index in keep:
+					delta.added.append((index, line))
+			elif previous[1] != line:
+				delta.changed.append((previous[0], index, line))
+			elif previous[0] != index:
+				delta.renumbered.append((previous[0], index))
+		delta.removed = sorted(index for identity, (index, _) in base.elements.items() if identity not in current.elements)
+
+		delta.added_texts = [text for key, text in current.texts.items() if key not in base.texts and text]
+		delta.removed_texts = [text for key, text in base.texts.items() if key not in current.texts and text]
+
+		delta.added.sort()
+		delta.changed.sort(key=lambda change: change[1])
+		delta.renumbered.sort()
+		return delta
@@ -0,0 +1,57 @@
+from dataclasses import dataclass, field
+
+
+@dataclass
+class ElementSnapshot:
+	"""The lines of the interactive elements of one state, keyed by an identity that survives renumbering"""
+
+	url: str
+	# identity -> (highlight index, line without its index)
+	elements: dict[str, tuple[int, str]]
+	# texts outside of the interactive elements, by parent xpath and content
+	texts: dict[str, str]
+
+
+@dataclass
+class ElementDelta:
+	"""Changes of the interactive elements between two snapshots of the same page"""
+
+	added: list[tuple[int, str]] = field(default_factory=list)
+	# (old index, new index, new line)
+	changed: list[tuple[int, int, str]] = field(default_factory=list)
+	# indices in the older snapshot
+	removed: list[int] = field(default_factory=list)
+	# (old index, new index) of unchanged elements
+	renumbered: list[tuple[int, int]] = field(default_factory=list)
+	added_texts: list[str] = field(default_factory=list)
+	removed_texts: list[str] = field(default_factory=list)
+
+	def is_empty(self) -> bool:
+		return not (
+			self.added or self.changed or self.removed or self.renumbered or self.added_texts or self.removed_texts
+		)
+
+	def to_string(self) -> str:
+		if self.is_empty():
+			return 'No changes since the element list above.'
+
+		lines = ['Changes since the element list above, the elements not listed are unchanged and keep their index:']
+		if self.added:
+			lines.append('added:')
+			lines.extend(f'\t[{index}]{line}' for index, line in self.added)
+		if self.changed:
+			lines.append('changed:')
+			lines.extend(
+				f'\t[{old}]{line}' if old == new else f'\t[{old}]->[{new}]{line}' for old, new, line in self.changed
+			)
+		if self.removed:
+			lines.append('removed: ' + ' '.join(f'[{index}]' for index in self.removed))
+		if self.renumbered:
+			lines.append('renumbered: ' + ' '.join(f'[{old}]->[{new}]' for old, new in self.renumbered))
+		if self.added_texts:
+			lines.append('new text:')
+			lines.extend(f'\t{text}' for text in self.added_texts)
+		if self.removed_texts:
+			lines.append('removed text:')
+			lines.extend(f'\t{text}' for text in self.removed_texts)
+		return '\n'.join(lines)
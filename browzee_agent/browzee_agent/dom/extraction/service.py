@@ -0,0 +1,930 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field, replace
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
+
+from browzee_agent.dom.extraction.views import (
+	AD_FRAME_DOMAINS,
+	ALWAYS_ACCEPTED_TAGS,
+	DISTINCT_INTERACTION_ATTRIBUTES,
+	DISTINCT_INTERACTIVE_ROLES,
+	DISTINCT_INTERACTIVE_TAGS,
+	HIGHLIGHT_COLORS,
+	HIGHLIGHT_CONTAINER_ID,
+	INTERACTIVE_CANDIDATE_ATTRIBUTES,
+	INTERACTIVE_CANDIDATE_TAGS,
+	INTERACTIVE_CURSORS,
+	INTERACTIVE_ELEMENT_ROLES,
+	INTERACTIVE_ELEMENTS,
+	LEAF_ELEMENT_DENY_LIST,
+	MOUSE_EVENT_ATTRIBUTES,
+	NON_INTERACTIVE_CURSORS,
+	DomBackendName,
+	DomExtractionArgs,
+)
+
+if TYPE_CHECKING:
+	from patchright.async_api import Frame
+
+	from browzee_agent.dom.service import DomService
+
+logger = logging.getLogger(__name__)
+
+
+class DomExtractionBackend(ABC):
+	"""
+	Extracts the DOM of a page into the result format of buildDomTree.js
+	({'rootId': ..., 'map': {id: node_data}} or the columnar variant), which DomService turns into a `DOMState`.
+	"""
+
+	name: DomBackendName
+	supports_incremental: bool = False
+	# whether the page keeps the highlighted elements by index, see `DomService.get_element_handle`
+	keeps_element_registry: bool = False
+
+	@abstractmethod
+	async def extract(self, dom_service: 'DomService', args: DomExtractionArgs) -> dict:
+		pass
+
+
+def is_ad_frame_url(url: str) -> bool:
+	return any(domain in urlparse(url).netloc for domain in AD_FRAME_DOMAINS)
+
+
+class JsDomExtractionBackend(DomExtractionBackend):
+	"""Injects buildDomTree.js, which inspects every element from the page's main thread"""
+
+	name = 'js'
+	supports_incremental = True
+	keeps_element_registry = True
+
+	async def extract(self, dom_service: 'DomService', args: DomExtractionArgs) -> dict:
+		if args.per_frame:
+			return await self._extract_per_frame(dom_service, args)
+		return await dom_service.evaluate_build_dom_tree(dom_service.page, args.to_js_args())
+
+	async def _extract_per_frame(self, dom_service: 'DomService', args: DomExtractionArgs) -> dict:
+		"""
+		Run buildDomTree.js in every frame at once, including out-of-process iframes the main frame
+		cannot reach, and stitch the results under their <iframe> nodes.
+
+		Sub-frames are extracted without drawing; once the highlight indices are renumbered across
+		frames, their overlays are drawn in a second concurrent round.
+		"""
+		page = dom_service.page
+		dom_service.forget_detached_frames()
+		main_args = replace(args, incremental=False, incremental_base=None, wire_format='json', descend_into_iframes=False)
+		frame_args = replace(main_args, draw_highlights=False, focus_element=-1).to_js_args()
+
+		frames = [
+			frame
+			for frame in page.frames
+			if frame is not page.main_frame and not frame.is_detached() and not is_ad_frame_url(frame.url)
+		]
+
+		async def extract_frame(frame: 'Frame') -> tuple[str, dict]:
+			frame_element = await frame.frame_element()
+			iframe_xpath = await frame_element.evaluate(IFRAME_XPATH_JS)
+			return iframe_xpath, await dom_service.evaluate_build_dom_tree(frame, frame_args)
+
+		main_result, *frame_results = await asyncio.gather(
+			dom_service.evaluate_build_dom_tree(page.main_frame, main_args.to_js_args()),
+			*(extract_frame(frame) for frame in frames),
+			return_exceptions=True,
+		)
+		if isinstance(main_result, BaseException):
+			raise main_result
+
+		stitcher = FrameTreeStitcher(main_result)
+		for frame, result in zip(frames, frame_results):
+			if isinstance(result, BaseException):
+				logger.debug(f'Skipping frame {frame.url}: {type(result).__name__}: {result}')
+				continue
+			iframe_xpath, frame_result = result
+			parent_frame = frame.parent_frame
+			parent_frame_id = None if parent_frame is None or parent_frame is page.main_frame else dom_service.frame_id(parent_frame)
+			stitcher.add_frame(dom_service.frame_id(frame), parent_frame_id, iframe_xpath, frame_result)
+		eval_page = stitcher.stitch()
+		dom_service.highlight_offsets = dict(stitcher.highlight_offsets)
+
+		if args.highlight_elements and args.draw_highlights and stitcher.highlight_offsets:
+			frames_by_id = {dom_service.frame_id(frame): frame for frame in frames}
+			await asyncio.gather(
+				*(
+					frames_by_id[frame_id].evaluate(
+						REPLAY_HIGHLIGHTS_JS, {'offset': offset, 'focusHighlightIndex': args.focus_element, 'runName': None}
+					)
+					for frame_id, offset in stitcher.highlight_offsets.items()
+				),
+				return_exceptions=True,
+			)
+		return eval_page
+
+
+@dataclass
+class _FrameResult:
+	frame_id: str
+	parent_frame_id: str | None
+	iframe_xpath: str
+	result: dict
+	children: list['_FrameResult'] = field(default_factory=list)
+
+
+class FrameTreeStitcher:
+	"""
+	Merges buildDomTree.js results of several frames into one result, as if the main frame had
+	walked into every iframe itself.
+
+	Each frame result is attached to the first unclaimed <iframe> node of its parent frame with
+	the same xpath, which gets the frame id recorded. Ids of sub-frame nodes are prefixed with the
+	frame id, and highlight indices continue after the ones of the main frame, frame by frame in
+	document order. Frames whose <iframe> is not part of the parent tree (hidden, filtered) are dropped.
+	"""
+
+	def __init__(self, main_result: dict):
+		self.main = _FrameResult(frame_id='', parent_frame_id=None, iframe_xpath='', result=main_result)
+		self.frames: dict[str, _FrameResult] = {}
+		# frame id -> offset added to its highlight indices
+		self.highlight_offsets: dict[str, int] = {}
+
+	def add_frame(self, frame_id: str, parent_frame_id: str | None, iframe_xpath: str, result: dict) -> None:
+		self.frames[frame_id] = _FrameResult(frame_id, parent_frame_id, iframe_xpath, result)
+
+	def stitch(self) -> dict:
+		for frame in self.frames.values():
+			parent = self.main if frame.parent_frame_id is None else self.frames.get(frame.parent_frame_id)
+			if parent is not None:
+				parent.children.append(frame)
+
+		next_highlight_index = 0
+		# number the highlights frame by frame, in pre-order of the frame tree
+		pending = [self.main]
+		attached: list[_FrameResult] = []
+		while pending:
+			frame = pending.pop()
+			attached.append(frame)
+			offset = next_highlight_index
+			next_highlight_index += self._highlight_count(frame.result)
+			if frame is not self.main:
+				self._namespace(frame)
+				self.highlight_offsets[frame.frame_id] = offset
+			if offset:
+				for node_data in frame.result['map'].values():
+					if node_data.get('highlightIndex') is not None:
+						node_data['highlightIndex'] += offset
+			pending.extend(reversed(self._attach_children(frame)))
+
+		# children before parents, like the ids of a single buildDomTree.js run
+		node_map: dict[str, dict] = {}
+		for frame in reversed(attached):
+			node_map.update(frame.result['map'])
+
+		eval_page = {'rootId': str(self.main.result['rootId']), 'map': node_map}
+		if any(frame.result.get('truncated') for frame in attached):
+			eval_page['truncated'] = True
+		return eval_page
+
+	@staticmethod
+	def _namespace(frame: _FrameResult) -> None:
+		"""Prefix the node ids of a sub-frame with its frame id, they restart at 0 in every frame"""
+		prefix = f'{frame.frame_id}:'
+		node_map = {}
+		for id, node_data in frame.result['map'].items():
+			if 'children' in node_data:
+				node_data['children'] = [f'{prefix}{child_id}' for child_id in node_data['children']]
+			node_map[f'{prefix}{id}'] = node_data
+		frame.result['map'] = node_map
+
+	def _attach_children(self, frame: _FrameResult) -> list[_FrameResult]:
+		"""Hook the sub-frames of `frame` under their <iframe> nodes, returned in document order"""
+		# <iframe> elements have no element children, so their order in the map is the document order
+		iframes_by_xpath: dict[str, list[tuple[int, dict]]] = {}
+		for position, node_data in enumerate(frame.result['map'].values()):
+			if node_data.get('tagName') == 'iframe':
+				iframes_by_xpath.setdefault(node_data['xpath'], []).append((position, node_data))
+
+		attached: list[tuple[int, _FrameResult]] = []
+		for child in frame.children:
+			candidates = iframes_by_xpath.get(child.iframe_xpath)
+			if not candidates:
+				logger.debug(f'No <iframe> node found for frame {child.frame_id} at {child.iframe_xpath}')
+				continue
+			position, iframe = candidates.pop(0)
+			iframe['frameId'] = child.frame_id
+			iframe['children'] = iframe.get('children', []) + [f'{child.frame_id}:{child.result["rootId"]}']
+			attached.append((position, child))
+
+		return [child for _, child in sorted(attached, key=lambda item: item[0])]
+
+	@staticmethod
+	def _highlight_count(result: dict) -> int:
+		if 'highlightCount' in result:
+			return result['highlightCount']
+		indices = [node_data.get('highlightIndex') for node_data in result['map'].values()]
+		return max((index for index in indices if index is not None), default=-1) + 1
+
+
+class CdpSnapshotDomExtractionBackend(DomExtractionBackend):
+	"""
+	Builds the tree from `DOMSnapshot.captureSnapshot` (layout boxes, computed styles, paint order)
+	and the accessibility tree. The browser computes the whole snapshot at once, so page JS is not
+	blocked by per-element style and layout calls; only the highlight overlays are drawn with a
+	single small script. Chromium only.
+	"""
+
+	name = 'cdp'
+
+	COMPUTED_STYLES = ['display', 'visibility', 'opacity', 'cursor', 'pointer-events', 'position']
+
+	async def extract(self, dom_service: 'DomService', args: DomExtractionArgs) -> dict:
+		page = dom_service.page
+		start = time.time()
+
+		cdp_session = await page.context.new_cdp_session(page)
+		try:
+			snapshot, layout_metrics = await asyncio.gather(
+				cdp_session.send(
+					'DOMSnapshot.captureSnapshot',
+					{
+						'computedStyles': self.COMPUTED_STYLES,
+						'includePaintOrder': True,
+						'includeDOMRects': True,
+					},
+				),
+				cdp_session.send('Page.getLayoutMetrics'),
+			)
+			ax_roles = await self._get_ax_roles(cdp_session, snapshot)
+		finally:
+			await cdp_session.detach()
+		capture_time = time.time() - start
+
+		layout_viewport = layout_metrics.get('cssLayoutViewport') or layout_metrics['layoutViewport']
+		builder = SnapshotTreeBuilder(
+			snapshot,
+			ax_roles,
+			viewport_size=(layout_viewport['clientWidth'], layout_viewport['clientHeight']),
+			args=args,
+		)
+		eval_page = builder.build()
+
+		if args.highlight_elements and args.draw_highlights and builder.highlights:
+			await page.evaluate(DRAW_HIGHLIGHTS_JS, {'containerId': HIGHLIGHT_CONTAINER_ID, 'highlights': builder.highlights})
+		if args.collect_marks:
+			device_layout_viewport = layout_metrics['layoutViewport']
+			eval_page['marks'] = {
+				'boxes': [
+					[highlight['index'], highlight['left'], highlight['top'], highlight['width'], highlight['height']]
+					for highlight in builder.highlights
+				],
+				'devicePixelRatio': device_layout_viewport['clientWidth'] / (layout_viewport['clientWidth'] or 1),
+			}
+
+		if args.debug_mode:
+			eval_page['perfMetrics'] = {
+				'backend': self.name,
+				'captureTime': capture_time,
+				'buildTime': time.time() - start - capture_time,
+				'nodes': len(eval_page['map']),
+			}
+		return eval_page
+
+	async def _get_ax_roles(self, cdp_session, snapshot: dict) -> dict[int, str]:
+		"""Computed ARIA role per backend node id, for every frame of the snapshot"""
+		strings = snapshot['strings']
+		frame_ids = [strings[document['frameId']] for document in snapshot['documents'] if document.get('frameId', -1) >= 0]
+		requests = [cdp_session.send('Accessibility.getFullAXTree', {'frameId': frame_id}) for frame_id in frame_ids]
+		if not requests:
+			requests = [cdp_session.send('Accessibility.getFullAXTree')]
+
+		roles: dict[int, str] = {}
+		for result in await asyncio.gather(*requests, return_exceptions=True):
+			if isinstance(result, BaseException):
+				logger.debug(f'Failed to get accessibility tree: {type(result).__name__}: {result}')
+				continue
+			for ax_node in result.get('nodes', []):
+				backend_node_id = ax_node.get('backendDOMNodeId')
+				role = (ax_node.get('role') or {}).get('value')
+				if backend_node_id is not None and role and not ax_node.get('ignored'):
+					roles[backend_node_id] = role
+		return roles
+
+
+DOM_EXTRACTION_BACKENDS: dict[str, type[DomExtractionBackend]] = {
+	JsDomExtractionBackend.name: JsDomExtractionBackend,
+	CdpSnapshotDomExtractionBackend.name: CdpSnapshotDomExtractionBackend,
+}
+
+
+def get_dom_extraction_backend(name: DomBackendName) -> DomExtractionBackend:
+	try:
+		return DOM_EXTRACTION_BACKENDS[name]()
+	except KeyError:
+		raise ValueError(f'Unknown DOM extraction backend: {name}. Available: {list(DOM_EXTRACTION_BACKENDS)}')
+
+
+_ELEMENT_NODE = 1
+_TEXT_NODE = 3
+_DOCUMENT_FRAGMENT_NODE = 11
+
+_HIT_TEST_CELL_SIZE = 256
+
+
+class _SnapshotDocument:
+	"""Index over one document of a DOMSnapshot result"""
+
+	def __init__(self, document: dict, strings: list[str], computed_styles: list[str]):
+		self.strings = strings
+		nodes = document['nodes']
+		self.parent_index: list[int] = nodes['parentIndex']
+		self.node_type: list[int] = nodes['nodeType']
+		self.node_name: list[int] = nodes['nodeName']
+		self.node_value: list[int] = nodes.get('nodeValue', [])
+		self.backend_node_id: list[int] = nodes.get('backendNodeId', [])
+		self.raw_attributes: list[list[int]] = nodes.get('attributes', [])
+		self.scroll_x: float = document.get('scrollOffsetX', 0)
+		self.scroll_y: float = document.get('scrollOffsetY', 0)
+
+		self.is_clickable = set(nodes.get('isClickable', {}).get('index', []))
+		self.pseudo_elements = set(nodes.get('pseudoType', {}).get('index', []))
+		content_document = nodes.get('contentDocumentIndex', {})
+		self.content_document_index = dict(zip(content_document.get('index', []), content_document.get('value', [])))
+
+		self.children: list[list[int]] = [[] for _ in self.parent_index]
+		for index, parent in enumerate(self.parent_index):
+			if parent >= 0:
+				self.children[parent].append(index)
+
+		layout = document.get('layout', {})
+		self.bounds: dict[int, list[float]] = {}
+		self.styles: dict[int, dict[str, str]] = {}
+		self.paint_order: dict[int, int] = {}
+		paint_orders = layout.get('paintOrders', [])
+		for position, node_index in enumerate(layout.get('nodeIndex', [])):
+			if node_index in self.bounds:
+				continue
+			self.bounds[node_index] = layout['bounds'][position]
+			self.styles[node_index] = {
+				name: strings[value] if value >= 0 else ''
+				for name, value in zip(computed_styles, layout['styles'][position])
+			}
+			if position < len(paint_orders):
+				self.paint_order[node_index] = paint_orders[position]
+
+		self._attributes: dict[int, dict[str, str]] = {}
+		self._positions: dict[int, int] = {}
+		self._hit_test_grid: dict[tuple[int, int], list[tuple]] | None = None
+
+	def name(self, index: int) -> str:
+		return self.strings[self.node_name[index]].lower()
+
+	def value(self, index: int) -> str:
+		if index >= len(self.node_value) or self.node_value[index] < 0:
+			return ''
+		return self.strings[self.node_value[index]]
+
+	def attributes(self, index: int) -> dict[str, str]:
+		attributes = self._attributes.get(index)
+		if attributes is None:
+			raw = self.raw_attributes[index] if index < len(self.raw_attributes) else []
+			attributes = {self.strings[raw[i]]: self.strings[raw[i + 1]] for i in range(0, len(raw) - 1, 2)}
+			self._attributes[index] = attributes
+		return attributes
+
+	def style(self, index: int, name: str) -> str:
+		return self.styles.get(index, {}).get(name, '')
+
+	def is_element(self, index: int) -> bool:
+		return self.node_type[index] == _ELEMENT_NODE and index not in self.pseudo_elements
+
+	def parent_element(self, index: int) -> int:
+		parent = self.parent_index[index]
+		if parent >= 0 and self.is_element(parent):
+			return parent
+		return -1
+
+	def element_position(self, index: int) -> int:
+		"""Same as getElementPosition in buildDomTree.js: 1-based index among siblings with the same tag, 0 if unique"""
+		if index not in self._positions:
+			parent = self.parent_element(index)
+			if parent < 0:
+				self._positions[index] = 0
+			else:
+				siblings_by_name: dict[str, list[int]] = {}
+				for sibling in self.children[parent]:
+					if self.is_element(sibling):
+						siblings_by_name.setdefault(self.name(sibling), []).append(sibling)
+				for siblings in siblings_by_name.values():
+					for position, sibling in enumerate(siblings, start=1):
+						self._positions[sibling] = position if len(siblings) > 1 else 0
+		return self._positions[index]
+
+	def viewport_rect(self, index: int) -> tuple[float, float, float, float] | None:
+		bounds = self.bounds.get(index)
+		if bounds is None:
+			return None
+		x, y, width, height = bounds
+		return x - self.scroll_x, y - self.scroll_y, width, height
+
+	def top_node_at(self, x: float, y: float) -> int:
+		"""Node painted last at a document point, like elementFromPoint"""
+		if self._hit_test_grid is None:
+			self._hit_test_grid = {}
+			for index, (bx, by, width, height) in self.bounds.items():
+				if width <= 0 or height <= 0 or index not in self.paint_order:
+					continue
+				styles = self.styles[index]
+				if styles.get('pointer-events') == 'none' or styles.get('visibility') == 'hidden':
+					continue
+				box = (bx, by, bx + width, by + height, self.paint_order[index], index)
+				for cell_x in range(int(bx // _HIT_TEST_CELL_SIZE), int((bx + width) // _HIT_TEST_CELL_SIZE) + 1):
+					for cell_y in range(int(by // _HIT_TEST_CELL_SIZE), int((by + height) // _HIT_TEST_CELL_SIZE) + 1):
+						self._hit_test_grid.setdefault((cell_x, cell_y), []).append(box)
+
+		top, top_paint_order = -1, -1
+		for x0, y0, x1, y1, paint_order, index in self._hit_test_grid.get(
+			(int(x // _HIT_TEST_CELL_SIZE), int(y // _HIT_TEST_CELL_SIZE)), []
+		):
+			if x0 <= x < x1 and y0 <= y < y1 and paint_order >= top_paint_order:
+				top, top_paint_order = index, paint_order
+		return top
+
+	def is_ancestor_or_self(self, ancestor: int, index: int) -> bool:
+		while index >= 0:
+			if index == ancestor:
+				return True
+			index = self.parent_index[index]
+		return False
+
+
+class _PendingElement:
+	__slots__ = ('node_data', 'children')
+
+	def __init__(self, node_data: dict):
+		self.node_data = node_data
+		self.children: list[str] = node_data['children']
+
+
+class SnapshotTreeBuilder:
+	"""
+	Converts a DOMSnapshot result into the node map of buildDomTree.js, applying the same
+	visibility, top-element, interactivity and highlighting rules from the snapshot data.
+	Ids are assigned bottom up, like in the JS, so children always come before their parent.
+	"""
+
+	def __init__(
+		self,
+		snapshot: dict,
+		ax_roles: dict[int, str],
+		viewport_size: tuple[float, float],
+		args: DomExtractionArgs,
+	):
+		self.strings: list[str] = snapshot['strings']
+		self.documents = [
+			_SnapshotDocument(document, self.strings, CdpSnapshotDomExtractionBackend.COMPUTED_STYLES)
+			for document in snapshot['documents']
+		]
+		self.ax_roles = ax_roles
+		self.viewport_width, self.viewport_height = viewport_size
+		self.args = args
+
+		self.node_map: dict[str, dict] = {}
+		# overlays to draw: index and rects in main viewport coordinates
+		self.highlights: list[dict] = []
+		self._next_id = 0
+		self._highlight_index = 0
+
+	def build(self) -> dict:
+		document = self.documents[0]
+		body = self._find_body(document)
+		if body < 0:
+			root_id = self._add({'tagName': 'body', 'attributes': {}, 'xpath': '/body', 'children': []})
+			return {'rootId': root_id, 'map': self.node_map}
+
+		body_element = _PendingElement({'tagName': 'body', 'attributes': {}, 'xpath': '/body', 'children': []})
+		# stack items: (document index, node index, parent, xpath of the parent, is parent highlighted,
+		#               in iframe, (x, y) offset of the frame, inside contenteditable)
+		# or (None, pending element, parent) to finish an element once its children are done
+		stack: list[tuple] = []
+		for child in reversed(document.children[body]):
+			stack.append((0, child, body_element, 'html/body', False, False, (0, 0), False))
+
+		while stack:
+			item = stack.pop()
+			if item[0] is None:
+				_, pending, parent = item
+				node_data = pending.node_data
+				if node_data['tagName'] == 'a' and not pending.children and not node_data['attributes'].get('href'):
+					continue
+				parent.children.append(self._add(node_data))
+				continue
+			self._visit(stack, *item)
+
+		root_id = self._add(body_element.node_data)
+		return {'rootId': root_id, 'map': self.node_map}
+
+	def _add(self, node_data: dict) -> str:
+		node_id = str(self._next_id)
+		self._next_id += 1
+		self.node_map[node_id] = node_data
+		return node_id
+
+	def _find_body(self, document: _SnapshotDocument) -> int:
+		for html in document.children[0] if document.children else []:
+			if document.is_element(html) and document.name(html) == 'html':
+				for body in document.children[html]:
+					if document.is_element(body) and document.name(body) == 'body':
+						return body
+		return -1
+
+	def _visit(
+		self,
+		stack: list[tuple],
+		document_index: int,
+		index: int,
+		parent: _PendingElement,
+		parent_xpath: str,
+		is_parent_highlighted: bool,
+		in_iframe: bool,
+		frame_offset: tuple[float, float],
+		in_contenteditable: bool,
+	) -> None:
+		document = self.documents[document_index]
+		node_type = document.node_type[index]
+
+		if node_type == _TEXT_NODE:
+			text = document.value(index).strip()
+			parent_element = document.parent_element(index)
+			if not text or parent_element < 0 or document.name(parent_element) == 'script':
+				return
+			parent.children.append(
+				self._add({'type': 'TEXT_NODE', 'text': text, 'isVisible': self._is_text_visible(document, index, parent_element)})
+			)
+			return
+
+		if not document.is_element(index):
+			return
+
+		tag_name = document.name(index)
+		attributes = document.attributes(index)
+		if attributes.get('id') == HIGHLIGHT_CONTAINER_ID:
+			return
+		if tag_name not in ALWAYS_ACCEPTED_TAGS and tag_name in LEAF_ELEMENT_DENY_LIST:
+			return
+
+		expansion = self.args.viewport_expansion
+		rect = document.viewport_rect(index)
+		if expansion != -1 and rect is not None:
+			is_fixed_or_sticky = document.style(index, 'position') in ('fixed', 'sticky')
+			has_size = rect[2] > 0 or rect[3] > 0
+			if not is_fixed_or_sticky and not has_size and not self._rect_in_viewport(rect):
+				return
+
+		parent_element = document.parent_element(index)
+		if document.parent_index[index] >= 0 and document.node_type[document.parent_index[index]] == _DOCUMENT_FRAGMENT_NODE:
+			# direct children of a shadow root have no xpath, see getXPathTree
+			xpath = ''
+		else:
+			position = document.element_position(index)
+			segment = f'{tag_name}[{position}]' if position > 0 else tag_name
+			xpath = f'{parent_xpath}/{segment}' if parent_element >= 0 and parent_xpath else segment
+
+		is_candidate = tag_name in INTERACTIVE_CANDIDATE_TAGS or any(
+			name in attributes for name in INTERACTIVE_CANDIDATE_ATTRIBUTES
+		)
+		is_candidate = is_candidate or attributes.get('contenteditable') == 'true'
+		node_data = {
+			'tagName': tag_name,
+			'attributes': dict(attributes) if is_candidate or tag_name in ('iframe', 'body') else {},
+			'xpath': xpath,
+			'children': [],
+		}
+
+		editable = attributes.get('contenteditable')
+		if editable is not None:
+			in_contenteditable = editable != 'false'
+
+		node_was_highlighted = False
+		node_data['isVisible'] = self._is_element_visible(document, index)
+		if node_data['isVisible']:
+			node_data['isTopElement'] = self._is_top_element(document, index, in_iframe)
+			if node_data['isTopElement']:
+				node_data['isInteractive'] = self._is_interactive(document, index, tag_name, attributes, in_contenteditable)
+				node_was_highlighted = self._handle_highlighting(
+					node_data, document, index, tag_name, attributes, is_parent_highlighted, in_contenteditable, frame_offset
+				)
+
+		pending = _PendingElement(node_data)
+		stack.append((None, pending, parent))
+
+		children: list[tuple] = []
+		if tag_name == 'iframe':
+			content_document_index = document.content_document_index.get(index)
+			if content_document_index is not None and rect is not None:
+				content_document = self.documents[content_document_index]
+				offset = (frame_offset[0] + rect[0], frame_offset[1] + rect[1])
+				for child in content_document.children[0] if content_document.children else []:
+					children.append((content_document_index, child, pending, '', False, True, offset, False))
+		elif (
+			attributes.get('contenteditable') == 'true'
+			or in_contenteditable
+			or attributes.get('id') == 'tinymce'
+			or 'mce-content-body' in attributes.get('class', '').split()
+			or (tag_name == 'body' and attributes.get('data-id', '').startswith('mce_'))
+		):
+			for child in document.children[index]:
+				if document.node_type[child] != _DOCUMENT_FRAGMENT_NODE:
+					children.append(
+						(document_index, child, pending, xpath, node_was_highlighted, in_iframe, frame_offset, in_contenteditable)
+					)
+		else:
+			light_children = []
+			for child in document.children[index]:
+				if document.node_type[child] == _DOCUMENT_FRAGMENT_NODE:
+					node_data['shadowRoot'] = True
+					for shadow_child in document.children[child]:
+						children.append(
+							(document_index, shadow_child, pending, '', node_was_highlighted, in_iframe, frame_offset, in_contenteditable)
+						)
+				else:
+					light_children.append(
+						(
+							document_index,
+							child,
+							pending,
+							xpath,
+							node_was_highlighted or is_parent_highlighted,
+							in_iframe,
+							frame_offset,
+							in_contenteditable,
+						)
+					)
+			children.extend(light_children)
+
+		stack.extend(reversed(children))
+
+	def _rect_in_viewport(self, rect: tuple[float, float, float, float]) -> bool:
+		expansion = self.args.viewport_expansion
+		x, y, width, height = rect
+		return not (
+			y + height < -expansion
+			or y > self.viewport_height + expansion
+			or x + width < -expansion
+			or x > self.viewport_width + expansion
+		)
+
+	def _is_in_expanded_viewport(self, document: _SnapshotDocument, index: int) -> bool:
+		if self.args.viewport_expansion == -1:
+			return True
+		rect = document.viewport_rect(index)
+		if rect is None or rect[2] == 0 or rect[3] == 0:
+			return False
+		return self._rect_in_viewport(rect)
+
+	def _is_element_visible(self, document: _SnapshotDocument, index: int) -> bool:
+		bounds = document.bounds.get(index)
+		return (
+			bounds is not None
+			and bounds[2] > 0
+			and bounds[3] > 0
+			and document.style(index, 'visibility') != 'hidden'
+			and document.style(index, 'display') != 'none'
+		)
+
+	def _is_text_visible(self, document: _SnapshotDocument, index: int, parent_element: int) -> bool:
+		parent_visible = (
+			parent_element in document.bounds
+			and document.style(parent_element, 'display') != 'none'
+			and document.style(parent_element, 'visibility') != 'hidden'
+			and document.style(parent_element, 'opacity') != '0'
+		)
+		if self.args.viewport_expansion == -1:
+			return parent_visible
+
+		rect = document.viewport_rect(index)
+		if rect is None or rect[2] <= 0 or rect[3] <= 0 or not self._rect_in_viewport(rect):
+			return False
+		return parent_visible
+
+	def _is_top_element(self, document: _SnapshotDocument, index: int, in_iframe: bool) -> bool:
+		if self.args.viewport_expansion == -1:
+			return True
+
+		rect = document.viewport_rect(index)
+		if rect is None or rect[2] <= 0 or rect[3] <= 0 or not self._rect_in_viewport(rect):
+			return False
+
+		# elements of iframes are considered top by default
+		if in_iframe:
+			return True
+
+		center_x, center_y = rect[0] + rect[2] / 2, rect[1] + rect[3] / 2
+		# only points inside the viewport can be hit tested, like elementFromPoint
+		if not (0 <= center_x < self.viewport_width and 0 <= center_y < self.viewport_height):
+			return False
+
+		top = document.top_node_at(center_x + document.scroll_x, center_y + document.scroll_y)
+		if top < 0:
+			return False
+		return document.is_ancestor_or_self(index, top)
+
+	def _is_interactive(
+		self,
+		document: _SnapshotDocument,
+		index: int,
+		tag_name: str,
+		attributes: dict[str, str],
+		in_contenteditable: bool,
+	) -> bool:
+		cursor = document.style(index, 'cursor')
+		if tag_name != 'html' and cursor in INTERACTIVE_CURSORS:
+			return True
+
+		if tag_name in INTERACTIVE_ELEMENTS:
+			if cursor in NON_INTERACTIVE_CURSORS:
+				return False
+			return not any(name in attributes for name in ('disabled', 'readonly', 'inert'))
+
+		if attributes.get('contenteditable') == 'true' or in_contenteditable:
+			return True
+
+		classes = attributes.get('class', '').split()
+		if (
+			'button' in classes
+			or 'dropdown-toggle' in classes
+			or attributes.get('data-index')
+			or attributes.get('data-toggle') == 'dropdown'
+			or attributes.get('aria-haspopup') == 'true'
+		):
+			return True
+
+		if (
+			attributes.get('role') in INTERACTIVE_ELEMENT_ROLES
+			or attributes.get('aria-role') in INTERACTIVE_ELEMENT_ROLES
+			or self._ax_role(document, index) in INTERACTIVE_ELEMENT_ROLES
+		):
+			return True
+
+		# isClickable covers click listeners, which buildDomTree.js can only approximate with attributes
+		return index in document.is_clickable or any(name in attributes for name in MOUSE_EVENT_ATTRIBUTES)
+
+	def _is_distinct_interaction(
+		self,
+		document: _SnapshotDocument,
+		index: int,
+		tag_name: str,
+		attributes: dict[str, str],
+		in_contenteditable: bool,
+	) -> bool:
+		return (
+			tag_name == 'iframe'
+			or tag_name in DISTINCT_INTERACTIVE_TAGS
+			or attributes.get('role') in DISTINCT_INTERACTIVE_ROLES
+			or in_contenteditable
+			or attributes.get('contenteditable') == 'true'
+			or any(name in attributes for name in DISTINCT_INTERACTION_ATTRIBUTES)
+		)
+
+	def _ax_role(self, document: _SnapshotDocument, index: int) -> str | None:
+		if index >= len(document.backend_node_id):
+			return None
+		return self.ax_roles.get(document.backend_node_id[index])
+
+	def _handle_highlighting(
+		self,
+		node_data: dict,
+		document: _SnapshotDocument,
+		index: int,
+		tag_name: str,
+		attributes: dict[str, str],
+		is_parent_highlighted: bool,
+		in_contenteditable: bool,
+		frame_offset: tuple[float, float],
+	) -> bool:
+		if not node_data['isInteractive']:
+			return False
+
+		if is_parent_highlighted and not self._is_distinct_interaction(document, index, tag_name, attributes, in_contenteditable):
+			return False
+
+		node_data['isInViewport'] = self._is_in_expanded_viewport(document, index)
+		if not node_data['isInViewport'] and self.args.viewport_expansion != -1:
+			return False
+
+		node_data['highlightIndex'] = self._highlight_index
+		self._highlight_index += 1
+
+		if not (self.args.highlight_elements or self.args.collect_marks):
+			return False
+
+		focus_element = self.args.focus_element
+		rect = document.viewport_rect(index)
+		if rect is not None and (focus_element < 0 or focus_element == node_data['highlightIndex']):
+			x, y, width, height = rect
+			self.highlights.append(
+				{
+					'index': node_data['highlightIndex'],
+					'color': HIGHLIGHT_COLORS[node_data['highlightIndex'] % len(HIGHLIGHT_COLORS)],
+					'left': x + frame_offset[0],
+					'top': y + frame_offset[1],
+					'width': width,
+					'height': height,
+				}
+			)
+		# like buildDomTree.js, only drawn highlights hide the interactive descendants
+		return self.args.highlight_elements
+
+
+# xpath of an <iframe> element, computed like getXPathTree in buildDomTree.js
+IFRAME_XPATH_JS = """
+(element) => {
+	const segments = [];
+	let current = element;
+	while (current && current.nodeType === Node.ELEMENT_NODE) {
+		if (current.parentNode instanceof ShadowRoot || current.parentNode instanceof HTMLIFrameElement) break;
+		const tagName = current.nodeName.toLowerCase();
+		const siblings = current.parentElement
+			? Array.from(current.parentElement.children).filter((sibling) => sibling.nodeName.toLowerCase() === tagName)
+			: [current];
+		const position = siblings.length > 1 ? siblings.indexOf(current) + 1 : 0;
+		segments.unshift(position > 0 ? `${tagName}[${position}]` : tagName);
+		current = current.parentNode;
+	}
+	return segments.join('/');
+}
+"""
+
+# Draws the highlights of a buildDomTree.js run that skipped them (drawHighlights: false), shifting the indices by `offset`
+REPLAY_HIGHLIGHTS_JS = """
+({ offset, focusHighlightIndex, runName }) => {
+	const run = runName ? window._domTreeRuns?.[runName] : window._domTreeLastRun;
+	if (!run) return;
+	run.highlightElements(
+		run.highlighted
+			.map(({ element, index, parentIframe }) => ({ element, index: index + offset, parentIframe }))
+			.filter(({ index }) => focusHighlightIndex < 0 || focusHighlightIndex === index)
+	);
+}
+"""
+
+# Resolves a highlight index of a buildDomTree.js run to its element, scrolled into view if visible.
+# Returns null when the registry is stale: the run is gone (navigation) or the element was detached or replaced.
+RESOLVE_ELEMENT_JS = """
+({ index, runName, tagName }) => {
+	const run = runName ? window._domTreeRuns?.[runName] : window._domTreeLastRun;
+	if (!run) return null;
+	let entry = run.highlighted[index];
+	if (!entry || entry.index !== index) entry = run.highlighted.find((candidate) => candidate.index === index);
+	const element = entry?.element;
+	// elements of same-origin iframes belong to another document, the selector path handles those
+	if (!element || !element.isConnected || element.ownerDocument !== document || element.tagName.toLowerCase() !== tagName) {
+		return null;
+	}
+	if (element.checkVisibility?.() ?? true) element.scrollIntoView({ block: 'nearest', inline: 'nearest' });
+	return element;
+}
+"""
+
+# Draws the overlays of the CDP backend in one call, with the same look and container as highlightElement in buildDomTree.js
+DRAW_HIGHLIGHTS_JS = """
+({ containerId, highlights }) => {
+	let container = document.getElementById(containerId);
+	if (!container) {
+		container = document.createElement('div');
+		container.id = containerId;
+		Object.assign(container.style, {
+			position: 'fixed', pointerEvents: 'none', top: '0', left: '0',
+			width: '100%', height: '100%', zIndex: '2147483640', backgroundColor: 'transparent',
+		});
+		document.body.appendChild(container);
+	}
+	const fragment = document.createDocumentFragment();
+	for (const { index, color, left, top, width, height } of highlights) {
+		if (width === 0 || height === 0) continue;
+		const overlay = document.createElement('div');
+		Object.assign(overlay.style, {
+			position: 'fixed', border: `2px solid ${color}`, backgroundColor: `${color}1A`,
+			pointerEvents: 'none', boxSizing: 'border-box',
+			top: `${top}px`, left: `${left}px`, width: `${width}px`, height: `${height}px`,
+		});
+		fragment.appendChild(overlay);
+
+		const label = document.createElement('div');
+		label.className = 'playwright-highlight-label';
+		Object.assign(label.style, {
+			position: 'fixed', background: color, color: 'white', padding: '1px 4px', borderRadius: '4px',
+			fontSize: `${Math.min(12, Math.max(8, height / 2))}px`,
+		});
+		label.textContent = index;
+		const small = width < 24 || height < 20;
+		const labelTop = small ? top - 18 : top + 2;
+		const labelLeft = small ? left + width - 20 : left + width - 22;
+		label.style.top = `${Math.max(0, Math.min(labelTop, window.innerHeight - 16))}px`;
+		label.style.left = `${Math.max(0, Math.min(labelLeft, window.innerWidth - 20))}px`;
+		fragment.appendChild(label);
+	}
+	container.appendChild(fragment);
+}
+"""
@@ -0,0 +1,183 @@
+from dataclasses import dataclass
+from typing import Literal
+
+DomBackendName = Literal['js', 'cdp']
+
+
+@dataclass
+class DomExtractionArgs:
+	"""Arguments of one DOM extraction, shared by every backend"""
+
+	highlight_elements: bool
+	focus_element: int
+	viewport_expansion: int
+	debug_mode: bool = False
+	incremental: bool = False
+	incremental_base: int | None = None
+	wire_format: Literal['json', 'columnar'] = 'json'
+	# extract every frame with its own call and stitch the trees (see FrameTreeStitcher)
+	per_frame: bool = False
+	descend_into_iframes: bool = True
+	draw_highlights: bool = True
+	# prefetch the DOM for the position after scrolling this many viewports (see DomService.prefetch_tiles)
+	tile_scroll_pages: int = 0
+	run_name: str | None = None
+	# stop visiting nodes past this budget, nodes on screen and interactive candidates are visited first
+	max_nodes: int | None = None
+	time_budget_ms: int | None = None
+	# return the boxes of the highlighted elements to draw them on the screenshot (see HighlightMarks)
+	collect_marks: bool = False
+	# run the traversal in slices of this many ms and yield to the page in between, time_budget_ms is the deadline
+	chunk_slice_ms: int | None = None
+	# only return the nodes the element list of the prompt needs (see pruneForPrompt in buildDomTree.js)
+	minimal: bool = False
+
+	def to_js_args(self) -> dict:
+		return {
+			'doHighlightElements': self.highlight_elements,
+			'focusHighlightIndex': self.focus_element,
+			'viewportExpansion': self.viewport_expansion,
+			'debugMode': self.debug_mode,
+			'incremental': self.incremental,
+			'incrementalBase': self.incremental_base,
+			'wireFormat': self.wire_format,
+			'descendIntoIframes': self.descend_into_iframes,
+			'drawHighlights': self.draw_highlights,
+			'tileScrollPages': self.tile_scroll_pages,
+			'runName': self.run_name,
+			'maxNodes': self.max_nodes,
+			'timeBudgetMs': self.time_budget_ms,
+			'collectMarks': self.collect_marks,
+			'chunkSliceMs': self.chunk_slice_ms,
+			'minimal': self.minimal,
+		}
+
+
+HIGHLIGHT_CONTAINER_ID = 'playwright-highlight-container'
+
+# Frames of common ad networks and trackers, never worth extracting
+AD_FRAME_DOMAINS = ('doubleclick.net', 'adroll.com', 'googletagmanager.com')
+
+# The sets below mirror the heuristics of buildDomTree.js, keep them in sync
+
+ALWAYS_ACCEPTED_TAGS = {'body', 'div', 'main', 'article', 'section', 'nav', 'header', 'footer'}
+LEAF_ELEMENT_DENY_LIST = {'svg', 'script', 'style', 'link', 'meta', 'noscript', 'template'}
+
+INTERACTIVE_CURSORS = {
+	'pointer',
+	'move',
+	'text',
+	'grab',
+	'grabbing',
+	'cell',
+	'copy',
+	'alias',
+	'all-scroll',
+	'col-resize',
+	'context-menu',
+	'crosshair',
+	'e-resize',
+	'ew-resize',
+	'help',
+	'n-resize',
+	'ne-resize',
+	'nesw-resize',
+	'ns-resize',
+	'nw-resize',
+	'nwse-resize',
+	'row-resize',
+	's-resize',
+	'se-resize',
+	'sw-resize',
+	'vertical-text',
+	'w-resize',
+	'zoom-in',
+	'zoom-out',
+}
+NON_INTERACTIVE_CURSORS = {'not-allowed', 'no-drop', 'wait', 'progress', 'initial', 'inherit'}
+
+INTERACTIVE_ELEMENTS = {
+	'a',
+	'button',
+	'input',
+	'select',
+	'textarea',
+	'details',
+	'summary',
+	'label',
+	'option',
+	'optgroup',
+	'fieldset',
+	'legend',
+}
+INTERACTIVE_ELEMENT_ROLES = {
+	'button',
+	'menuitemradio',
+	'menuitemcheckbox',
+	'radio',
+	'checkbox',
+	'tab',
+	'switch',
+	'slider',
+	'spinbutton',
+	'combobox',
+	'searchbox',
+	'textbox',
+	'option',
+	'scrollbar',
+}
+MOUSE_EVENT_ATTRIBUTES = ('onclick', 'onmousedown', 'onmouseup', 'ondblclick')
+
+INTERACTIVE_CANDIDATE_TAGS = {'a', 'button', 'input', 'select', 'textarea', 'details', 'summary'}
+INTERACTIVE_CANDIDATE_ATTRIBUTES = ('onclick', 'role', 'tabindex', 'aria-', 'data-action')
+
+DISTINCT_INTERACTIVE_TAGS = {'a', 'button', 'input', 'select', 'textarea', 'summary', 'details', 'label', 'option'}
+DISTINCT_INTERACTIVE_ROLES = {
+	'button',
+	'link',
+	'menuitem',
+	'menuitemradio',
+	'menuitemcheckbox',
+	'radio',
+	'checkbox',
+	'tab',
+	'switch',
+	'slider',
+	'spinbutton',
+	'combobox',
+	'searchbox',
+	'textbox',
+	'listbox',
+	'option',
+	'scrollbar',
+}
+DISTINCT_INTERACTION_ATTRIBUTES = (
+	'data-testid',
+	'data-cy',
+	'data-test',
+	'onclick',
+	'onmousedown',
+	'onmouseup',
+	'onkeydown',
+	'onkeyup',
+	'onsubmit',
+	'onchange',
+	'oninput',
+	'onfocus',
+	'onblur',
+)
+
+HIGHLIGHT_COLORS = [
+	'#FF0000',
+	'#00FF00',
+	'#0000FF',
+	'#FFA500',
+	'#800080',
+	'#008080',
+	'#FF69B4',
+	'#4B0082',
+	'#FF4500',
+	'#2E8B57',
+	'#DC143C',
+	'#4682B4',
+]
@@ -1,6 +1,8 @@
 import hashlib
 
 from browzee_agent.dom.history_tree_processor.view import DOMHistoryElement, HashedDomElement
+from browzee_agent.dom.lookup_index.views import DOMLookupIndex
+from browzee_agent.dom.reidentification.views import element_text
 from browzee_agent.dom.views import DOMElementNode
 
 
@@ -28,12 +30,24 @@ class HistoryTreeProcessor:
 			page_coordinates=dom_element.page_coordinates,
 			viewport_coordinates=dom_element.viewport_coordinates,
 			viewport_info=dom_element.viewport_info,
+			text=element_text(dom_element),
 		)
 
 	@staticmethod
-	def find_history_element_in_tree(dom_history_element: DOMHistoryElement, tree: DOMElementNode) -> DOMElementNode | None:
+	def find_history_element_in_tree(
+		dom_history_element: DOMHistoryElement,
+		tree: DOMElementNode,
+		lookup_index: DOMLookupIndex | None = None,
+	) -> DOMElementNode | None:
 		hashed_dom_history_element = HistoryTreeProcessor._hash_dom_history_element(dom_history_element)
 
+		if lookup_index is not None:
+			# the xpath is part of the hash, only the elements at the same xpath can match
+			for node in lookup_index.find_by_xpath(dom_history_element.xpath):
+				if node.highlight_index is not None and node.hash == hashed_dom_history_element:
+					return node
+			return None
+
 		def process_node(node: DOMElementNode):
 			if node.highlight_index is not None:
 				hashed_node = HistoryTreeProcessor._hash_dom_element(node)
@@ -65,8 +79,24 @@ class HistoryTreeProcessor:
 
 	@staticmethod
 	def _hash_dom_element(dom_element: DOMElementNode) -> HashedDomElement:
-		parent_branch_path = HistoryTreeProcessor._get_parent_branch_path(dom_element)
-		branch_path_hash = HistoryTreeProcessor._parent_branch_path_hash(parent_branch_path)
+		"""
+		The branch path hash is chained from the hash of the parent, which is cached on the parent
+		(see `DOMElementNode.hash`), so hashing every element of a snapshot is linear in its size.
+		"""
+		parent = dom_element.parent
+		if parent is None:
+			branch_path_hash = HistoryTreeProcessor._parent_branch_path_hash([])
+		else:
+			if parent.cached_hash is None:
+				# hash the ancestors top-down, each of them then finds the hash of its parent cached
+				uncached: list[DOMElementNode] = []
+				ancestor: DOMElementNode | None = parent
+				while ancestor is not None and ancestor.cached_hash is None:
+					uncached.append(ancestor)
+					ancestor = ancestor.parent
+				for ancestor in reversed(uncached):
+					ancestor.hash
+			branch_path_hash = HistoryTreeProcessor._chain_branch_path_hash(parent.hash.branch_path_hash, dom_element.tag_name)
 		attributes_hash = HistoryTreeProcessor._attributes_hash(dom_element.attributes)
 		xpath_hash = HistoryTreeProcessor._xpath_hash(dom_element.xpath)
 		# text_hash = DomTreeProcessor._text_hash(dom_element)
@@ -87,20 +117,31 @@ class HistoryTreeProcessor:
 
 	@staticmethod
 	def _parent_branch_path_hash(parent_branch_path: list[str]) -> str:
-		parent_branch_path_string = '/'.join(parent_branch_path)
-		return hashlib.sha256(parent_branch_path_string.encode()).hexdigest()
+		branch_path_hash = HistoryTreeProcessor._fingerprint('')
+		for tag_name in parent_branch_path:
+			branch_path_hash = HistoryTreeProcessor._chain_branch_path_hash(branch_path_hash, tag_name)
+		return branch_path_hash
+
+	@staticmethod
+	def _chain_branch_path_hash(parent_branch_path_hash: str, tag_name: str) -> str:
+		return HistoryTreeProcessor._fingerprint(f'{parent_branch_path_hash}/{tag_name}')
 
 	@staticmethod
 	def _attributes_hash(attributes: dict[str, str]) -> str:
 		attributes_string = ''.join(f'{key}={value}' for key, value in attributes.items())
-		return hashlib.sha256(attributes_string.encode()).hexdigest()
+		return HistoryTreeProcessor._fingerprint(attributes_string)
 
 	@staticmethod
 	def _xpath_hash(xpath: str) -> str:
-		return hashlib.sha256(xpath.encode()).hexdigest()
+		return HistoryTreeProcessor._fingerprint(xpath)
 
 	@staticmethod
 	def _text_hash(dom_element: DOMElementNode) -> str:
 		""" """
 		text_string = dom_element.get_all_text_till_next_clickable_element()
-		return hashlib.sha256(text_string.encode()).hexdigest()
+		return HistoryTreeProcessor._fingerprint(text_string)
+
+	@staticmethod
+	def _fingerprint(string: str) -> str:
+		# identifies elements within a session, no need for a cryptographic hash
+		return hashlib.blake2b(string.encode(), digest_size=8).hexdigest()
@@ -49,6 +49,8 @@ class DOMHistoryElement:
 	page_coordinates: CoordinateSet | None = None
 	viewport_coordinates: CoordinateSet | None = None
 	viewport_info: ViewportInfo | None = None
+	# text up to the next clickable element, lets a replay find the element again when its attributes changed
+	text: str | None = None
 
 	def to_dict(self) -> dict:
 		page_coordinates = self.page_coordinates.model_dump() if self.page_coordinates else None
@@ -66,4 +68,5 @@ class DOMHistoryElement:
 			'page_coordinates': page_coordinates,
 			'viewport_coordinates': viewport_coordinates,
 			'viewport_info': viewport_info,
+			'text': self.text,
 		}
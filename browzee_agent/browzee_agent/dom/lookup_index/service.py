@@ -0,0 +1,62 @@
+from browzee_agent.dom.lookup_index.views import DOMLookupIndex, tokenize
+from browzee_agent.dom.views import DOMElementNode, DOMTextNode, node_key
+from browzee_agent.utils import time_execution_sync
+
+
+class DOMLookupIndexBuilder:
+	"""
+	Builds the `DOMLookupIndex` of a snapshot in a single walk of the tree.
+	"""
+
+	@staticmethod
+	@time_execution_sync('--build_lookup_index')
+	def build(root: DOMElementNode) -> DOMLookupIndex:
+		index = DOMLookupIndex()
+		file_inputs: list[tuple[DOMElementNode, bool]] = []
+
+		stack: list[DOMElementNode] = [root]
+		while stack:
+			node = stack.pop()
+			index.nodes.add(node_key(node))
+			index.by_xpath.setdefault(node.xpath, []).append(node)
+			index.by_tag.setdefault(node.tag_name, []).append(node)
+			role = node.attributes.get('role')
+			if role:
+				index.by_role.setdefault(role, []).append(node)
+			if node.tag_name == 'input' and (node.attributes.get('type') == 'file' or 'accept' in node.attributes):
+				file_inputs.append((node, node.attributes.get('type') == 'file'))
+
+			texts: list[str] = []
+			elements: list[DOMElementNode] = []
+			for child in node.children:
+				if isinstance(child, DOMElementNode):
+					elements.append(child)
+				elif isinstance(child, DOMTextNode):
+					texts.append(child.text)
+			if texts:
+				DOMLookupIndexBuilder._add_text(index, node, ' '.join(texts))
+
+			# reversed, so the nodes are visited in document order
+			stack.extend(reversed(elements))
+
+		# file inputs are in document order, the first one found under an element wins like in a tree walk
+		for file_input, is_file_type in file_inputs:
+			depth = 0
+			current: DOMElementNode | None = file_input
+			while current is not None:
+				key = node_key(current)
+				if depth < index.file_uploader_depths.get(key, depth + 1):
+					index.file_uploader_depths[key] = depth
+				if is_file_type:
+					index.file_inputs_below.setdefault(key, file_input)
+				current = current.parent
+				depth += 1
+
+		return index
+
+	@staticmethod
+	def _add_text(index: DOMLookupIndex, node: DOMElementNode, text: str) -> None:
+		position = len(index.text_owners)
+		index.text_owners.append((node, text.lower()))
+		for token in set(tokenize(text)):
+			index.text_tokens.setdefault(token, []).append(position)
@@ -0,0 +1,80 @@
+import re
+from collections.abc import Hashable
+from typing import Iterable
+
+from browzee_agent.dom.views import DOMElementNode, node_key
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> list[str]:
+	return TOKEN_PATTERN.findall(text.lower())
+
+
+class DOMLookupIndex:
+	"""
+	Secondary indexes of one DOM snapshot, built once by `DOMLookupIndexBuilder`.
+
+	Every list keeps the document order of the tree, so the first match of a lookup is the element a
+	depth-first walk of the tree would have found first.
+	"""
+
+	def __init__(self) -> None:
+		self.by_xpath: dict[str, list[DOMElementNode]] = {}
+		self.by_tag: dict[str, list[DOMElementNode]] = {}
+		self.by_role: dict[str, list[DOMElementNode]] = {}
+		# elements with text children, their joined text and the inverted index token -> positions
+		self.text_owners: list[tuple[DOMElementNode, str]] = []
+		self.text_tokens: dict[str, list[int]] = {}
+		# distance from each element down to its nearest file uploader (input[type=file] or input[accept])
+		self.file_uploader_depths: dict[Hashable, int] = {}
+		# first input[type=file] in the subtree of each element
+		self.file_inputs_below: dict[Hashable, DOMElementNode] = {}
+		self.nodes: set[Hashable] = set()
+
+	def __contains__(self, node: DOMElementNode) -> bool:
+		return node_key(node) in self.nodes
+
+	def find_by_xpath(self, xpath: str) -> list[DOMElementNode]:
+		return self.by_xpath.get(xpath, [])
+
+	def find_by_tag(self, tag_name: str) -> list[DOMElementNode]:
+		return self.by_tag.get(tag_name, [])
+
+	def find_by_role(self, role: str) -> list[DOMElementNode]:
+		return self.by_role.get(role, [])
+
+	def find_by_text(self, text: str) -> list[DOMElementNode]:
+		"""Elements whose own text contains `text`, case insensitive"""
+		needle = text.lower()
+		if not needle.strip():
+			return []
+
+		# the first and last words may be cut (e.g. 'Sign' of 'Signup'), only the inner ones are whole tokens
+		inner_tokens = tokenize(needle)[1:-1]
+		candidates: Iterable[int]
+		if inner_tokens:
+			postings = sorted((self.text_tokens.get(token, []) for token in inner_tokens), key=len)
+			others = [set(posting) for posting in postings[1:]]
+			candidates = (position for position in postings[0] if all(position in other for other in others))
+		else:
+			candidates = range(len(self.text_owners))
+
+		return [self.text_owners[position][0] for position in candidates if needle in self.text_owners[position][1]]
+
+	def is_file_uploader(self, node: DOMElementNode, max_depth: int = 3) -> bool:
+		"""Whether the element or one of its descendants up to `max_depth` levels down is a file uploader"""
+		return self.file_uploader_depths.get(node_key(node), max_depth + 1) <= max_depth
+
+	def get_file_upload_element(self, node: DOMElementNode, check_siblings: bool = True) -> DOMElementNode | None:
+		"""Same as `DOMElementNode.get_file_upload_element`, without walking the subtrees"""
+		file_input = self.file_inputs_below.get(node_key(node))
+		if file_input is not None or not check_siblings or node.parent is None:
+			return file_input
+
+		for sibling in node.parent.children:
+			if isinstance(sibling, DOMElementNode) and node_key(sibling) != node_key(node):
+				file_input = self.file_inputs_below.get(node_key(sibling))
+				if file_input is not None:
+					return file_input
+		return None
@@ -0,0 +1,28 @@
+from browzee_agent.dom.lookup_index.views import tokenize
+from browzee_agent.dom.reidentification.views import ReidentificationIndex, element_text, stable_attributes
+from browzee_agent.dom.views import SelectorMap
+from browzee_agent.utils import time_execution_sync
+
+
+class ReidentificationIndexBuilder:
+	"""
+	Builds the `ReidentificationIndex` of a snapshot from its selector map.
+	"""
+
+	@staticmethod
+	@time_execution_sync('--build_reidentification_index')
+	def build(selector_map: SelectorMap) -> ReidentificationIndex:
+		index = ReidentificationIndex()
+		for position, highlight_index in enumerate(sorted(selector_map)):
+			element = selector_map[highlight_index]
+			attributes = stable_attributes(element.attributes)
+			tokens = set(tokenize(element_text(element)))
+
+			index.elements.append(element)
+			index.attributes.append(attributes)
+			index.tokens.append(tokens)
+			for attribute in attributes:
+				index.by_attribute.setdefault(attribute, []).append(position)
+			for token in tokens:
+				index.by_token.setdefault(token, []).append(position)
+		return index
@@ -0,0 +1,113 @@
+from browzee_agent.dom.history_tree_processor.view import DOMHistoryElement
+from browzee_agent.dom.lookup_index.views import tokenize
+from browzee_agent.dom.views import DOMElementNode
+
+# attributes that usually survive a re-render, unlike classes, styles or generated ids of state
+STABLE_ATTRIBUTES = (
+	'id',
+	'name',
+	'type',
+	'role',
+	'placeholder',
+	'aria-label',
+	'title',
+	'alt',
+	'for',
+	'href',
+	'data-testid',
+	'data-test',
+	'data-qa',
+	'data-cy',
+)
+MAX_TEXT_LENGTH = 100
+
+# weights of the similarity parts, spread over the parts both elements have
+ATTRIBUTES_WEIGHT = 0.45
+TEXT_WEIGHT = 0.35
+POSITION_WEIGHT = 0.2
+
+
+def element_text(node: DOMElementNode) -> str:
+	return node.get_all_text_till_next_clickable_element(max_depth=2)[:MAX_TEXT_LENGTH]
+
+
+def stable_attributes(attributes: dict[str, str]) -> set[tuple[str, str]]:
+	return {(key, attributes[key]) for key in STABLE_ATTRIBUTES if attributes.get(key)}
+
+
+def xpath_similarity(first: str, second: str) -> float:
+	"""Share of the leading xpath steps both have in common, an approximate document position"""
+	first_steps, second_steps = first.strip('/').split('/'), second.strip('/').split('/')
+	shared = 0
+	for first_step, second_step in zip(first_steps, second_steps):
+		if first_step != second_step:
+			break
+		shared += 1
+	return shared / max(len(first_steps), len(second_steps))
+
+
+def jaccard(first: set, second: set) -> float:
+	return len(first & second) / len(first | second)
+
+
+class ReidentificationIndex:
+	"""
+	Highlighted elements of one snapshot keyed by stable attribute and text token, built once by
+	`ReidentificationIndexBuilder`. Finds the element of a `DOMHistoryElement` again when the exact hash
+	match of `HistoryTreeProcessor` fails, e.g. because a class changed or the element moved.
+
+	Only the elements sharing a stable attribute or a text token with the history element can match.
+	"""
+
+	def __init__(self) -> None:
+		# document order
+		self.elements: list[DOMElementNode] = []
+		self.attributes: list[set[tuple[str, str]]] = []
+		self.tokens: list[set[str]] = []
+		self.by_attribute: dict[tuple[str, str], list[int]] = {}
+		self.by_token: dict[str, list[int]] = {}
+
+	def __len__(self) -> int:
+		return len(self.elements)
+
+	def candidates(self, history_element: DOMHistoryElement) -> list[int]:
+		positions: set[int] = set()
+		for attribute in stable_attributes(history_element.attributes):
+			positions.update(self.by_attribute.get(attribute, []))
+		for token in tokenize(history_element.text or ''):
+			positions.update(self.by_token.get(token, []))
+		return sorted(position for position in positions if self.elements[position].tag_name == history_element.tag_name)
+
+	def score(self, history_element: DOMHistoryElement, position: int) -> float:
+		"""
+		Similarity in [0, 1] of the history element and the element at this position, 0 unless they share
+		a stable attribute or a text token: the position alone does not identify an element.
+		"""
+		element = self.elements[position]
+		if element.tag_name != history_element.tag_name:
+			return 0.0
+
+		attributes = stable_attributes(history_element.attributes)
+		tokens = set(tokenize(history_element.text or ''))
+		if not (attributes & self.attributes[position] or tokens & self.tokens[position]):
+			return 0.0
+
+		total = weight = 0.0
+		if attributes or self.attributes[position]:
+			total += ATTRIBUTES_WEIGHT * jaccard(attributes, self.attributes[position])
+			weight += ATTRIBUTES_WEIGHT
+		if tokens or self.tokens[position]:
+			total += TEXT_WEIGHT * jaccard(tokens, self.tokens[position])
+			weight += TEXT_WEIGHT
+		total += POSITION_WEIGHT * xpath_similarity(history_element.xpath, element.xpath)
+		weight += POSITION_WEIGHT
+		return total / weight
+
+	def find(self, history_element: DOMHistoryElement, threshold: float = 0.6) -> DOMElementNode | None:
+		"""The most similar element scoring at least `threshold`, the first one in document order on ties"""
+		best_position, best_score = None, threshold
+		for position in self.candidates(history_element):
+			score = self.score(history_element, position)
+			if score > best_score or (score == best_score and best_position is None):
+				best_position, best_score = position, score
+		return None if best_position is None else self.elements[best_position]
@@ -0,0 +1,146 @@
+import re
+
+import numpy as np
+
+from browzee_agent.dom.relevance.views import RelevanceSelection
+from browzee_agent.dom.views import DOMElementNode, DOMTextNode, SelectorMap, iter_element_texts, node_key
+from browzee_agent.utils import time_execution_sync
+
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+# attributes that describe an element besides its text
+RANKED_ATTRIBUTES = ('aria-label', 'placeholder', 'title', 'alt', 'name', 'href')
+STOPWORDS = frozenset(
+	'a an and are as at be by for from has have i in is it its me my of on or our the their then this to us we with '
+	'you your'.split()
+)
+# the next goal says what the agent is about to do, the task only what it has to do overall
+GOAL_WEIGHT = 2.0
+
+
+def tokenize(text: str) -> list[str]:
+	"""Lowercase words without stopwords, with the plural and verb endings stripped"""
+	tokens = []
+	for token in TOKEN_PATTERN.findall(text.lower()):
+		if token in STOPWORDS:
+			continue
+		for suffix in ('ing', 'ed', 'es', 's'):
+			if len(token) > len(suffix) + 3 and token.endswith(suffix):
+				token = token[: -len(suffix)]
+				break
+		tokens.append(token)
+	return tokens
+
+
+class ElementRelevanceRanker:
+	"""
+	Ranks the highlighted elements of a snapshot against the task and the current goal with BM25 over
+	their text and describing attributes, to keep only the most relevant ones in the state message.
+	"""
+
+	@staticmethod
+	@time_execution_sync('--rank_elements')
+	def score(
+		selector_map: SelectorMap, task: str, next_goal: str | None = None, k1: float = 1.2, b: float = 0.75
+	) -> tuple[np.ndarray, np.ndarray]:
+		"""Highlight indexes in document order and their BM25 scores"""
+		indexes = np.array(sorted(selector_map), dtype=np.int64)
+
+		# only the query terms matter, so the term matrix has one column per distinct query token
+		weights: dict[str, float] = {}
+		for token in tokenize(task):
+			weights[token] = max(weights.get(token, 0.0), 1.0)
+		for token in tokenize(next_goal or ''):
+			weights[token] = GOAL_WEIGHT
+		if not len(indexes) or not weights:
+			return indexes, np.zeros(len(indexes))
+		columns = {token: column for column, token in enumerate(weights)}
+
+		texts = ElementRelevanceRanker._texts(selector_map)
+		lengths = np.zeros(len(indexes))
+		rows: list[int] = []
+		terms: list[int] = []
+		for row, highlight_index in enumerate(indexes.tolist()):
+			node = selector_map[highlight_index]
+			text = texts.get(highlight_index)
+			if text is None:
+				text = node.get_all_text_till_next_clickable_element()
+			tokens = tokenize(ElementRelevanceRanker._document(node, text))
+			lengths[row] = len(tokens)
+			for token in tokens:
+				column = columns.get(token)
+				if column is not None:
+					rows.append(row)
+					terms.append(column)
+
+		frequencies = np.zeros((len(indexes), len(columns)))
+		np.add.at(frequencies, (np.array(rows, dtype=np.int64), np.array(terms, dtype=np.int64)), 1)
+
+		document_frequencies = (frequencies > 0).sum(axis=0)
+		idf = np.log1p((len(indexes) - document_frequencies + 0.5) / (document_frequencies + 0.5))
+		normalized_lengths = k1 * (1 - b + b * lengths / max(lengths.mean(), 1.0))
+		saturated = frequencies * (k1 + 1) / (frequencies + normalized_lengths[:, None])
+		return indexes, saturated @ (idf * np.array(list(weights.values())))
+
+	@staticmethod
+	def select(
+		selector_map: SelectorMap,
+		task: str,
+		next_goal: str | None,
+		max_elements: int,
+		neighbours: int = 1,
+	) -> RelevanceSelection:
+		"""
+		The `max_elements` best scored elements (the first ones of the page on ties), plus their context:
+		the `neighbours` elements before and after each of them in document order, which are usually the
+		label or the buttons of the same control, and the highlighted elements they are nested in.
+		Elements that appeared since the last step are always kept.
+		"""
+		if len(selector_map) <= max_elements:
+			return RelevanceSelection(keep=set(selector_map), omitted=0)
+
+		indexes, scores = ElementRelevanceRanker.score(selector_map, task, next_goal)
+		# stable sort on the negated scores keeps document order among ties
+		top = np.argsort(-scores, kind='stable')[:max_elements]
+		positions = (top[:, None] + np.arange(-neighbours, neighbours + 1)).ravel()
+		positions = positions[(positions >= 0) & (positions < len(indexes))]
+		keep = set(indexes[positions].tolist())
+
+		for highlight_index in list(keep):
+			parent = selector_map[highlight_index].parent
+			while parent is not None:
+				if parent.highlight_index is not None:
+					keep.add(parent.highlight_index)
+				parent = parent.parent
+		keep.update(highlight_index for highlight_index, node in selector_map.items() if node.is_new)
+
+		return RelevanceSelection(keep=keep, omitted=len(selector_map) - len(keep))
+
+	@staticmethod
+	def _texts(selector_map: SelectorMap) -> dict[int, str]:
+		"""
+		Text of every highlighted element by highlight index, attributed like `get_all_text_till_next_clickable_element`
+		but in a single walk over the trees the elements are in.
+		"""
+		# climb from every element until a node already seen, the nodes without parent are the roots
+		seen = set()
+		roots: list[DOMElementNode] = []
+		for node in selector_map.values():
+			while node_key(node) not in seen:
+				seen.add(node_key(node))
+				if node.parent is None:
+					roots.append(node)
+					break
+				node = node.parent
+
+		texts: dict[int, str] = {}
+		for root in roots:
+			for item in iter_element_texts(root):
+				if item.node is not None and not isinstance(item.node, DOMTextNode):
+					texts[item.node.highlight_index] = item.text
+		return texts
+
+	@staticmethod
+	def _document(node: DOMElementNode, text: str) -> str:
+		parts = [text]
+		parts.extend(node.attributes[name] for name in RANKED_ATTRIBUTES if node.attributes.get(name))
+		return ' '.join(parts)
@@ -0,0 +1,10 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class RelevanceSelection:
+	"""Highlighted elements kept in the state message after ranking them against the task"""
+
+	keep: set[int]
+	# highlighted elements left out of the element list
+	omitted: int
@@ -1,24 +1,101 @@
+import asyncio
+import copy
+import hashlib
 import json
 import logging
+import weakref
 from dataclasses import dataclass
 from importlib import resources
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Iterator, Literal
 from urllib.parse import urlparse
 
 if TYPE_CHECKING:
-	from patchright.async_api import Page
-
+	from patchright.async_api import ElementHandle, Frame, Page
+
+from browzee_agent.dom.arena.service import DOMArenaBuilder
+from browzee_agent.dom.extraction.service import (
+	REPLAY_HIGHLIGHTS_JS,
+	RESOLVE_ELEMENT_JS,
+	DomExtractionBackend,
+	JsDomExtractionBackend,
+	is_ad_frame_url,
+)
+from browzee_agent.dom.extraction.views import DomExtractionArgs
 from browzee_agent.dom.views import (
 	DOMBaseNode,
 	DOMElementNode,
 	DOMState,
 	DOMTextNode,
+	DOMTile,
+	HighlightMarks,
 	SelectorMap,
+	node_key,
 )
 from browzee_agent.utils import time_execution_async
 
 logger = logging.getLogger(__name__)
 
+# Flag bits of the columnar wire format, must match `encodeColumnar` in buildDomTree.js
+_COLUMNAR_TEXT = 1
+_COLUMNAR_VISIBLE = 2
+_COLUMNAR_TOP_ELEMENT = 4
+_COLUMNAR_INTERACTIVE = 8
+_COLUMNAR_IN_VIEWPORT = 16
+_COLUMNAR_SHADOW_ROOT = 32
+
+# buildDomTree.js is read once per process. The page keeps it as a runtime keyed by this version,
+# so steady-state extractions only send the arguments.
+BUILD_DOM_TREE_JS = resources.files('browzee_agent.dom').joinpath('buildDomTree.js').read_text()
+BUILD_DOM_TREE_VERSION = hashlib.blake2b(BUILD_DOM_TREE_JS.encode(), digest_size=8).hexdigest()
+
+_RUN_RUNTIME_JS = (
+	'(args) => {'
+	' const runtime = window._domTreeRuntime;'
+	f" return runtime && runtime.version === '{BUILD_DOM_TREE_VERSION}' ? runtime.buildDomTree(args) : null;"
+	' }'
+)
+_INSTALL_RUNTIME_JS = (
+	'(args) => {'
+	f" window._domTreeRuntime = {{ version: '{BUILD_DOM_TREE_VERSION}', buildDomTree: {BUILD_DOM_TREE_JS.strip().rstrip(';')} }};"
+	' return window._domTreeRuntime.buildDomTree(args);'
+	' }'
+)
+
+# Cheap check that the page did not change apart from scrolling, compared before serving a prefetched tile.
+# A MutationObserver installed by the first check counts the DOM mutations outside the highlight overlays, so
+# attribute toggles (disabled, class, style, hidden) invalidate the tiles even when the page size stays the same.
+_TILE_CHECK_JS = """
+() => {
+	const isOverlay = node => {
+		const element = node && (node.nodeType === Node.ELEMENT_NODE ? node : node.parentElement);
+		return !!element && !!element.closest('#playwright-highlight-container');
+	};
+	const count = records => records.filter(record =>
+		!isOverlay(record.target) && ![...record.addedNodes, ...record.removedNodes].some(isOverlay)
+	).length;
+
+	let mutations = window._domTileMutations;
+	if (!mutations) {
+		mutations = window._domTileMutations = { count: 0 };
+		mutations.observer = new MutationObserver(records => { mutations.count += count(records); });
+		mutations.observer.observe(document, { subtree: true, childList: true, attributes: true, characterData: true });
+	}
+	// records of the current task are not delivered to the callback yet
+	mutations.count += count(mutations.observer.takeRecords());
+
+	return {
+		scrollY: window.scrollY,
+		fingerprint: [
+			location.href,
+			mutations.count,
+			document.getElementsByTagName('*').length,
+			document.body ? document.body.textContent.length : 0,
+			(document.scrollingElement || document.documentElement).scrollHeight,
+		].join('|'),
+	};
+}
+"""
+
 
 @dataclass
 class ViewportInfo:
@@ -27,11 +104,35 @@ class ViewportInfo:
 
 
 class DomService:
-	def __init__(self, page: 'Page'):
+	def __init__(self, page: 'Page', backend: DomExtractionBackend | None = None):
 		self.page = page
 		self.xpath_cache = {}
-
-		self.js_code = resources.files('browser_use.dom').joinpath('buildDomTree.js').read_text()
+		self.backend = backend or JsDomExtractionBackend()
+
+		# Snapshot state kept between calls for incremental extraction
+		self._snapshot_version: int | None = None
+		self._snapshot_root_id: str | None = None
+		self._snapshot_nodes: dict[str, DOMBaseNode] = {}
+		self._snapshot_children: dict[str, list[str]] = {}
+		self._snapshot_parents: dict[str, str] = {}
+		self._snapshot_selector_map: SelectorMap = {}
+
+		# Stable ids of the frames extracted with `per_frame=True`, referenced by `DOMElementNode.frame_id`.
+		# Both directions are weak and detached frames are dropped on the next extraction, so frames the page
+		# navigated away from are not kept alive.
+		self.frames: weakref.WeakValueDictionary[str, 'Frame'] = weakref.WeakValueDictionary()
+		self._frame_ids: weakref.WeakKeyDictionary['Frame', str] = weakref.WeakKeyDictionary()
+		self._next_frame_id = 0
+		# frame id -> offset added to the highlight indices of that frame by the last per-frame extraction
+		self.highlight_offsets: dict[str, int] = {}
+
+		# Selector map of the last returned state and the buildDomTree.js run behind it, see `get_element_handle`
+		self._registry_selector_map: SelectorMap | None = None
+		self._registry_run: str | None = None
+
+		# Tiles prefetched above and below the viewport, see `prefetch_tiles`
+		self._tiles: list[DOMTile] = []
+		self._tile_task: asyncio.Task | None = None
 
 	# region - Clickable elements
 	@time_execution_async('--get_clickable_elements')
@@ -40,26 +141,213 @@ class DomService:
 		highlight_elements: bool = True,
 		focus_element: int = -1,
 		viewport_expansion: int = 0,
+		incremental: bool = False,
+		wire_format: Literal['json', 'columnar'] = 'json',
+		compact: bool = False,
+		per_frame: bool = False,
+		max_nodes: int | None = None,
+		time_budget_ms: int | None = None,
+		collect_marks: bool = False,
+		chunk_slice_ms: int | None = None,
+		minimal: bool = False,
+		draw_highlights: bool = True,
 	) -> DOMState:
-		element_tree, selector_map = await self._build_dom_tree(highlight_elements, focus_element, viewport_expansion)
-		return DOMState(element_tree=element_tree, selector_map=selector_map)
+		"""
+		Extract the DOM of the page.
+
+		With `incremental=True` the page keeps a node registry between calls and only returns the
+		nodes that changed since the previous call on this service. The new tree shares the
+		unchanged subtrees with the previous one, which is left as it was.
+
+		With `wire_format='columnar'` the page returns interned tables and parallel arrays instead of
+		one dict per node, which is much smaller to transfer and decode on large pages.
+
+		With `compact=True` the tree is stored in a `DOMArena` and exposed through lightweight views.
+		Incremental snapshots patch nodes in place, so they always use regular nodes.
+
+		With `per_frame=True` every frame (including cross-origin ones) is extracted concurrently with
+		its own evaluate call and stitched under its <iframe> node, whose `frame_id` names the frame
+		in `self.frames`. This replaces the incremental mode.
+
+		With `max_nodes` and/or `time_budget_ms` the page stops visiting nodes once the budget is spent,
+		after visiting nodes on screen and interactive candidates first. The state is then marked
+		`truncated`. Budgeted extractions replace the incremental mode, and the 'cdp' backend ignores them.
+
+		With `collect_marks=True` the state carries the boxes of the highlighted elements as `marks`, so
+		they can be drawn on the screenshot (see `browser/utils/set_of_marks.py`) and queried through
+		`DOMState.spatial_index`. Pass `draw_highlights=False` with it to leave the page untouched: the
+		elements are still highlighted, so the selector map is the same as with the overlays drawn.
+
+		With `chunk_slice_ms` buildDomTree.js walks the DOM in slices of that many milliseconds and
+		yields to the page between them, so its timers and animations keep running. `time_budget_ms`
+		is then the deadline of the whole extraction, yields included. Chunked extractions replace the
+		incremental mode.
+
+		With `minimal=True` the page only returns what the element list of the prompt is made of: the
+		highlighted elements with the text they own as direct children, the loose text lines and their
+		ancestors. The tree is stored in a `DOMArena`, so ancestors only become node objects when an
+		element walks up to them (iframe paths, hashes). Minimal extractions replace the incremental
+		mode, and the 'cdp' backend ignores them.
+		"""
+		element_tree, selector_map, eval_page = await self._build_dom_tree(
+			highlight_elements,
+			focus_element,
+			viewport_expansion,
+			incremental,
+			wire_format,
+			compact,
+			per_frame,
+			max_nodes,
+			time_budget_ms,
+			collect_marks,
+			chunk_slice_ms,
+			minimal,
+			draw_highlights,
+		)
+		marks = eval_page.get('marks')
+		return DOMState(
+			element_tree=element_tree,
+			selector_map=selector_map,
+			truncated=eval_page.get('truncated', False),
+			marks=HighlightMarks(boxes=marks['boxes'], device_pixel_ratio=marks['devicePixelRatio']) if marks else None,
+		)
+
+	def schedule_tile_prefetch(self, highlight_elements: bool, viewport_expansion: int, compact: bool = False) -> None:
+		"""Prefetch the tiles in the background, e.g. while the LLM decides on the next action"""
+		self.cancel_tile_prefetch()
+		self._tile_task = asyncio.create_task(self.prefetch_tiles(highlight_elements, viewport_expansion, compact))
+
+	def cancel_tile_prefetch(self) -> None:
+		if self._tile_task is not None and not self._tile_task.done():
+			self._tile_task.cancel()
+		self._tile_task = None
+		self._tiles = []
+
+	@time_execution_async('--prefetch_tiles')
+	async def prefetch_tiles(self, highlight_elements: bool, viewport_expansion: int, compact: bool = False) -> None:
+		"""
+		Extract the DOM for the positions one viewport below and above the current one, so the state
+		after a `scroll_down`/`scroll_up` can be served without a new extraction.
+
+		Tiles skip drawing their highlights, `take_prefetched_state` draws them once a tile is used.
+		Elements of a tile that are not on screen yet cannot be hit-tested, so they count as top elements.
+		"""
+		try:
+			check = await self.page.evaluate(_TILE_CHECK_JS)
+			tiles = []
+			for scroll_pages in (1, -1):
+				args = DomExtractionArgs(
+					highlight_elements=highlight_elements,
+					focus_element=-1,
+					viewport_expansion=viewport_expansion,
+					draw_highlights=False,
+					tile_scroll_pages=scroll_pages,
+					run_name=f'tile{scroll_pages:+d}',
+				)
+				eval_page = await self.evaluate_build_dom_tree(self.page, args.to_js_args())
+				tile = eval_page.get('tile')
+				if not tile or tile['scrollY'] == tile['fromScrollY']:
+					continue  # already at the top or bottom of the page
+
+				if compact:
+					element_tree, selector_map = await self._construct_dom_arena(eval_page)
+				else:
+					element_tree, selector_map = await self._construct_dom_tree(eval_page)
+				tiles.append(
+					DOMTile(
+						scroll_y=tile['scrollY'],
+						fingerprint=check['fingerprint'],
+						run_name=args.run_name,
+						state=DOMState(element_tree=element_tree, selector_map=selector_map),
+					)
+				)
+			self._tiles = tiles
+		except Exception as e:
+			logger.debug(f'Failed to prefetch DOM tiles: {type(e).__name__}: {e}')
+			self._tiles = []
+
+	@time_execution_async('--take_prefetched_state')
+	async def take_prefetched_state(self, highlight_elements: bool, focus_element: int = -1) -> DOMState | None:
+		"""
+		Return the prefetched tile matching the current scroll position, or None if there is none or the
+		page changed since it was extracted. Tiles are used at most once.
+		"""
+		pending = self._tile_task is not None and not self._tile_task.done()
+		tiles = self._tiles
+		self.cancel_tile_prefetch()
+		if pending or not tiles:
+			return None
+
+		check = await self.page.evaluate(_TILE_CHECK_JS)
+		for tile in tiles:
+			if tile.scroll_y != check['scrollY'] or tile.fingerprint != check['fingerprint']:
+				continue
+
+			if highlight_elements:
+				await self.page.evaluate(
+					REPLAY_HIGHLIGHTS_JS, {'offset': 0, 'focusHighlightIndex': focus_element, 'runName': tile.run_name}
+				)
+			self._registry_selector_map = tile.state.selector_map
+			self._registry_run = tile.run_name
+			self.highlight_offsets = {}
+			logger.debug(f'Serving prefetched DOM tile at scrollY={tile.scroll_y}')
+			return tile.state
+		return None
+
+	@time_execution_async('--get_element_handle')
+	async def get_element_handle(self, element: DOMElementNode) -> 'ElementHandle | None':
+		"""
+		Resolve an element of the last returned state to a handle in a single call, through the elements
+		buildDomTree.js keeps by highlight index in every frame it ran in. Visible elements are scrolled into view.
+
+		Returns None when there is no registry (other backend, about:blank) or it went stale, e.g. after a
+		navigation or when the page replaced the element. Callers then fall back to a selector.
+		"""
+		if self._registry_selector_map is None or element.highlight_index is None:
+			return None
+		registered = self._registry_selector_map.get(element.highlight_index)
+		if registered is None or node_key(registered) != node_key(element):
+			return None  # not an element of the last returned state
+
+		# elements of frames extracted on their own are registered in that frame, numbered from 0
+		target: 'Page | Frame' = self.page
+		offset = 0
+		parent = element.parent
+		while parent is not None:
+			if parent.frame_id is not None:
+				frame = self.frames.get(parent.frame_id)
+				if frame is None or frame.is_detached() or parent.frame_id not in self.highlight_offsets:
+					return None
+				target, offset = frame, self.highlight_offsets[parent.frame_id]
+				break
+			parent = parent.parent
+
+		try:
+			handle = await target.evaluate_handle(
+				RESOLVE_ELEMENT_JS,
+				{'index': element.highlight_index - offset, 'runName': self._registry_run, 'tagName': element.tag_name},
+			)
+		except Exception as e:
+			logger.debug(f'Failed to resolve element {element.highlight_index} from the page: {type(e).__name__}: {e}')
+			return None
+
+		element_handle = handle.as_element()
+		if element_handle is None:
+			await handle.dispose()
+		return element_handle
 
 	@time_execution_async('--get_cross_origin_iframes')
 	async def get_cross_origin_iframes(self) -> list[str]:
 		# invisible cross-origin iframes are used for ads and tracking, dont open those
 		hidden_frame_urls = await self.page.locator('iframe').filter(visible=False).evaluate_all('e => e.map(e => e.src)')
 
-		is_ad_url = lambda url: any(
-			domain in urlparse(url).netloc for domain in ('doubleclick.net', 'adroll.com', 'googletagmanager.com')
-		)
-
 		return [
 			frame.url
 			for frame in self.page.frames
 			if urlparse(frame.url).netloc  # exclude data:urls and about:blank
 			and urlparse(frame.url).netloc != urlparse(self.page.url).netloc  # exclude same-origin iframes
 			and frame.url not in hidden_frame_urls  # exclude hidden frames
-			and not is_ad_url(frame.url)  # exclude most common ad network tracker frame URLs
+			and not is_ad_frame_url(frame.url)  # exclude most common ad network tracker frame URLs
 		]
 
 	@time_execution_async('--build_dom_tree')
@@ -68,11 +356,21 @@ class DomService:
 		highlight_elements: bool,
 		focus_element: int,
 		viewport_expansion: int,
-	) -> tuple[DOMElementNode, SelectorMap]:
-		if await self.page.evaluate('1+1') != 2:
-			raise ValueError('The page cannot evaluate javascript code properly')
-
+		incremental: bool = False,
+		wire_format: Literal['json', 'columnar'] = 'json',
+		compact: bool = False,
+		per_frame: bool = False,
+		max_nodes: int | None = None,
+		time_budget_ms: int | None = None,
+		collect_marks: bool = False,
+		chunk_slice_ms: int | None = None,
+		minimal: bool = False,
+		draw_highlights: bool = True,
+	) -> tuple[DOMElementNode, SelectorMap, dict]:
+		"""Build the tree, also returning the raw page result for its flags (truncated, marks)"""
+		self._registry_selector_map = None
 		if self.page.url == 'about:blank':
+			self._reset_snapshot()
 			# short-circuit if the page is a new empty tab for speed, no need to inject buildDomTree.js
 			return (
 				DOMElementNode(
@@ -84,23 +382,37 @@ class DomService:
 					parent=None,
 				),
 				{},
+				{},
 			)
 
-		# NOTE: We execute JS code in the browser to extract important DOM information.
+		# NOTE: The backend extracts the important DOM information in the browser (buildDomTree.js by default).
 		#       The returned hash map contains information about the DOM tree and the
 		#       relationship between the DOM elements.
 		debug_mode = logger.getEffectiveLevel() == logging.DEBUG
-		args = {
-			'doHighlightElements': highlight_elements,
-			'focusHighlightIndex': focus_element,
-			'viewportExpansion': viewport_expansion,
-			'debugMode': debug_mode,
-		}
+		budgeted = max_nodes is not None or time_budget_ms is not None
+		chunked = chunk_slice_ms is not None
+		incremental = incremental and self.backend.supports_incremental and not (per_frame or budgeted or chunked or minimal)
+		args = DomExtractionArgs(
+			highlight_elements=highlight_elements,
+			focus_element=focus_element,
+			viewport_expansion=viewport_expansion,
+			debug_mode=debug_mode,
+			incremental=incremental,
+			incremental_base=self._snapshot_version if incremental else None,
+			wire_format=wire_format,
+			per_frame=per_frame,
+			max_nodes=max_nodes,
+			time_budget_ms=time_budget_ms,
+			collect_marks=collect_marks,
+			chunk_slice_ms=chunk_slice_ms,
+			minimal=minimal,
+			draw_highlights=draw_highlights,
+		)
 
 		try:
-			eval_page: dict = await self.page.evaluate(self.js_code, args)
+			eval_page: dict = await self.backend.extract(self, args)
 		except Exception as e:
-			logger.error('Error evaluating JavaScript: %s', e)
+			logger.error('Error extracting the DOM with the %s backend: %s', self.backend.name, e)
 			raise
 
 		# Only log performance metrics in debug mode
@@ -111,24 +423,43 @@ class DomService:
 				json.dumps(eval_page['perfMetrics'], indent=2),
 			)
 
-		return await self._construct_dom_tree(eval_page)
+		if eval_page.get('truncated'):
+			logger.debug(f'DOM extraction stopped at its budget (max_nodes={max_nodes}, time_budget_ms={time_budget_ms})')
+
+		if incremental:
+			element_tree, selector_map = await self._apply_dom_tree_delta(eval_page)
+		else:
+			self._reset_snapshot()
+			if compact or minimal:
+				element_tree, selector_map = await self._construct_dom_arena(eval_page)
+			else:
+				element_tree, selector_map = await self._construct_dom_tree(eval_page)
+
+		if self.backend.keeps_element_registry:
+			self._registry_selector_map = selector_map
+			self._registry_run = None
+			if not per_frame:
+				self.highlight_offsets = {}
+		return element_tree, selector_map, eval_page
+
+	@time_execution_async('--construct_dom_arena')
+	async def _construct_dom_arena(
+		self,
+		eval_page: dict,
+	) -> tuple[DOMElementNode, SelectorMap]:
+		return DOMArenaBuilder.from_eval_page(eval_page)
 
 	@time_execution_async('--construct_dom_tree')
 	async def _construct_dom_tree(
 		self,
 		eval_page: dict,
 	) -> tuple[DOMElementNode, SelectorMap]:
-		js_node_map = eval_page['map']
 		js_root_id = eval_page['rootId']
 
 		selector_map = {}
 		node_map = {}
 
-		for id, node_data in js_node_map.items():
-			node, children_ids = self._parse_node(node_data)
-			if node is None:
-				continue
-
+		for id, node, children_ids in self._parse_nodes(eval_page):
 			node_map[id] = node
 
 			if isinstance(node, DOMElementNode) and node.highlight_index is not None:
@@ -149,7 +480,6 @@ class DomService:
 		html_to_dict = node_map[str(js_root_id)]
 
 		del node_map
-		del js_node_map
 		del js_root_id
 
 		if html_to_dict is None or not isinstance(html_to_dict, DOMElementNode):
@@ -157,6 +487,198 @@ class DomService:
 
 		return html_to_dict, selector_map
 
+	@time_execution_async('--apply_dom_tree_delta')
+	async def _apply_dom_tree_delta(
+		self,
+		eval_page: dict,
+	) -> tuple[DOMElementNode, SelectorMap]:
+		"""
+		Build the tree of this snapshot from the previous one and the added/changed/removed nodes returned by the page.
+
+		Node ids are stable between calls. The previous tree is never modified, because the cached browser
+		state still holds it (e.g. `multi_act` compares the hashes of both): changed nodes are new objects,
+		and their ancestors are copied so the new tree links them. Unchanged subtrees are shared by both
+		trees, their `parent` points to the newest copy of the parent, which has the same fields.
+		"""
+		if eval_page.get('full', True):
+			self._reset_snapshot()
+
+		nodes = dict(self._snapshot_nodes)
+		children = dict(self._snapshot_children)
+		parents = dict(self._snapshot_parents)
+		selector_map = dict(self._snapshot_selector_map)
+
+		# nodes whose children are linked again: the changed nodes and every ancestor of a change
+		relink: set[str] = set()
+
+		def add_with_ancestors(id: str | None) -> None:
+			while id is not None and id not in relink:
+				relink.add(id)
+				id = parents.get(id)
+
+		for id in eval_page.get('removed', []):
+			node = nodes.pop(id, None)
+			children.pop(id, None)
+			add_with_ancestors(parents.pop(id, None))
+			if isinstance(node, DOMElementNode) and selector_map.get(node.highlight_index) is node:
+				del selector_map[node.highlight_index]
+
+		changed_ids = []
+		for id, node, children_ids in self._parse_nodes(eval_page):
+			existing = nodes.get(id)
+			if isinstance(existing, DOMElementNode) and selector_map.get(existing.highlight_index) is existing:
+				del selector_map[existing.highlight_index]
+			nodes[id] = node
+			children[id] = children_ids
+			changed_ids.append(id)
+
+			if isinstance(node, DOMElementNode) and node.highlight_index is not None:
+				selector_map[node.highlight_index] = node
+
+		changed = set(changed_ids)
+		for id in changed_ids:
+			add_with_ancestors(id)
+
+		# copy the unchanged ancestors instead of relinking the nodes of the previous tree
+		for id in relink - changed:
+			existing = nodes.get(id)
+			if not isinstance(existing, DOMElementNode):
+				continue
+			node = copy.copy(existing)
+			nodes[id] = node
+			if selector_map.get(node.highlight_index) is existing:
+				selector_map[node.highlight_index] = node
+
+		for id in relink:
+			node = nodes.get(id)
+			if not isinstance(node, DOMElementNode):
+				continue
+
+			node.children = []
+			for child_id in children.get(id, []):
+				child_node = nodes.get(child_id)
+				if child_node is None:
+					continue
+
+				child_node.parent = node
+				parents[child_id] = id
+				node.children.append(child_node)
+
+		root = nodes.get(str(eval_page['rootId']))
+		if root is None or not isinstance(root, DOMElementNode):
+			self._reset_snapshot()
+			raise ValueError('Failed to parse HTML to dictionary')
+
+		self._snapshot_version = eval_page.get('version')
+		self._snapshot_root_id = str(eval_page['rootId'])
+		self._snapshot_nodes = nodes
+		self._snapshot_children = children
+		self._snapshot_parents = parents
+		self._snapshot_selector_map = selector_map
+
+		return root, selector_map
+
+	async def evaluate_build_dom_tree(self, target: 'Page | Frame', js_args: dict) -> dict:
+		"""
+		Run buildDomTree.js in a page or frame with a single small call.
+
+		The script is installed as a versioned runtime on first use in every document, in the same call
+		that runs it, so it is only sent and compiled again after a navigation or a new script version.
+		"""
+		result = await target.evaluate(_RUN_RUNTIME_JS, js_args)
+		if result is None:
+			result = await target.evaluate(_INSTALL_RUNTIME_JS, js_args)
+		if not isinstance(result, dict):
+			raise ValueError('The page cannot evaluate javascript code properly')
+		return result
+
+	def frame_id(self, frame: 'Frame') -> str:
+		"""Stable id of a frame for the lifetime of this service"""
+		frame_id = self._frame_ids.get(frame)
+		if frame_id is None:
+			frame_id = f'frame-{self._next_frame_id}'
+			self._next_frame_id += 1
+			self._frame_ids[frame] = frame_id
+		self.frames[frame_id] = frame
+		return frame_id
+
+	def forget_detached_frames(self) -> None:
+		for frame_id, frame in list(self.frames.items()):
+			if frame.is_detached():
+				del self.frames[frame_id]
+				self.highlight_offsets.pop(frame_id, None)
+
+	def _reset_snapshot(self) -> None:
+		self._snapshot_version = None
+		self._snapshot_root_id = None
+		self._snapshot_nodes = {}
+		self._snapshot_children = {}
+		self._snapshot_parents = {}
+		self._snapshot_selector_map = {}
+
+	def _parse_nodes(self, eval_page: dict) -> Iterator[tuple[str, DOMBaseNode, list[str]]]:
+		"""Yield (id, node, children_ids) for every node of the page result, whichever wire format it uses."""
+		if 'columns' in eval_page:
+			yield from self._decode_columnar(eval_page['columns'])
+			return
+
+		for id, node_data in eval_page.get('map', {}).items():
+			node, children_ids = self._parse_node(node_data)
+			if node is None:
+				continue
+			yield id, node, children_ids
+
+	@staticmethod
+	def _decode_columnar(columns: dict) -> Iterator[tuple[str, DOMBaseNode, list[str]]]:
+		"""
+		Decode the columnar result of buildDomTree.js (see `encodeColumnar` there).
+
+		Works on whole columns at once: the string tables are resolved with a single pass and the
+		attribute and children slices are cut from the flat arrays by offset, so no intermediate
+		dict is built per node.
+		"""
+		tag_table = columns['tagTable']
+		attr_name_table = columns['attrNameTable']
+		string_table = columns['stringTable']
+
+		strings = [string_table[i] for i in columns['strings']]
+		attr_names = [attr_name_table[i] for i in columns['attrNames']]
+		attr_values = [string_table[i] for i in columns['attrValues']]
+		child_ids = [str(i) for i in columns['childIds']]
+		attr_offsets = columns['attrOffsets']
+		child_offsets = columns['childOffsets']
+		frame_ids = dict(zip(columns.get('frameRows', []), (string_table[i] for i in columns.get('frameIds', []))))
+		viewport_sizes = columns.get('viewportSizes', [])
+		viewports = {
+			row: ViewportInfo(width=viewport_sizes[2 * k], height=viewport_sizes[2 * k + 1])
+			for k, row in enumerate(columns.get('viewportRows', []))
+		}
+
+		for row, (id, flags, tag, string, highlight_index) in enumerate(
+			zip(columns['ids'], columns['flags'], columns['tags'], strings, columns['highlightIndices'])
+		):
+			if flags & _COLUMNAR_TEXT:
+				yield str(id), DOMTextNode(text=string, is_visible=bool(flags & _COLUMNAR_VISIBLE), parent=None), []
+				continue
+
+			attr_start, attr_end = attr_offsets[row], attr_offsets[row + 1]
+			element_node = DOMElementNode(
+				tag_name=tag_table[tag],
+				xpath=string,
+				attributes=dict(zip(attr_names[attr_start:attr_end], attr_values[attr_start:attr_end])),
+				children=[],
+				is_visible=bool(flags & _COLUMNAR_VISIBLE),
+				is_interactive=bool(flags & _COLUMNAR_INTERACTIVE),
+				is_top_element=bool(flags & _COLUMNAR_TOP_ELEMENT),
+				is_in_viewport=bool(flags & _COLUMNAR_IN_VIEWPORT),
+				highlight_index=highlight_index if highlight_index >= 0 else None,
+				shadow_root=bool(flags & _COLUMNAR_SHADOW_ROOT),
+				parent=None,
+				viewport_info=viewports.get(row),
+				frame_id=frame_ids.get(row),
+			)
+			yield str(id), element_node, child_ids[child_offsets[row] : child_offsets[row + 1]]
+
 	def _parse_node(
 		self,
 		node_data: dict,
@@ -196,6 +718,7 @@ class DomService:
 			shadow_root=node_data.get('shadowRoot', False),
 			parent=None,
 			viewport_info=viewport_info,
+			frame_id=node_data.get('frameId'),
 		)
 
 		children_ids = node_data.get('children', [])
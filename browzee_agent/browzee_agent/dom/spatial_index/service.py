@@ -0,0 +1,27 @@
+import numpy as np
+
+from browzee_agent.dom.spatial_index.views import SpatialIndex
+from browzee_agent.dom.views import DOMElementNode, HighlightMarks, SelectorMap
+from browzee_agent.utils import time_execution_sync
+
+
+class SpatialIndexBuilder:
+	"""
+	Builds the `SpatialIndex` of a snapshot from the boxes buildDomTree.js (or the CDP backend) returned
+	as `HighlightMarks`, so no geometry has to be read from the page again.
+	"""
+
+	@staticmethod
+	@time_execution_sync('--build_spatial_index')
+	def from_marks(marks: HighlightMarks, selector_map: SelectorMap, cell_size: int = 64) -> SpatialIndex:
+		nodes: list[DOMElementNode] = []
+		rows: list[list[float]] = []
+		for index, left, top, width, height in marks.boxes:
+			node = selector_map.get(int(index))
+			if node is None:
+				continue
+			nodes.append(node)
+			rows.append([left, top, left + width, top + height])
+
+		boxes = np.array(rows, dtype=np.float64).reshape(-1, 4)
+		return SpatialIndex(nodes, boxes, cell_size)
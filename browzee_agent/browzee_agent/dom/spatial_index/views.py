@@ -0,0 +1,111 @@
+import numpy as np
+
+from browzee_agent.dom.views import DOMElementNode
+
+
+class SpatialIndex:
+	"""
+	Uniform grid over the viewport boxes of the highlighted elements of one snapshot, built by
+	`SpatialIndexBuilder`. Coordinates are CSS pixels of the viewport, the same as `page.mouse`.
+
+	Every cell lists the boxes overlapping it, stored as one sorted array of cell ids with the matching
+	box positions, so a lookup is a binary search and a few vectorized comparisons.
+	"""
+
+	def __init__(self, nodes: list[DOMElementNode], boxes: np.ndarray, cell_size: int = 64) -> None:
+		self.nodes = nodes
+		# rows of [left, top, right, bottom]
+		self.boxes = boxes
+		self.cell_size = cell_size
+		self.positions: dict[int, int] = {node.highlight_index: position for position, node in enumerate(nodes)}  # type: ignore
+
+		if len(nodes):
+			self.origin = np.floor(boxes[:, :2].min(axis=0) / cell_size).astype(np.int64)
+			end = np.floor(boxes[:, 2:].max(axis=0) / cell_size).astype(np.int64)
+			self.columns = int(end[0] - self.origin[0] + 1)
+		else:
+			self.origin = np.zeros(2, dtype=np.int64)
+			self.columns = 1
+
+		first_cells = self._cells(boxes[:, :2])
+		last_cells = self._cells(boxes[:, 2:])
+		widths = last_cells[:, 0] - first_cells[:, 0] + 1
+		heights = last_cells[:, 1] - first_cells[:, 1] + 1
+		counts = widths * heights
+
+		# one (cell, box) pair per cell covered by each box
+		box_ids = np.repeat(np.arange(len(nodes)), counts)
+		offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+		cell_x = first_cells[box_ids, 0] + offsets % widths[box_ids]
+		cell_y = first_cells[box_ids, 1] + offsets // widths[box_ids]
+		cell_ids = cell_y * self.columns + cell_x
+
+		order = np.argsort(cell_ids, kind='stable')
+		self.cell_ids = cell_ids[order]
+		self.box_ids = box_ids[order]
+
+	def __len__(self) -> int:
+		return len(self.nodes)
+
+	def _cells(self, points: np.ndarray) -> np.ndarray:
+		return np.floor(points / self.cell_size).astype(np.int64) - self.origin
+
+	def _candidates(self, left: float, top: float, right: float, bottom: float) -> np.ndarray:
+		(x0, y0), (x1, y1) = self._cells(np.array([[left, top], [right, bottom]], dtype=np.float64))
+		x0, x1 = max(x0, 0), min(x1, self.columns - 1)
+		y0 = max(y0, 0)
+		if x0 > x1 or y1 < y0 or not len(self.nodes):
+			return np.empty(0, dtype=np.int64)
+
+		# each row of cells is a contiguous range of cell ids
+		rows = np.arange(y0, y1 + 1) * self.columns
+		starts = np.searchsorted(self.cell_ids, rows + x0, side='left')
+		ends = np.searchsorted(self.cell_ids, rows + x1, side='right')
+		return np.unique(np.concatenate([self.box_ids[start:end] for start, end in zip(starts, ends)]))
+
+	def box_of(self, highlight_index: int) -> tuple[float, float, float, float] | None:
+		"""(left, top, right, bottom) of the element with this highlight index"""
+		position = self.positions.get(highlight_index)
+		if position is None:
+			return None
+		left, top, right, bottom = self.boxes[position].tolist()
+		return left, top, right, bottom
+
+	def center_of(self, highlight_index: int) -> tuple[int, int] | None:
+		box = self.box_of(highlight_index)
+		if box is None:
+			return None
+		left, top, right, bottom = box
+		return int((left + right) / 2), int((top + bottom) / 2)
+
+	def element_at(self, x: float, y: float) -> DOMElementNode | None:
+		"""The innermost (smallest) element whose box contains the point"""
+		candidates = self._candidates(x, y, x, y)
+		boxes = self.boxes[candidates]
+		inside = (boxes[:, 0] <= x) & (x < boxes[:, 2]) & (boxes[:, 1] <= y) & (y < boxes[:, 3])
+		candidates, boxes = candidates[inside], boxes[inside]
+		if not len(candidates):
+			return None
+		areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+		# among equal boxes the later one in document order is usually painted on top
+		return self.nodes[candidates[np.lexsort((-candidates, areas))[0]]]
+
+	def overlapping(self, left: float, top: float, width: float, height: float) -> list[DOMElementNode]:
+		"""Elements whose box overlaps the rect, in highlight index order"""
+		right, bottom = left + width, top + height
+		candidates = self._candidates(left, top, right, bottom)
+		boxes = self.boxes[candidates]
+		overlaps = (boxes[:, 0] < right) & (left < boxes[:, 2]) & (boxes[:, 1] < bottom) & (top < boxes[:, 3])
+		return [self.nodes[position] for position in candidates[overlaps].tolist()]
+
+	def nearest(self, x: float, y: float, max_distance: float | None = None) -> DOMElementNode | None:
+		"""Element whose box is the closest to the point, 0 when the point is inside it"""
+		if not len(self.nodes):
+			return None
+		dx = np.maximum(np.maximum(self.boxes[:, 0] - x, x - self.boxes[:, 2]), 0)
+		dy = np.maximum(np.maximum(self.boxes[:, 1] - y, y - self.boxes[:, 3]), 0)
+		distances = dx * dx + dy * dy
+		position = int(np.argmin(distances))
+		if max_distance is not None and distances[position] > max_distance * max_distance:
+			return None
+		return self.nodes[position]
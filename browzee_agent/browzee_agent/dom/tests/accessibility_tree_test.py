@@ -0,0 +1,53 @@
+from browzee_agent.dom.accessibility.service import AccessibilityTreeSerializer
+from browzee_agent.dom.tests.helpers import dom_state, element, text
+from browzee_agent.dom.views import DOMState
+
+
+def build_state() -> DOMState:
+	eval_page = {
+		'rootId': 'html',
+		'map': {
+			'title': text('Sign in'),
+			'h1': element('h1', 'html/body/h1', ['title']),
+			'email': element('input', 'html/body/form/input[1]', highlight_index=0, type='email', placeholder='Email', value='a@b.c'),
+			'remember_text': text('Remember me'),
+			'remember': element('input', 'html/body/form/label/input', highlight_index=2, type='checkbox', checked=''),
+			'label': element('label', 'html/body/form/label', ['remember', 'remember_text'], highlight_index=1),
+			'submit_text': text('Continue'),
+			'submit': element('button', 'html/body/form/div/button', ['submit_text'], highlight_index=4, disabled=''),
+			# a clickable layout div around the button
+			'wrapper': element('div', 'html/body/form/div', ['submit'], highlight_index=3),
+			'form': element('form', 'html/body/form', ['email', 'label', 'wrapper']),
+			'help': element('a', 'html/body/a', highlight_index=5, href='/help', **{'aria-label': 'Help', 'aria-expanded': 'false'}),
+			'body': element('body', 'html/body', ['h1', 'form', 'help']),
+			'html': element('html', 'html', ['body']),
+		},
+	}
+	state = dom_state(eval_page)
+	for node in state.selector_map.values():
+		node.is_new = False
+	return state
+
+
+def test_serialize():
+	state = build_state()
+	assert AccessibilityTreeSerializer.serialize(state.element_tree) == '\n'.join(
+		[
+			'Sign in',
+			'[0] textbox "Email" value="a@b.c"',
+			'[1] generic "Remember me"',
+			'\t[2] checkbox checked',
+			'[4] button "Continue" disabled',
+			'[5] link "Help" expanded=false',
+		]
+	)
+
+
+def test_keep_and_budget():
+	state = build_state()
+	assert AccessibilityTreeSerializer.serialize(state.element_tree, keep={1, 4}) == '\n'.join(
+		['Sign in', '[1] generic "Remember me"', '[4] button "Continue" disabled']
+	)
+	truncated = AccessibilityTreeSerializer.serialize(state.element_tree, max_tokens=15).split('\n')
+	assert truncated[:2] == ['Sign in', '[0] textbox "Email" value="a@b.c"']
+	assert truncated[-1].startswith('... content truncated')
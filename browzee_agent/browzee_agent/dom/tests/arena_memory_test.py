@@ -0,0 +1,112 @@
+import gc
+import random
+import tracemalloc
+
+import psutil
+import pytest
+
+from browzee_agent.dom.arena.service import DOMArenaBuilder
+from browzee_agent.dom.tests.helpers import construct
+from browzee_agent.dom.views import DOMElementNode, DOMTextNode
+
+
+def make_page(n_nodes: int = 40_000, seed: int = 0) -> dict:
+	"""Synthetic buildDomTree.js result, ids are assigned bottom up like on a real page."""
+	rng = random.Random(seed)
+	node_map: dict[str, dict] = {}
+	highlight_index = 0
+
+	def add(depth: int) -> str:
+		nonlocal highlight_index
+		children = []
+		while len(node_map) < n_nodes and depth < 12 and rng.random() < 0.8 - depth * 0.05:
+			children.append(add(depth + 1))
+		if rng.random() < 0.5:
+			id = str(len(node_map))
+			node_map[id] = {'type': 'TEXT_NODE', 'text': f'text {rng.randint(0, 500)}', 'isVisible': True}
+			children.append(id)
+
+		id = str(len(node_map))
+		tag = rng.choice(['div', 'span', 'a', 'li', 'button', 'input'])
+		node_data = {
+			'tagName': tag,
+			'attributes': {'class': f'c{rng.randint(0, 50)}', 'role': 'button'} if tag in ('a', 'button') else {},
+			'xpath': f'html/body/div[{depth}]/{tag}[{len(node_map)}]',
+			'children': children,
+			'isVisible': True,
+			'isTopElement': True,
+			'isInViewport': True,
+		}
+		if tag in ('a', 'button', 'input'):
+			node_data['isInteractive'] = True
+			node_data['highlightIndex'] = highlight_index
+			highlight_index += 1
+		node_map[id] = node_data
+		return id
+
+	roots = []
+	while len(node_map) < n_nodes:
+		roots.append(add(1))
+	body_id = str(len(node_map))
+	node_map[body_id] = {'tagName': 'body', 'attributes': {}, 'xpath': '/body', 'children': roots, 'isVisible': True}
+	return {'rootId': body_id, 'map': node_map}
+
+
+def measure(build, eval_page: dict) -> tuple[int, int]:
+	"""Retained (traced bytes, RSS bytes) of one snapshot."""
+	gc.collect()
+	process = psutil.Process()
+	rss_before = process.memory_info().rss
+	tracemalloc.start()
+	snapshot = build(eval_page)
+	gc.collect()
+	traced, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	rss_after = process.memory_info().rss
+	del snapshot
+	return traced, rss_after - rss_before
+
+
+def test_arena_matches_dataclass_tree():
+	eval_page = make_page(3_000)
+	tree, selector_map = construct(eval_page)
+	arena_tree, arena_selector_map = DOMArenaBuilder.from_eval_page(eval_page)
+
+	assert isinstance(arena_tree, DOMElementNode)
+	assert any(isinstance(child, DOMTextNode) for node in arena_selector_map.values() for child in node.children)
+	assert arena_tree.clickable_elements_to_string(['role']) == tree.clickable_elements_to_string(['role'])
+	assert sorted(arena_selector_map) == sorted(selector_map)
+	for index, node in selector_map.items():
+		assert arena_selector_map[index].hash == node.hash
+		assert arena_selector_map[index].get_all_text_till_next_clickable_element() == (
+			node.get_all_text_till_next_clickable_element()
+		)
+
+
+def test_arena_view_writes():
+	_, arena_selector_map = DOMArenaBuilder.from_eval_page(make_page(500))
+	button = next(node for node in arena_selector_map.values() if node.tag_name == 'button')
+
+	# attribute writes are kept, by every view of the same node
+	button.attributes['aria-label'] = 'Submit'
+	assert button.attributes['aria-label'] == 'Submit'
+	assert button._arena.node(button._index).attributes['aria-label'] == 'Submit'
+
+	# the children live in the arena arrays and cannot be changed through a view
+	with pytest.raises(AttributeError):
+		button.parent.children.append(button)  # type: ignore
+
+
+def test_arena_memory():
+	eval_page = make_page(40_000)
+	dataclass_traced, dataclass_rss = measure(construct, eval_page)
+	arena_traced, arena_rss = measure(DOMArenaBuilder.from_eval_page, eval_page)
+
+	print(f'dataclass tree: {dataclass_traced / 1e6:.1f} MB traced, {dataclass_rss / 1e6:.1f} MB RSS')
+	print(f'arena tree:     {arena_traced / 1e6:.1f} MB traced, {arena_rss / 1e6:.1f} MB RSS')
+	assert arena_traced < dataclass_traced / 2
+
+
+if __name__ == '__main__':
+	test_arena_matches_dataclass_tree()
+	test_arena_memory()
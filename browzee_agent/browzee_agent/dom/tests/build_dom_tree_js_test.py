@@ -0,0 +1,304 @@
+import asyncio
+import json
+import random
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from browzee_agent.dom.extraction.views import DomExtractionArgs
+from browzee_agent.dom.service import BUILD_DOM_TREE_JS, DomService
+from browzee_agent.dom.tests.helpers import construct
+
+pytestmark = pytest.mark.skipif(shutil.which('node') is None, reason='node is not installed')
+
+FAKE_DOM_JS = (Path(__file__).parent / 'fake_dom.js').read_text()
+CONTAINER_TAGS = ('div', 'span', 'p', 'section', 'ul', 'li')
+
+
+def run_page(page: dict, driver: str):
+	"""
+	Runs `driver` in node on the fake page built from `page` (see fake_dom.js), with the script of
+	buildDomTree.js as `extract` and its source as `source`. The driver writes its result as JSON to stdout.
+	"""
+	# the script is too long for a command line argument, node reads it from stdin
+	script = (
+		FAKE_DOM_JS
+		+ f'const extract = {BUILD_DOM_TREE_JS.strip().rstrip(";")};'
+		+ 'const source = extract.toString();'
+		+ f'(async () => {{ const document = installPage({json.dumps(page)});'
+		+ driver
+		+ '})();'
+	)
+	result = subprocess.run(['node', '-'], input=script, capture_output=True, text=True, check=True)
+	return json.loads(result.stdout)
+
+
+def random_children(rng: random.Random, depth: int) -> list[dict]:
+	"""Wide levels with repeated tags, so most xpath steps need a position"""
+	children = []
+	for _ in range(rng.randint(1, 6)):
+		child: dict = {'tag': rng.choice(CONTAINER_TAGS)}
+		if depth > 0 and rng.random() < 0.6:
+			child['children'] = random_children(rng, depth - 1)
+		else:
+			child['children'] = [{'text': 'item'}]
+		children.append(child)
+	return children
+
+
+def random_page(seed: int) -> dict:
+	rng = random.Random(seed)
+	body = random_children(rng, 3)
+	body.insert(rng.randint(0, len(body)), {'tag': 'div', 'shadow': random_children(rng, 2), 'children': random_children(rng, 1)})
+	body.insert(
+		rng.randint(0, len(body)),
+		{'tag': 'iframe', 'document': {'tag': 'html', 'children': [{'tag': 'body', 'children': random_children(rng, 2)}]}},
+	)
+	return {'tag': 'html', 'children': [{'tag': 'head'}, {'tag': 'body', 'children': body}]}
+
+
+# the nodes of the extraction in document order, shadow children first like the traversal
+WALK_JS = """
+const walk = (map, id, nodes = []) => {
+  const node = map[id];
+  if (node.type === 'TEXT_NODE') return nodes;
+  nodes.push(node);
+  for (const child of node.children) walk(map, child, nodes);
+  return nodes;
+};
+"""
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_traversal_xpaths_equal_get_xpath_tree(seed):
+	driver = (
+		WALK_JS
+		+ 'const xpathCache = new WeakMap(); const debugMode = false;'
+		+ "eval(innerFunction(source, 'getElementPosition') + innerFunction(source, 'getXPathTree'));"
+		+ 'const result = await extract({ doHighlightElements: false, focusHighlightIndex: -1, viewportExpansion: -1 });'
+		# body reports '/body' instead of its path
+		+ 'const traversal = walk(result.map, result.rootId).slice(1).map(node => [node.tagName, node.xpath]);'
+		+ 'const elements = allElements(document.body).map(element => [element.tagName.toLowerCase(), getXPathTree(element)]);'
+		+ 'process.stdout.write(JSON.stringify({ traversal, elements }));'
+	)
+	result = run_page(random_page(seed), driver)
+	assert len(result['elements']) > 20
+	assert result['traversal'] == result['elements']
+	# positions, shadow roots and frames all show up
+	xpaths = [xpath for _, xpath in result['elements']]
+	assert any('[2]' in xpath for xpath in xpaths)
+	assert '' in xpaths and 'html' in xpaths
+
+
+def hit_test_page() -> dict:
+	"""Nested boxes of the same size sharing their center, covered elements, a shadow root and an element below the fold"""
+	menu_item = {'tag': 'li', 'rect': [0, 0, 200, 60], 'children': [{'tag': 'a', 'attrs': {'href': '/'}, 'children': [{'tag': 'span', 'children': [{'text': 'Home'}]}]}]}
+	body = [
+		{'tag': 'nav', 'rect': [0, 0, 1280, 60], 'children': [{'tag': 'ul', 'children': [menu_item]}]},
+		{'tag': 'button', 'rect': [100, 100, 200, 50], 'children': [{'text': 'Covered'}]},
+		{'tag': 'div', 'attrs': {'id': 'overlay'}, 'rect': [50, 80, 400, 120]},
+		{
+			'tag': 'div',
+			'rect': [300, 300, 400, 200],
+			'children': [{'tag': 'div', 'children': [{'tag': 'div', 'children': [{'tag': 'button', 'rect': [450, 380, 100, 40]}]}]}],
+		},
+		# the shadow root gets its own hit tests at the same points as the document
+		{
+			'tag': 'div',
+			'rect': [0, 600, 400, 100],
+			'shadow': [{'tag': 'div', 'rect': [0, 600, 400, 100], 'children': [{'tag': 'button', 'rect': [150, 630, 100, 40]}]}],
+		},
+		{'tag': 'div', 'rect': [0, 2000, 100, 100], 'children': [{'text': 'below the fold'}]},
+	]
+	return {'tag': 'html', 'children': [{'tag': 'body', 'children': body}]}
+
+
+def test_cached_hit_tests_find_the_same_top_elements():
+	driver = (
+		WALK_JS
+		# the uncached check of isTopElement
+		+ """
+const isTop = element => {
+  const [rect] = element.getClientRects();
+  if (!rect || rect.bottom < 0 || rect.top > window.innerHeight || rect.right < 0 || rect.left > window.innerWidth) return false;
+  const root = element.getRootNode();
+  for (let hit = root.elementFromPoint(rect.left + rect.width / 2, rect.top + rect.height / 2); hit && hit !== root; hit = hit.parentElement) {
+    if (hit === element) return true;
+  }
+  return false;
+};
+"""
+		+ 'const result = await extract({ doHighlightElements: false, focusHighlightIndex: -1, viewportExpansion: 0, debugMode: true });'
+		+ 'const hitTests = fakeDom.hitTests;'
+		+ 'const traversal = walk(result.map, result.rootId).slice(1).map(node => node.isTopElement);'
+		+ 'const elements = allElements(document.body).map(isTop);'
+		+ 'process.stdout.write(JSON.stringify({ traversal, elements, hitTests, metrics: result.perfMetrics.layoutMetrics }));'
+	)
+	result = run_page(hit_test_page(), driver)
+	assert result['traversal'] == result['elements']
+	assert result['elements'].count(False) >= 2
+
+	metrics = result['metrics']
+	assert metrics['elementFromPointCalls'] == result['hitTests']
+	# every element on screen is checked, the nested boxes with a single hit test
+	assert metrics['elementFromPointCalls'] + metrics['hitTestCacheHits'] == len(result['elements']) - 1
+	assert metrics['hitTestCacheHits'] >= 5
+
+
+def test_chunked_extraction_equals_the_synchronous_one():
+	page = random_page(7)
+	page['children'][1]['children'].append({'tag': 'button', 'attrs': {'id': 'tail'}, 'children': [{'text': 'Last'}]})
+	args = "{ doHighlightElements: false, focusHighlightIndex: -1, viewportExpansion: -1 }"
+	driver = (
+		f'const args = {args};'
+		+ 'const full = await extract(args);'
+		+ 'const chunked = await extract({ ...args, chunkSliceMs: 0 });'
+		+ 'const yields = fakeDom.yields;'
+		# the page removes an element the traversal did not reach yet while it has the main thread
+		+ "fakeDom.onYield = () => document.getElementById('tail')?.remove();"
+		+ 'const chunkedAfterRemoval = await extract({ ...args, chunkSliceMs: 0 });'
+		+ 'fakeDom.onYield = null;'
+		+ 'const fullAfterRemoval = await extract(args);'
+		+ 'process.stdout.write(JSON.stringify({ full, chunked, yields, chunkedAfterRemoval, fullAfterRemoval }));'
+	)
+	result = run_page(page, driver)
+	assert result['yields'] >= 2
+	assert result['chunked'] == result['full']
+	assert result['chunkedAfterRemoval'] == result['fullAfterRemoval']
+	assert 'tail' in json.dumps(result['full']) and 'tail' not in json.dumps(result['fullAfterRemoval'])
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_incremental_delta_applied_to_the_base_gives_the_full_snapshot(seed):
+	args = '{ doHighlightElements: true, drawHighlights: false, focusHighlightIndex: -1, viewportExpansion: 0, incremental: true }'
+	driver = (
+		f'const args = {args};'
+		+ 'const base = await extract(args);'
+		+ 'const controls = allElements(document.body).filter(element => element.attrs.title);'
+		+ "controls[0].childNodes[0].data = 'renamed';"
+		+ "controls[1].setAttribute('title', 'retitled');"
+		+ 'controls[2].remove();'
+		# the MutationObserver of fake_dom.js does not deliver records
+		+ 'window._domTreeRegistry.dirty = true;'
+		+ 'const delta = await extract({ ...args, incrementalBase: base.version });'
+		+ 'const full = await extract(args);'
+		+ 'process.stdout.write(JSON.stringify({ base, delta, full }));'
+	)
+	result = run_page(interactive_page(seed), driver)
+	base, delta, full = result['base'], result['delta'], result['full']
+	assert not delta['full'] and full['full']
+	assert 0 < len(delta['map']) < len(full['map']) / 2 and delta['removed']
+
+	patched = {**base['map'], **delta['map']}
+	for node_id in delta['removed']:
+		del patched[node_id]
+	assert patched == full['map']
+
+
+def interactive_page(seed: int) -> dict:
+	"""
+	Controls on a grid with text around them, nested in containers. Some are hidden, covered by the
+	next control (every fifth cell is shifted) or below the fold, and some controls are nested in others.
+	"""
+	rng = random.Random(seed)
+	cells = iter(range(1000))
+
+	def control(depth: int) -> dict:
+		cell = next(cells)
+		node: dict = {
+			'tag': rng.choice(('button', 'a', 'input', 'span')),
+			'attrs': {'title': f'control {cell}'},
+			'rect': place(cell, 100, 40),
+			'children': [{'text': f'label {cell}'}],
+		}
+		if node['tag'] == 'a':
+			node['attrs']['href'] = f'/{cell}'
+		if node['tag'] == 'span':
+			node['attrs']['onclick'] = 'go()'
+		if rng.random() < 0.1:
+			node['style'] = {'visibility': 'hidden'}
+		if depth > 0 and rng.random() < 0.2:
+			node['children'].append(control(depth - 1))
+		return node
+
+	def place(cell: int, width: int, height: int) -> list[int]:
+		return [(cell % 10) * 120 + (60 if cell % 5 == 1 else 0), (cell // 10) * 60, width, height]
+
+	def container(depth: int) -> dict:
+		# a small box of its own, so the containers do not cover each other's controls
+		cell = next(cells)
+		children: list[dict] = []
+		for _ in range(rng.randint(1, 5)):
+			roll = rng.random()
+			if roll < 0.25:
+				children.append({'text': f'paragraph {rng.randint(0, 99)}'})
+			elif roll < 0.6 or depth == 0:
+				children.append(control(2))
+			else:
+				children.append(container(depth - 1))
+		return {'tag': rng.choice(CONTAINER_TAGS), 'rect': place(cell, 10, 10), 'children': children}
+
+	body = [container(4) for _ in range(4)]
+	return {'tag': 'html', 'children': [{'tag': 'body', 'children': body}]}
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_minimal_extraction_gives_the_same_element_list(seed):
+	args = '{ doHighlightElements: true, drawHighlights: false, focusHighlightIndex: -1, viewportExpansion: 0 }'
+	driver = (
+		f'const args = {args};'
+		+ 'const full = await extract(args);'
+		+ 'const minimal = await extract({ ...args, minimal: true });'
+		+ 'process.stdout.write(JSON.stringify({ full, minimal }));'
+	)
+	result = run_page(interactive_page(seed), driver)
+	assert len(result['minimal']['map']) < len(result['full']['map'])
+
+	dom_service = DomService(None)  # type: ignore
+	full_tree, full_selector_map = construct(result['full'], dom_service)
+	minimal_tree, minimal_selector_map = asyncio.run(dom_service._construct_dom_arena(result['minimal']))
+	assert len(full_selector_map) > 10
+	assert minimal_selector_map.keys() == full_selector_map.keys()
+	assert all(minimal_selector_map[index].hash == full_selector_map[index].hash for index in full_selector_map)
+	for options in (
+		{},
+		{'include_attributes': ['title', 'href']},
+		{'include_attributes': ['title'], 'compress_repeated': True},
+		{'max_text_length': 8},
+	):
+		assert minimal_tree.clickable_elements_to_string(**options) == full_tree.clickable_elements_to_string(**options)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_set_of_marks_highlights_the_same_elements_as_the_overlays(seed):
+	page = interactive_page(seed)
+	# a clickable child of a highlighted button is not highlighted on its own
+	button = {
+		'tag': 'button',
+		'rect': [0, 700, 200, 40],
+		'children': [{'tag': 'div', 'style': {'cursor': 'pointer'}, 'rect': [10, 710, 100, 20], 'children': [{'text': 'Save'}]}],
+	}
+	page['children'][0]['children'].append(button)
+	overlays = DomExtractionArgs(highlight_elements=True, focus_element=-1, viewport_expansion=0)
+	# what BrowserContext passes with set_of_marks_screenshot
+	set_of_marks = DomExtractionArgs(
+		highlight_elements=True, focus_element=-1, viewport_expansion=0, draw_highlights=False, collect_marks=True
+	)
+	driver = (
+		f'const setOfMarks = await extract({json.dumps(set_of_marks.to_js_args())});'
+		+ f'const overlays = await extract({json.dumps(overlays.to_js_args())});'
+		+ "const drawn = document.getElementById('playwright-highlight-container').children.length;"
+		+ 'process.stdout.write(JSON.stringify({ setOfMarks, overlays, drawn }));'
+	)
+	result = run_page(page, driver)
+	assert result['drawn'] > 0
+	assert len(result['setOfMarks']['marks']['boxes']) == result['overlays']['highlightCount']
+
+	_, overlays_selector_map = construct(result['overlays'])
+	_, set_of_marks_selector_map = construct(result['setOfMarks'])
+	assert {index: node.xpath for index, node in set_of_marks_selector_map.items()} == {
+		index: node.xpath for index, node in overlays_selector_map.items()
+	}
+	assert [node.tag_name for node in overlays_selector_map.values()].count('div') == 0
@@ -0,0 +1,169 @@
+from browzee_agent.dom.extraction.service import SnapshotTreeBuilder
+from browzee_agent.dom.extraction.views import DomExtractionArgs
+from browzee_agent.dom.tests.helpers import construct
+
+DEFAULT_STYLES = {
+	'display': 'block',
+	'visibility': 'visible',
+	'opacity': '1',
+	'cursor': 'auto',
+	'pointer-events': 'auto',
+	'position': 'static',
+}
+
+
+def element(name, attributes=None, bounds=None, children=(), **styles):
+	return {
+		'type': 1,
+		'name': name,
+		'attributes': attributes or {},
+		'bounds': bounds,
+		'children': list(children),
+		'styles': {**DEFAULT_STYLES, **{key.replace('_', '-'): value for key, value in styles.items()}},
+	}
+
+
+def text(value, bounds=None):
+	return {'type': 3, 'name': '#text', 'value': value, 'bounds': bounds, 'children': []}
+
+
+def shadow_root(*children):
+	return {'type': 11, 'name': '#document-fragment', 'children': list(children)}
+
+
+def make_snapshot(*documents):
+	"""Encode nested node specs into the DOMSnapshot.captureSnapshot format"""
+	strings: list[str] = []
+
+	def intern(value: str) -> int:
+		if value not in strings:
+			strings.append(value)
+		return strings.index(value)
+
+	encoded_documents = []
+	for html in documents:
+		nodes = {
+			'parentIndex': [],
+			'nodeType': [],
+			'nodeName': [],
+			'nodeValue': [],
+			'backendNodeId': [],
+			'attributes': [],
+			'contentDocumentIndex': {'index': [], 'value': []},
+		}
+		layout = {'nodeIndex': [], 'styles': [], 'bounds': [], 'paintOrders': []}
+
+		def add(node, parent):
+			index = len(nodes['parentIndex'])
+			nodes['parentIndex'].append(parent)
+			nodes['nodeType'].append(node['type'])
+			nodes['nodeName'].append(intern(node['name']))
+			nodes['nodeValue'].append(intern(node['value']) if 'value' in node else -1)
+			nodes['backendNodeId'].append(1000 * len(encoded_documents) + index)
+			nodes['attributes'].append([intern(x) for item in node.get('attributes', {}).items() for x in item])
+			if 'content_document' in node:
+				nodes['contentDocumentIndex']['index'].append(index)
+				nodes['contentDocumentIndex']['value'].append(node['content_document'])
+			if node.get('bounds'):
+				layout['nodeIndex'].append(index)
+				layout['bounds'].append(node['bounds'])
+				layout['paintOrders'].append(index)
+				styles = node.get('styles', DEFAULT_STYLES)
+				layout['styles'].append([intern(styles[name]) for name in DEFAULT_STYLES])
+			for child in node['children']:
+				add(child, index)
+
+		add({'type': 9, 'name': '#document', 'children': [html]}, -1)
+		encoded_documents.append({'nodes': nodes, 'layout': layout, 'scrollOffsetX': 0, 'scrollOffsetY': 0})
+
+	return {'documents': encoded_documents, 'strings': strings}
+
+
+def build(snapshot, viewport_expansion=0, ax_roles=None):
+	args = DomExtractionArgs(highlight_elements=True, focus_element=-1, viewport_expansion=viewport_expansion)
+	builder = SnapshotTreeBuilder(snapshot, ax_roles or {}, viewport_size=(1000, 800), args=args)
+	eval_page = builder.build()
+	return construct(eval_page), builder
+
+
+def test_snapshot_tree_matches_build_dom_tree_rules():
+	iframe_html = element('HTML', bounds=[0, 0, 300, 200], children=[
+		element('BODY', bounds=[0, 0, 300, 200], children=[
+			element('BUTTON', bounds=[10, 10, 50, 20], children=[text('In frame', [12, 12, 40, 10])]),
+		]),
+	])
+	iframe = element('IFRAME', {'src': 'https://example.com'}, bounds=[0, 400, 300, 200])
+	iframe['content_document'] = 1
+	html = element('HTML', bounds=[0, 0, 1000, 3000], children=[
+		element('BODY', bounds=[0, 0, 1000, 3000], children=[
+			element('DIV', bounds=[0, 0, 1000, 300], children=[
+				element('A', {'href': '/home'}, bounds=[10, 10, 100, 20], cursor='pointer', children=[text('Home', [10, 10, 40, 20])]),
+				element('A', {}, bounds=[10, 40, 100, 20]),
+				element('SPAN', {'role': 'checkbox'}, bounds=[10, 70, 20, 20]),
+				element('BUTTON', {'disabled': ''}, bounds=[10, 100, 50, 20], children=[text('Off', [10, 100, 20, 20])]),
+				element('DIV', {'class': 'cover'}, bounds=[0, 130, 1000, 40], children=[
+					element('BUTTON', bounds=[10, 130, 50, 20], children=[text('Hidden', [10, 130, 20, 20])]),
+				]),
+			]),
+			element('DIV', bounds=[0, 300, 1000, 100], children=[
+				element('MY-WIDGET', bounds=[0, 300, 200, 50], children=[
+					shadow_root(element('INPUT', {'type': 'text'}, bounds=[0, 300, 200, 30])),
+					text('Light', [0, 330, 50, 20]),
+				]),
+			]),
+			iframe,
+			element('BUTTON', bounds=[10, 2500, 50, 20], children=[text('Far', [10, 2500, 20, 20])]),
+			element('SCRIPT', children=[text('var x')]),
+		]),
+	])
+	# a later painted overlay covering the button inside .cover
+	html['children'][0]['children'][0]['children'].append(element('DIV', bounds=[0, 120, 1000, 60]))
+
+	(root, selector_map), builder = build(make_snapshot(html, iframe_html))
+
+	# like buildDomTree.js, the empty anchor gets index 1 before it is dropped
+	highlighted = {index: (node.tag_name, node.xpath) for index, node in selector_map.items()}
+	assert highlighted == {
+		0: ('a', 'html/body/div[1]/a[1]'),
+		2: ('span', 'html/body/div[1]/span'),
+		3: ('input', ''),
+		4: ('button', 'html/body/button'),
+	}
+	assert len(builder.highlights) == 5
+
+	assert root.xpath == '/body'
+	assert [child.tag_name for child in root.children] == ['div', 'div', 'iframe', 'button']
+	first_div = root.children[0]
+	# the anchor without href or children is dropped, the disabled button is kept but not interactive
+	assert [child.tag_name for child in first_div.children] == ['a', 'span', 'button', 'div', 'div']
+	assert not first_div.children[2].is_interactive
+	# covered by the overlay, so not the top element
+	assert first_div.children[3].children[0].is_top_element is False
+
+	widget = root.children[1].children[0]
+	assert widget.shadow_root
+	assert [getattr(child, 'tag_name', None) or child.text for child in widget.children] == ['input', 'Light']
+
+	frame_button = root.children[2].children[0].children[0].children[0]
+	assert frame_button.xpath == 'html/body/button'
+	assert frame_button.is_top_element and frame_button.highlight_index == 4
+
+	far_button = root.children[3]
+	assert far_button.highlight_index is None
+	assert not far_button.children[0].is_visible
+
+
+def test_accessibility_roles_make_elements_interactive():
+	html = element('HTML', bounds=[0, 0, 1000, 800], children=[
+		element('BODY', bounds=[0, 0, 1000, 800], children=[
+			element('DIV', {'tabindex': '0'}, bounds=[10, 10, 100, 20], children=[text('Toggle', [10, 10, 50, 20])]),
+		]),
+	])
+	snapshot = make_snapshot(html)
+
+	(_, selector_map), _ = build(snapshot)
+	assert selector_map == {}
+
+	div_backend_node_id = snapshot['documents'][0]['nodes']['backendNodeId'][3]
+	(_, selector_map), _ = build(snapshot, ax_roles={div_backend_node_id: 'switch'})
+	assert [node.attributes for node in selector_map.values()] == [{'tabindex': '0'}]
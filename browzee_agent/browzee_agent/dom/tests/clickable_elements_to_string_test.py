@@ -0,0 +1,181 @@
+import random
+import sys
+import time
+
+from browzee_agent.dom.views import DOMBaseNode, DOMElementNode, DOMTextNode, SerializedFragmentCache
+
+INCLUDE_ATTRIBUTES = ['title', 'type', 'name', 'role', 'aria-label', 'placeholder']
+
+
+def legacy_clickable_elements_to_string(root: DOMElementNode, include_attributes: list[str] | None = None) -> str:
+	"""The recursive implementation the single-pass serializer replaced, kept as reference."""
+	formatted_text = []
+
+	def process_node(node: DOMBaseNode, depth: int) -> None:
+		next_depth = int(depth)
+		depth_str = depth * '\t'
+
+		if isinstance(node, DOMElementNode):
+			if node.highlight_index is not None:
+				next_depth += 1
+				text = node.get_all_text_till_next_clickable_element()
+				formatted_text.append(node._clickable_element_line(depth, text, include_attributes, None))
+
+			for child in node.children:
+				process_node(child, next_depth)
+
+		elif isinstance(node, DOMTextNode):
+			if (
+				not node.has_parent_with_highlight_index()
+				and node.parent
+				and node.parent.is_visible
+				and node.parent.is_top_element
+			):
+				formatted_text.append(f'{depth_str}{node.text}')
+
+	process_node(root, 0)
+	return '\n'.join(formatted_text)
+
+
+def make_tree(n_nodes: int, max_depth: int, seed: int = 0) -> DOMElementNode:
+	rng = random.Random(seed)
+	root = DOMElementNode(tag_name='body', xpath='/body', attributes={}, children=[], is_visible=True, parent=None)
+	open_elements = [(root, 0)]
+	highlight_index = 0
+
+	for i in range(n_nodes):
+		parent, depth = open_elements[rng.randrange(len(open_elements))] if rng.random() < 0.3 else open_elements[-1]
+		if rng.random() < 0.4 or depth >= max_depth:
+			node = DOMTextNode(text=f' text {rng.randint(0, 1000)} ', is_visible=True, parent=parent)
+		else:
+			node = DOMElementNode(
+				tag_name=rng.choice(['div', 'a', 'button', 'span', 'input']),
+				xpath=f'/body/div[{i}]',
+				attributes={'role': 'button', 'aria-label': f'label {i % 7}', 'class': 'x'} if rng.random() < 0.3 else {},
+				children=[],
+				is_visible=rng.random() < 0.9,
+				is_top_element=rng.random() < 0.9,
+				parent=parent,
+			)
+			if rng.random() < 0.15:
+				node.highlight_index = highlight_index
+				node.is_new = rng.random() < 0.2
+				highlight_index += 1
+			open_elements.append((node, depth + 1))
+		parent.children.append(node)
+
+	return root
+
+
+def test_equivalence():
+	for seed, max_depth in [(0, 5), (1, 40), (2, 400)]:
+		root = make_tree(5_000, max_depth, seed)
+		assert root.clickable_elements_to_string(INCLUDE_ATTRIBUTES) == legacy_clickable_elements_to_string(
+			root, INCLUDE_ATTRIBUTES
+		)
+		assert root.clickable_elements_to_string() == legacy_clickable_elements_to_string(root)
+
+
+def test_budgets():
+	root = make_tree(5_000, 40)
+	full = root.clickable_elements_to_string(INCLUDE_ATTRIBUTES)
+
+	capped = root.clickable_elements_to_string(INCLUDE_ATTRIBUTES, max_text_length=10)
+	assert len(capped) < len(full)
+
+	budgeted = root.clickable_elements_to_string(INCLUDE_ATTRIBUTES, max_tokens=500)
+	lines = budgeted.split('\n')
+	assert lines[-1].startswith('... content truncated')
+	assert len('\n'.join(lines[:-1])) <= 500 * 3
+	assert full.startswith('\n'.join(lines[:-1]))
+
+
+def test_speed_100k():
+	sys.setrecursionlimit(10_000)
+	root = make_tree(100_000, 2_000)
+
+	start = time.perf_counter()
+	new = root.clickable_elements_to_string(INCLUDE_ATTRIBUTES)
+	new_time = time.perf_counter() - start
+
+	start = time.perf_counter()
+	legacy = legacy_clickable_elements_to_string(root, INCLUDE_ATTRIBUTES)
+	legacy_time = time.perf_counter() - start
+
+	print(f'single pass: {new_time:.2f}s, legacy: {legacy_time:.2f}s')
+	assert new == legacy
+	assert new_time < legacy_time
+
+
+def product_list(n_products: int) -> DOMElementNode:
+	root = DOMElementNode(tag_name='ul', xpath='/body/ul', attributes={}, children=[], is_visible=True, parent=None)
+	for i in range(n_products):
+		row = DOMElementNode(
+			tag_name='li', xpath=f'/body/ul/li[{i + 1}]', attributes={}, children=[], is_visible=True, is_top_element=True, parent=root
+		)
+		link = DOMElementNode(
+			tag_name='a', xpath='a', attributes={'title': f'Product {i}'}, children=[], is_visible=True, parent=row, highlight_index=2 * i
+		)
+		link.children.append(DOMTextNode(text=f'Product {i}', is_visible=True, parent=link))
+		button = DOMElementNode(
+			tag_name='button', xpath='button', attributes={}, children=[], is_visible=True, parent=row, highlight_index=2 * i + 1
+		)
+		button.children.append(DOMTextNode(text='Add to cart', is_visible=True, parent=button))
+		row.children.extend([DOMTextNode(text=f'${i}.99', is_visible=True, parent=row), link, button])
+		root.children.append(row)
+	return root
+
+
+def test_compress_repeated():
+	root = product_list(20)
+	full = root.clickable_elements_to_string(INCLUDE_ATTRIBUTES)
+	compressed = root.clickable_elements_to_string(INCLUDE_ATTRIBUTES, compress_repeated=True)
+	assert len(compressed) < len(full) * 0.6
+
+	lines = compressed.split('\n')
+	assert lines[:5] == [
+		'20 similar items, template ([#n] is the n-th index of an item, {n} its n-th value):',
+		'\t${1}.99',
+		"\t[#1]<a title='Product {2}'>Product {3} />",
+		'\t[#2]<button >Add to cart />',
+		'items:',
+	]
+	# every index stays on the row of its item
+	assert lines[5] == '\t[0][1] 0 | 0 | 0'
+	assert lines[-1] == '\t[38][39] 19 | 19 | 19'
+
+	# too few items, written as usual
+	assert product_list(2).clickable_elements_to_string(compress_repeated=True) == product_list(2).clickable_elements_to_string()
+
+
+def test_fragment_cache():
+	cache = SerializedFragmentCache()
+	root = product_list(20)
+	root.children.append(make_tree(2_000, 5))
+	expected = root.clickable_elements_to_string(INCLUDE_ATTRIBUTES, compress_repeated=True)
+	assert root.clickable_elements_to_string(INCLUDE_ATTRIBUTES, compress_repeated=True, fragment_cache=cache) == expected
+	assert cache.hits == 0 and len(cache) > 0
+
+	# next step on the same page: the compressed runs come from the cache
+	assert root.clickable_elements_to_string(INCLUDE_ATTRIBUTES, compress_repeated=True, fragment_cache=cache) == expected
+	assert cache.hits == len(cache)
+
+	# a changed text, a new element, a hidden element and other options are not served stale lines
+	root.children[3].children[0].text = '$0.49'
+	root.children[5].children[2].is_new = True
+	for options in [{}, {'max_tokens': 50}, {'max_text_length': 5}, {'keep': set(range(30))}]:
+		assert root.clickable_elements_to_string(
+			INCLUDE_ATTRIBUTES, compress_repeated=True, fragment_cache=cache, **options
+		) == root.clickable_elements_to_string(INCLUDE_ATTRIBUTES, compress_repeated=True, **options)
+
+	small = SerializedFragmentCache(max_size=1)
+	root.clickable_elements_to_string(compress_repeated=True, fragment_cache=small)
+	assert len(small) == 1
+
+
+if __name__ == '__main__':
+	test_equivalence()
+	test_budgets()
+	test_compress_repeated()
+	test_fragment_cache()
+	test_speed_100k()
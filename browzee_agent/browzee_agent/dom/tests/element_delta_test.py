@@ -0,0 +1,55 @@
+from browzee_agent.dom.delta.service import ElementDeltaBuilder
+from browzee_agent.dom.views import DOMElementNode, DOMTextNode
+
+
+def page(labels: list[str], status: str | None = None) -> DOMElementNode:
+	body = DOMElementNode(
+		tag_name='body', xpath='html/body', attributes={}, children=[], is_visible=True, is_top_element=True, parent=None
+	)
+	for position, label in enumerate(labels):
+		name = label.split(':')[0]
+		button = DOMElementNode(
+			tag_name='button',
+			xpath=f'html/body/button[@id="{name}"]',
+			attributes={},
+			children=[],
+			is_visible=True,
+			parent=body,
+			highlight_index=position,
+		)
+		button.children.append(DOMTextNode(text=label, is_visible=True, parent=button))
+		body.children.append(button)
+	if status:
+		body.children.append(DOMTextNode(text=status, is_visible=True, parent=body))
+	return body
+
+
+def test_diff():
+	base = ElementDeltaBuilder.snapshot(page(['save', 'open', 'close', 'help']), 'https://example.com')
+	assert ElementDeltaBuilder.diff(base, base).is_empty()
+	assert ElementDeltaBuilder.diff(base, base).to_string() == 'No changes since the element list above.'
+
+	# a new first button shifts the others, one is renamed and one is gone
+	current = ElementDeltaBuilder.snapshot(page(['new', 'save', 'open:2', 'close'], status='Saved'), 'https://example.com')
+	delta = ElementDeltaBuilder.diff(base, current)
+	assert delta.added == [(0, '<button >new />')]
+	assert delta.changed == [(1, 2, '<button >open:2 />')]
+	assert delta.removed == [3]
+	assert delta.renumbered == [(0, 1), (2, 3)]
+	assert delta.added_texts == ['Saved']
+	assert delta.to_string().split('\n') == [
+		'Changes since the element list above, the elements not listed are unchanged and keep their index:',
+		'added:',
+		'\t[0]<button >new />',
+		'changed:',
+		'\t[1]->[2]<button >open:2 />',
+		'removed: [3]',
+		'renumbered: [0]->[1] [2]->[3]',
+		'new text:',
+		'\tSaved',
+	]
+
+
+def test_accessibility_lines():
+	snapshot = ElementDeltaBuilder.snapshot(page(['save']), 'https://example.com', element_format='accessibility')
+	assert list(snapshot.elements.values()) == [(0, ' button "save"')]
@@ -0,0 +1,352 @@
+// Just enough of a browser to run buildDomTree.js in node, see build_dom_tree_js_test.py.
+//
+// Pages are built from specs: { tag, attrs, rect: [left, top, width, height], style, children, shadow, document }
+// for elements, { text } for text nodes. An element without a rect covers its parent. Paint order is
+// document order, so the hit test of a point returns the last element of the tree that contains it.
+
+const Node = { ELEMENT_NODE: 1, TEXT_NODE: 3, DOCUMENT_NODE: 9, DOCUMENT_FRAGMENT_NODE: 11 };
+const VIEWPORT = { width: 1280, height: 800 };
+const fakeDom = { hitTests: 0, yields: 0, onYield: null };
+
+function makeRect(left, top, width, height) {
+  return { x: left, y: top, left, top, width, height, right: left + width, bottom: top + height };
+}
+
+class FakeNode {
+  constructor(nodeType, ownerDocument) {
+    this.nodeType = nodeType;
+    this.ownerDocument = ownerDocument;
+    this.parentNode = null;
+    this.childNodes = [];
+  }
+
+  get parentElement() {
+    return this.parentNode && this.parentNode.nodeType === Node.ELEMENT_NODE ? this.parentNode : null;
+  }
+
+  get children() {
+    return this.childNodes.filter(child => child.nodeType === Node.ELEMENT_NODE);
+  }
+
+  get isConnected() {
+    let root = this.getRootNode();
+    while (root instanceof ShadowRoot) root = root.host.getRootNode();
+    return root.nodeType === Node.DOCUMENT_NODE;
+  }
+
+  getRootNode() {
+    let node = this;
+    while (node.parentNode) node = node.parentNode;
+    return node;
+  }
+
+  appendChild(child) {
+    if (child.nodeType === Node.DOCUMENT_FRAGMENT_NODE && !(child instanceof ShadowRoot)) {
+      for (const fragmentChild of [...child.childNodes]) this.appendChild(fragmentChild);
+      child.childNodes = [];
+      return child;
+    }
+    if (child.parentNode) child.remove();
+    child.parentNode = this;
+    this.childNodes.push(child);
+    return child;
+  }
+
+  remove() {
+    if (!this.parentNode) return;
+    // in place, childNodes is live in a browser
+    this.parentNode.childNodes.splice(this.parentNode.childNodes.indexOf(this), 1);
+    this.parentNode = null;
+  }
+
+  get textContent() {
+    return this.childNodes.map(child => child.textContent).join('');
+  }
+}
+
+class FakeText extends FakeNode {
+  constructor(text, ownerDocument) {
+    super(Node.TEXT_NODE, ownerDocument);
+    this.data = text;
+  }
+
+  get textContent() {
+    return this.data;
+  }
+}
+
+class FakeElement extends FakeNode {
+  constructor(tag, ownerDocument, attrs = {}, rect = null, style = {}) {
+    super(Node.ELEMENT_NODE, ownerDocument);
+    this.tagName = tag.toUpperCase();
+    this.nodeName = this.tagName;
+    this.attrs = { ...attrs };
+    this.ownRect = rect;
+    this.computed = style;
+    this.style = {};
+    this.shadowRoot = null;
+    this.isContentEditable = false;
+    this.classList = { contains: name => (this.attrs.class || '').split(/\s+/).includes(name) };
+  }
+
+  get id() {
+    return this.attrs.id || '';
+  }
+
+  set id(value) {
+    this.attrs.id = value;
+  }
+
+  getAttribute(name) {
+    return name in this.attrs ? this.attrs[name] : null;
+  }
+
+  hasAttribute(name) {
+    return name in this.attrs;
+  }
+
+  setAttribute(name, value) {
+    this.attrs[name] = String(value);
+  }
+
+  getAttributeNames() {
+    return Object.keys(this.attrs);
+  }
+
+  get disabled() {
+    return this.hasAttribute('disabled');
+  }
+
+  closest(selector) {
+    for (let element = this; element; element = element.parentElement) {
+      if (`#${element.id}` === selector) return element;
+    }
+    return null;
+  }
+
+  attachShadow() {
+    this.shadowRoot = new ShadowRoot(this);
+    return this.shadowRoot;
+  }
+
+  get layoutParent() {
+    if (this.parentElement) return this.parentElement;
+    const root = this.getRootNode();
+    if (root instanceof ShadowRoot) return root.host;
+    return root.frameElement || null;
+  }
+
+  get displayed() {
+    for (let element = this; element; element = element.layoutParent) {
+      if (element.computed.display === 'none') return false;
+    }
+    return true;
+  }
+
+  getBoundingClientRect() {
+    if (!this.displayed) return makeRect(0, 0, 0, 0);
+    if (this.ownRect) return makeRect(...this.ownRect);
+    const parent = this.layoutParent;
+    return parent ? parent.getBoundingClientRect() : makeRect(0, 0, VIEWPORT.width, VIEWPORT.height);
+  }
+
+  getClientRects() {
+    const rect = this.getBoundingClientRect();
+    return rect.width > 0 && rect.height > 0 ? [rect] : [];
+  }
+
+  get offsetWidth() {
+    return this.getBoundingClientRect().width;
+  }
+
+  get offsetHeight() {
+    return this.getBoundingClientRect().height;
+  }
+
+  checkVisibility() {
+    const style = window.getComputedStyle(this);
+    return this.displayed && style.visibility !== 'hidden' && style.opacity !== '0';
+  }
+}
+
+class HTMLIFrameElement extends FakeElement {
+  get contentWindow() {
+    return this.contentDocument ? { document: this.contentDocument } : null;
+  }
+}
+
+/**
+ * Last element of `root`'s tree (without descending into shadow roots, like the retargeting of a
+ * real hit test) whose box contains the point.
+ */
+function hitTest(root, x, y) {
+  fakeDom.hitTests++;
+  let hit = null;
+  const visit = node => {
+    for (const child of node.children) {
+      if (child.id === 'playwright-highlight-container') continue;
+      const rect = child.getBoundingClientRect();
+      const style = window.getComputedStyle(child);
+      if (style.visibility !== 'hidden' && style.pointerEvents !== 'none' &&
+          x >= rect.left && x <= rect.right && y >= rect.top && y <= rect.bottom) {
+        hit = child;
+      }
+      visit(child);
+    }
+  };
+  visit(root);
+  return hit;
+}
+
+class ShadowRoot extends FakeNode {
+  constructor(host) {
+    super(Node.DOCUMENT_FRAGMENT_NODE, host.ownerDocument);
+    this.host = host;
+  }
+
+  elementFromPoint(x, y) {
+    return hitTest(this, x, y) || this.host;
+  }
+}
+
+class FakeDocument extends FakeNode {
+  constructor() {
+    super(Node.DOCUMENT_NODE, null);
+    this.frameElement = null;
+  }
+
+  get documentElement() {
+    return this.children[0] || null;
+  }
+
+  get body() {
+    return this.documentElement?.children.find(child => child.tagName === 'BODY') || null;
+  }
+
+  get scrollingElement() {
+    return { scrollHeight: VIEWPORT.height };
+  }
+
+  createElement(tag) {
+    return new FakeElement(tag, this);
+  }
+
+  createDocumentFragment() {
+    return new FakeNode(Node.DOCUMENT_FRAGMENT_NODE, this);
+  }
+
+  createRange() {
+    return {
+      selectNodeContents(node) {
+        this.node = node;
+      },
+      getClientRects() {
+        const parent = this.node.parentElement;
+        return parent ? parent.getClientRects() : [];
+      },
+    };
+  }
+
+  getElementById(id) {
+    const find = node => {
+      for (const child of node.children) {
+        if (child.id === id) return child;
+        const found = find(child);
+        if (found) return found;
+      }
+      return null;
+    };
+    return find(this);
+  }
+
+  elementFromPoint(x, y) {
+    return hitTest(this, x, y);
+  }
+}
+
+function buildNode(spec, ownerDocument) {
+  if ('text' in spec) return new FakeText(spec.text, ownerDocument);
+
+  const ElementClass = spec.tag === 'iframe' ? HTMLIFrameElement : FakeElement;
+  const element = new ElementClass(spec.tag, ownerDocument, spec.attrs, spec.rect, spec.style);
+  for (const child of spec.children || []) element.appendChild(buildNode(child, ownerDocument));
+  if (spec.shadow) {
+    const shadowRoot = element.attachShadow();
+    for (const child of spec.shadow) shadowRoot.appendChild(buildNode(child, ownerDocument));
+  }
+  if (spec.document) {
+    element.contentDocument = buildDocument(spec.document);
+    element.contentDocument.frameElement = element;
+  }
+  return element;
+}
+
+/** A document whose <html> element is built from `spec` */
+function buildDocument(spec) {
+  const doc = new FakeDocument();
+  doc.appendChild(buildNode(spec, doc));
+  return doc;
+}
+
+class IntersectionObserver {
+  observe() {}
+  unobserve() {}
+  disconnect() {}
+}
+
+class MutationObserver {
+  observe() {}
+  disconnect() {}
+  takeRecords() {
+    return [];
+  }
+}
+
+const DEFAULT_STYLE = {
+  display: 'block', visibility: 'visible', opacity: '1', position: 'static', cursor: 'auto', pointerEvents: 'auto',
+};
+
+/** Installs the page globals buildDomTree.js reads for a document built from `spec` */
+function installPage(spec) {
+  globalThis.document = buildDocument(spec);
+  globalThis.window = {
+    document: globalThis.document,
+    innerWidth: VIEWPORT.width,
+    innerHeight: VIEWPORT.height,
+    scrollX: 0,
+    scrollY: 0,
+    devicePixelRatio: 1,
+    getComputedStyle: element => ({ ...DEFAULT_STYLE, ...element.computed }),
+    addEventListener() {},
+    removeEventListener() {},
+  };
+  // every yield of a chunked extraction goes through scheduler.yield
+  globalThis.scheduler = {
+    yield: async () => {
+      fakeDom.yields++;
+      if (fakeDom.onYield) fakeDom.onYield(fakeDom.yields);
+    },
+  };
+  return globalThis.document;
+}
+
+/** All elements of the page in traversal order: shadow children before light children, frames inline */
+function allElements(root, elements = []) {
+  for (const child of root.children) {
+    elements.push(child);
+    if (child.shadowRoot) allElements(child.shadowRoot, elements);
+    if (child.contentDocument) allElements(child.contentDocument, elements);
+    allElements(child, elements);
+  }
+  return elements;
+}
+
+/**
+ * Source of an inner function of buildDomTree.js, to call it on its own: the functions are declared
+ * with two spaces of indentation and end at the first closing brace at that indentation.
+ */
+function innerFunction(source, name) {
+  const start = source.indexOf(`  function ${name}(`);
+  const end = source.indexOf('\n  }\n', start) + '\n  }\n'.length;
+  return source.slice(start, end);
+}
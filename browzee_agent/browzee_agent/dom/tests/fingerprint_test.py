@@ -0,0 +1,71 @@
+import hashlib
+import time
+
+from browzee_agent.dom.clickable_element_processor.service import ClickableElementProcessor
+from browzee_agent.dom.history_tree_processor.service import HistoryTreeProcessor
+from browzee_agent.dom.views import DOMElementNode
+
+
+def legacy_hash_dom_element(dom_element: DOMElementNode) -> str:
+	"""Walks to the root and runs three SHA-256 hashes per element, like before the fingerprints were chained"""
+	parents = []
+	current = dom_element
+	while current.parent is not None:
+		parents.append(current.tag_name)
+		current = current.parent
+	branch_path_hash = hashlib.sha256('/'.join(reversed(parents)).encode()).hexdigest()
+	attributes_hash = hashlib.sha256(''.join(f'{k}={v}' for k, v in dom_element.attributes.items()).encode()).hexdigest()
+	xpath_hash = hashlib.sha256(dom_element.xpath.encode()).hexdigest()
+	return hashlib.sha256(f'{branch_path_hash}-{attributes_hash}-{xpath_hash}'.encode()).hexdigest()
+
+
+def make_deep_tree(depth: int, branches: int) -> tuple[DOMElementNode, list[DOMElementNode]]:
+	"""`branches` chains of nested divs under the body, every element highlighted"""
+	root = DOMElementNode(tag_name='body', xpath='html/body', attributes={}, children=[], is_visible=True, parent=None)
+	elements = []
+	for branch in range(branches):
+		parent = root
+		for level in range(depth):
+			node = DOMElementNode(
+				tag_name='div' if level % 3 else 'section',
+				xpath=f'{parent.xpath}/div[{branch + 1}]',
+				attributes={'class': f'level-{level}'},
+				children=[],
+				is_visible=True,
+				parent=parent,
+				highlight_index=len(elements),
+			)
+			parent.children.append(node)
+			elements.append(node)
+			parent = node
+	return root, elements
+
+
+def test_history_elements_match_their_dom_element():
+	_, elements = make_deep_tree(depth=6, branches=2)
+	for element in elements:
+		history_element = HistoryTreeProcessor.convert_dom_element_to_history_element(element)
+		assert HistoryTreeProcessor.compare_history_element_and_dom_element(history_element, element)
+
+	# same tags and xpath, other attributes
+	first, second = elements[2], elements[8]
+	assert first.hash.branch_path_hash == second.hash.branch_path_hash
+	assert ClickableElementProcessor.hash_dom_element(first) != ClickableElementProcessor.hash_dom_element(second)
+
+
+def test_deep_tree_speed():
+	# deeper than the recursion limit, the ancestors are hashed iteratively
+	_, elements = make_deep_tree(depth=3_000, branches=4)
+
+	start = time.perf_counter()
+	hashes = {ClickableElementProcessor.hash_dom_element(element) for element in elements}
+	new_time = time.perf_counter() - start
+
+	start = time.perf_counter()
+	legacy_hashes = {legacy_hash_dom_element(element) for element in elements}
+	legacy_time = time.perf_counter() - start
+
+	print(f'chained: {new_time:.3f}s, legacy: {legacy_time:.3f}s')
+	assert len(hashes) == len(legacy_hashes) == len(elements)
+	# both still hash the xpath, which grows with the depth
+	assert new_time * 3 < legacy_time
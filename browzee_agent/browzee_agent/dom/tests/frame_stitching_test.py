@@ -0,0 +1,150 @@
+import asyncio
+import gc
+
+from browzee_agent.dom.extraction.service import FrameTreeStitcher
+from browzee_agent.dom.service import DomService
+from browzee_agent.dom.tests.helpers import construct, element
+
+
+def frame_result(*buttons):
+	"""A frame document with one button per highlight index, ids in post-order like buildDomTree.js"""
+	node_map = {str(i): element('button', f'html/body/button[{i + 1}]', highlight_index=i) for i in range(len(buttons))}
+	node_map[str(len(buttons))] = element('body', 'html/body', children=list(node_map))
+	node_map[str(len(buttons) + 1)] = element('html', 'html', children=[str(len(buttons))])
+	return {'rootId': str(len(buttons) + 1), 'map': node_map, 'highlightCount': len(buttons)}
+
+
+def test_frames_are_stitched_under_their_iframes():
+	main = {
+		'rootId': '4',
+		'map': {
+			'0': element('button', '/body/button', highlight_index=0),
+			'1': element('iframe', '/body/iframe[1]'),
+			'2': element('iframe', '/body/iframe[2]'),
+			'3': element('iframe', '/body/iframe[3]'),
+			'4': element('body', '/body', children=['0', '1', '2', '3']),
+		},
+		'highlightCount': 1,
+	}
+	stitcher = FrameTreeStitcher(main)
+	# added out of document order, the nested frame before its parent
+	stitcher.add_frame('frame-2', None, '/body/iframe[2]', frame_result('c'))
+	stitcher.add_frame('frame-3', 'frame-1', 'html/body/iframe', {
+		'rootId': '1',
+		'map': {'0': element('a', 'html/body/a', highlight_index=0), '1': element('body', 'html/body', children=['0'])},
+		'highlightCount': 1,
+	})
+	stitcher.add_frame('frame-1', None, '/body/iframe[1]', {
+		'rootId': '2',
+		'map': {
+			'0': element('iframe', 'html/body/iframe'),
+			'1': element('button', 'html/body/button', highlight_index=0),
+			'2': element('body', 'html/body', children=['0', '1']),
+		},
+		'highlightCount': 1,
+	})
+	# its <iframe> was filtered out of the parent tree
+	stitcher.add_frame('frame-4', None, '/body/iframe[9]', frame_result('x'))
+
+	eval_page = stitcher.stitch()
+	root, selector_map = construct(eval_page)
+
+	first, second, third = root.children[1:]
+	assert (first.frame_id, second.frame_id, third.frame_id) == ('frame-1', 'frame-2', None)
+	assert third.children == []
+
+	# highlight indices continue frame by frame, in document order of the frame tree
+	located = {index: (node.tag_name, node.xpath) for index, node in selector_map.items()}
+	assert located == {
+		0: ('button', '/body/button'),
+		1: ('button', 'html/body/button'),
+		2: ('a', 'html/body/a'),
+		3: ('button', 'html/body/button[1]'),
+	}
+	assert stitcher.highlight_offsets == {'frame-1': 1, 'frame-3': 2, 'frame-2': 3}
+
+	nested_iframe = first.children[0].children[0]
+	assert nested_iframe.frame_id == 'frame-3'
+	assert selector_map[2].parent.parent is nested_iframe
+
+
+class RecordingFrame:
+	"""Stands in for a page or frame, resolving every registry lookup to the arguments it got"""
+
+	def __init__(self):
+		self.lookups = []
+
+	def is_detached(self):
+		return False
+
+	async def evaluate_handle(self, expression, arg):
+		self.lookups.append(arg)
+		return RecordingHandle(arg)
+
+
+class RecordingHandle:
+	def __init__(self, arg):
+		self.arg = arg
+
+	def as_element(self):
+		return self
+
+
+def test_element_handles_resolve_in_the_frame_that_registered_them():
+	main = {
+		'rootId': '2',
+		'map': {
+			'0': element('button', '/body/button', highlight_index=0),
+			'1': element('iframe', '/body/iframe'),
+			'2': element('body', '/body', children=['0', '1']),
+		},
+		'highlightCount': 1,
+	}
+	stitcher = FrameTreeStitcher(main)
+	stitcher.add_frame('frame-0', None, '/body/iframe', frame_result('a', 'b'))
+
+	eval_page = stitcher.stitch()
+
+	page, frame = RecordingFrame(), RecordingFrame()
+	dom_service = DomService(page)  # type: ignore
+	dom_service.frames = {'frame-0': frame}  # type: ignore
+	dom_service.highlight_offsets = dict(stitcher.highlight_offsets)
+	_, selector_map = construct(eval_page, dom_service)
+	dom_service._registry_selector_map = selector_map
+
+	handle = asyncio.run(dom_service.get_element_handle(selector_map[2]))
+	assert handle.arg == {'index': 1, 'runName': None, 'tagName': 'button'}
+	assert frame.lookups == [handle.arg]
+	asyncio.run(dom_service.get_element_handle(selector_map[0]))
+	assert page.lookups == [{'index': 0, 'runName': None, 'tagName': 'button'}]
+
+	# elements of an older state go through the selector fallback
+	_, stale_map = construct(main)
+	assert asyncio.run(dom_service.get_element_handle(stale_map[0])) is None
+	assert len(page.lookups) == 1
+
+
+class StubFrame:
+	def __init__(self) -> None:
+		self.detached = False
+
+	def is_detached(self) -> bool:
+		return self.detached
+
+
+def test_detached_frames_are_not_kept():
+	dom_service = DomService(None)  # type: ignore
+	kept, detached, dropped = StubFrame(), StubFrame(), StubFrame()
+	ids = [dom_service.frame_id(frame) for frame in (kept, detached, dropped)]
+	assert dom_service.frame_id(kept) == ids[0]
+	dom_service.highlight_offsets = dict.fromkeys(ids, 0)
+
+	detached.detached = True
+	dom_service.forget_detached_frames()
+	assert list(dom_service.frames) == [ids[0], ids[2]]
+	assert list(dom_service.highlight_offsets) == [ids[0], ids[2]]
+
+	# the page navigated and nothing references the frame anymore
+	del dropped
+	gc.collect()
+	assert list(dom_service.frames) == [ids[0]]
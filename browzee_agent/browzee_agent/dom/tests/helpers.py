@@ -0,0 +1,33 @@
+"""Builders of buildDomTree.js results, and of the states DomService makes of them, for the DOM tests"""
+
+import asyncio
+
+from browzee_agent.dom.service import DomService
+from browzee_agent.dom.views import DOMElementNode, DOMState, SelectorMap
+
+
+def element(tag_name, xpath, children=(), highlight_index=None, **attributes):
+	return {
+		'tagName': tag_name,
+		'xpath': xpath,
+		'attributes': attributes,
+		'children': list(children),
+		'isVisible': True,
+		'isTopElement': True,
+		'highlightIndex': highlight_index,
+	}
+
+
+def text(value):
+	return {'type': 'TEXT_NODE', 'text': value, 'isVisible': True}
+
+
+def construct(eval_page: dict, dom_service: DomService | None = None) -> tuple[DOMElementNode, SelectorMap]:
+	"""The tree and selector map of a buildDomTree.js result, with a DomService without page by default"""
+	dom_service = dom_service or DomService(None)  # type: ignore
+	return asyncio.run(dom_service._construct_dom_tree(eval_page))
+
+
+def dom_state(eval_page: dict) -> DOMState:
+	root, selector_map = construct(eval_page)
+	return DOMState(element_tree=root, selector_map=selector_map)
@@ -0,0 +1,67 @@
+import asyncio
+
+from browzee_agent.dom.service import DomService
+from browzee_agent.dom.tests.helpers import element, text
+from browzee_agent.dom.views import DOMElementNode, DOMState
+
+
+def apply(dom_service: DomService, eval_page: dict) -> DOMState:
+	root, selector_map = asyncio.run(dom_service._apply_dom_tree_delta(eval_page))
+	return DOMState(element_tree=root, selector_map=selector_map)
+
+
+def test_delta_leaves_the_previous_state_untouched():
+	dom_service = DomService(None)  # type: ignore
+	previous = apply(
+		dom_service,
+		{
+			'full': True,
+			'version': 1,
+			'rootId': 'body',
+			'map': {
+				'0': text('Save'),
+				'1': element('button', 'html/body/form/button', ['0'], highlight_index=0, type='submit'),
+				'2': element('input', 'html/body/form/input', highlight_index=1, name='q'),
+				'3': element('form', 'html/body/form', ['1', '2']),
+				'4': element('a', 'html/body/a', highlight_index=2, href='/help'),
+				'body': element('body', 'html/body', ['3', '4']),
+			},
+		},
+	)
+	previous_hashes = {index: node.hash for index, node in previous.selector_map.items()}
+	previous_button = previous.selector_map[0]
+
+	# the button got disabled and the link was removed
+	current = apply(
+		dom_service,
+		{
+			'full': False,
+			'version': 2,
+			'rootId': 'body',
+			'map': {
+				'1': element('button', 'html/body/form/button', ['0'], highlight_index=0, type='submit', disabled='true'),
+				'body': element('body', 'html/body', ['3']),
+			},
+			'removed': ['4'],
+		},
+	)
+
+	assert previous.selector_map[0] is previous_button
+	assert 'disabled' not in previous_button.attributes
+	assert previous.element_tree.children[0].children[0] is previous_button
+	assert len(previous.element_tree.children) == 2
+	assert {index: node.hash for index, node in previous.selector_map.items()} == previous_hashes
+
+	assert sorted(current.selector_map) == [0, 1]
+	button = current.selector_map[0]
+	assert button is not previous_button
+	assert button.attributes['disabled'] == 'true'
+	assert button.hash != previous_hashes[0]
+	assert button.get_all_text_till_next_clickable_element() == 'Save'
+
+	# the form is copied to link the new button, the unchanged input is shared
+	form = current.element_tree.children[0]
+	assert isinstance(form, DOMElementNode) and form is not previous.element_tree.children[0]
+	assert form.children[0] is button and button.parent is form
+	assert form.children[1] is previous.selector_map[1] is current.selector_map[1]
+	assert current.selector_map[1].hash == previous_hashes[1]
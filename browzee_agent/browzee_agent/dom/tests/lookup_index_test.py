@@ -0,0 +1,64 @@
+from browzee_agent.dom.history_tree_processor.service import HistoryTreeProcessor
+from browzee_agent.dom.history_tree_processor.view import DOMHistoryElement
+from browzee_agent.dom.tests.helpers import dom_state, element, text
+from browzee_agent.dom.views import DOMState
+
+
+def build_state() -> DOMState:
+	eval_page = {
+		'rootId': '10',
+		'map': {
+			'0': text('Upload your resume'),
+			'1': element('input', 'html/body/label/input', type='file'),
+			'2': element('label', 'html/body/label', ['0', '1'], highlight_index=0),
+			'3': text('Sign up for the newsletter'),
+			'4': element('button', 'html/body/div/button', ['3'], highlight_index=1, role='button'),
+			'5': element('input', 'html/body/div/div/div/input', accept='image/*'),
+			'6': element('div', 'html/body/div/div/div', ['5']),
+			'7': element('div', 'html/body/div/div', ['6'], highlight_index=2),
+			'8': element('div', 'html/body/div', ['4', '7']),
+			'9': element('body', 'html/body', ['2', '8']),
+			'10': element('html', 'html', ['9']),
+		},
+	}
+	return dom_state(eval_page)
+
+
+def test_lookups():
+	state = build_state()
+	index = state.lookup_index
+	label, button, wrapper = state.selector_map[0], state.selector_map[1], state.selector_map[2]
+
+	assert index.find_by_xpath('html/body/div/button') == [button]
+	assert index.find_by_role('button') == [button]
+	assert [node.xpath for node in index.find_by_tag('input')] == ['html/body/label/input', 'html/body/div/div/div/input']
+
+	# edge words may be cut, inner words go through the token index
+	assert index.find_by_text('up for the news') == [button]
+	assert index.find_by_text('UPLOAD') == [label]
+	assert index.find_by_text('up for a') == []
+
+	assert index.is_file_uploader(label)
+	assert index.is_file_uploader(wrapper, max_depth=2)
+	assert not index.is_file_uploader(wrapper, max_depth=1)
+	assert not index.is_file_uploader(button)
+
+	# the sibling label holds the only input[type=file]
+	assert index.get_file_upload_element(label.parent.children[1]) is label.children[1]
+	assert index.get_file_upload_element(button, check_siblings=False) is None
+
+
+def test_history_element_is_found_through_the_index():
+	state = build_state()
+	button = state.selector_map[1]
+	history_element = DOMHistoryElement(
+		button.tag_name,
+		button.xpath,
+		button.highlight_index,
+		HistoryTreeProcessor._get_parent_branch_path(button),
+		button.attributes,
+	)
+
+	found = HistoryTreeProcessor.find_history_element_in_tree(history_element, state.element_tree, state.lookup_index)
+	assert found is button
+	assert found is HistoryTreeProcessor.find_history_element_in_tree(history_element, state.element_tree)
@@ -0,0 +1,73 @@
+from browzee_agent.dom.history_tree_processor.service import HistoryTreeProcessor
+from browzee_agent.dom.tests.helpers import dom_state, element, text
+from browzee_agent.dom.views import DOMState
+
+
+def build_state(node_map: dict) -> DOMState:
+	return dom_state({'rootId': 'body', 'map': node_map})
+
+
+def test_changed_elements_are_found_again():
+	recorded = build_state({
+		'0': text('Search'),
+		'1': element('button', 'html/body/form/button', ['0'], highlight_index=1, type='submit', **{'class': 'btn'}),
+		'2': element('input', 'html/body/form/input', highlight_index=0, name='q', placeholder='Search'),
+		'3': element('form', 'html/body/form', ['2', '1']),
+		'body': element('body', 'html/body', ['3']),
+	})
+	search_button = HistoryTreeProcessor.convert_dom_element_to_history_element(recorded.selector_map[1])
+	search_input = HistoryTreeProcessor.convert_dom_element_to_history_element(recorded.selector_map[0])
+	assert search_button.text == 'Search'
+
+	# a banner was added above, the form moved into a wrapper and the button got new classes
+	current = build_state({
+		'0': text('Accept cookies'),
+		'1': element('button', 'html/body/div[1]/button', ['0'], highlight_index=0, type='button'),
+		'2': element('div', 'html/body/div[1]', ['1']),
+		'3': element('input', 'html/body/div[2]/form/input', highlight_index=1, name='q', placeholder='Search'),
+		'4': text('Search'),
+		'5': element('button', 'html/body/div[2]/form/button', ['4'], highlight_index=2, type='submit', **{'class': 'btn btn-primary'}),
+		'6': element('form', 'html/body/div[2]/form', ['3', '5']),
+		'7': element('div', 'html/body/div[2]', ['6']),
+		'body': element('body', 'html/body', ['2', '7']),
+	})
+	assert HistoryTreeProcessor.find_history_element_in_tree(search_button, current.element_tree, current.lookup_index) is None
+
+	index = current.reidentification_index
+	assert index.find(search_button) is current.selector_map[2]
+	assert index.find(search_input) is current.selector_map[1]
+	# same tag, but nothing else in common
+	assert index.candidates(search_button) == [2]
+	assert index.score(search_button, 0) < 0.6
+
+
+def test_unrelated_elements_are_not_matched():
+	recorded = build_state({
+		'0': text('Delete account'),
+		'1': element('button', 'html/body/button', ['0'], highlight_index=0, **{'aria-label': 'Delete'}),
+		'body': element('body', 'html/body', ['1']),
+	})
+	current = build_state({
+		'0': text('Save'),
+		'1': element('button', 'html/body/button', ['0'], highlight_index=0, **{'aria-label': 'Save'}),
+		'body': element('body', 'html/body', ['1']),
+	})
+	history_element = HistoryTreeProcessor.convert_dom_element_to_history_element(recorded.selector_map[0])
+	assert current.reidentification_index.find(history_element) is None
+
+
+def test_position_alone_does_not_match():
+	recorded = build_state({
+		'0': element('div', 'html/body/div[2]/div[3]', highlight_index=0, **{'class': 'y'}),
+		'1': element('div', 'html/body/div[2]', ['0']),
+		'body': element('body', 'html/body', ['1']),
+	})
+	current = build_state({
+		'0': element('div', 'html/body/div[2]/div[5]', highlight_index=0, **{'class': 'x'}),
+		'1': element('div', 'html/body/div[2]', ['0']),
+		'body': element('body', 'html/body', ['1']),
+	})
+	history_element = HistoryTreeProcessor.convert_dom_element_to_history_element(recorded.selector_map[0])
+	assert current.reidentification_index.candidates(history_element) == []
+	assert current.reidentification_index.score(history_element, 0) == 0.0
+	assert current.reidentification_index.find(history_element) is None
@@ -0,0 +1,63 @@
+from browzee_agent.dom.relevance.service import ElementRelevanceRanker, tokenize
+from browzee_agent.dom.tests.helpers import dom_state, element, text
+from browzee_agent.dom.views import DOMState
+
+
+def build_state() -> DOMState:
+	labels = ['Home', 'Deals', 'Gift cards', 'Customer service', 'Registry', 'Sell']
+	nodes: dict[str, dict] = {}
+	body_children = []
+	for position, label in enumerate(labels):
+		nodes[f't{position}'] = text(label)
+		nodes[f'a{position}'] = element('a', f'html/body/a[{position + 1}]', [f't{position}'], position, href=f'/{label.lower()}')
+		body_children.append(f'a{position}')
+
+	# a search form: the input only has a placeholder, its button sits right after it
+	nodes['search'] = element('input', 'html/body/form/input', highlight_index=7, placeholder='Search products')
+	nodes['go'] = element('button', 'html/body/form/button', highlight_index=8, **{'aria-label': 'Go'})
+	nodes['form'] = element('form', 'html/body/form', ['search', 'go'], highlight_index=6)
+	nodes['footer_text'] = text('Privacy notice')
+	nodes['footer'] = element('a', 'html/body/a[7]', ['footer_text'], 9, href='/privacy')
+	body_children.extend(['form', 'footer'])
+
+	nodes['body'] = element('body', 'html/body', body_children)
+	nodes['html'] = element('html', 'html', ['body'])
+	state = dom_state({'rootId': 'html', 'map': nodes})
+	for node in state.selector_map.values():
+		node.is_new = False
+	return state
+
+
+def test_tokenize():
+	assert tokenize('Searching for the Gift-Cards of my_account') == ['search', 'gift', 'card', 'account']
+
+
+def test_ranking_keeps_the_target_and_its_context():
+	state = build_state()
+	indexes, scores = ElementRelevanceRanker.score(state.selector_map, 'Buy a gift card', 'search products for lego')
+	assert indexes.tolist() == sorted(state.selector_map)
+	assert scores[7] == scores.max() > 0
+
+	selection = ElementRelevanceRanker.select(state.selector_map, 'Buy a gift card', 'search products for lego', 1)
+	# the search input, its neighbours in document order and the form it is nested in
+	assert selection.keep == {6, 7, 8}
+	assert selection.omitted == 7
+
+	serialized = state.element_tree.clickable_elements_to_string(['placeholder'], keep=selection.keep)
+	assert serialized == "[6]<form  />\n\t[7]<input placeholder='Search products' />\n\t[8]<button  />"
+
+
+def test_new_elements_are_always_kept():
+	state = build_state()
+	state.selector_map[9].is_new = True
+	selection = ElementRelevanceRanker.select(state.selector_map, 'gift card', None, 1)
+	assert selection.keep == {1, 2, 3, 9}
+	assert ElementRelevanceRanker.select(state.selector_map, 'gift card', None, 10).omitted == 0
+
+
+def test_texts_match_the_per_element_text():
+	state = build_state()
+	texts = ElementRelevanceRanker._texts(state.selector_map)
+	assert texts == {
+		highlight_index: node.get_all_text_till_next_clickable_element() for highlight_index, node in state.selector_map.items()
+	}
@@ -0,0 +1,51 @@
+from browzee_agent.dom.views import DOMElementNode, DOMState, HighlightMarks
+
+
+def element(highlight_index: int) -> DOMElementNode:
+	return DOMElementNode(
+		tag_name='div',
+		xpath=f'html/body/div[{highlight_index + 1}]',
+		attributes={},
+		children=[],
+		is_visible=True,
+		parent=None,
+		highlight_index=highlight_index,
+	)
+
+
+def build_state(boxes: list[list[float]]) -> DOMState:
+	selector_map = {int(box[0]): element(int(box[0])) for box in boxes}
+	root = DOMElementNode(tag_name='body', xpath='', attributes={}, children=[], is_visible=True, parent=None)
+	return DOMState(element_tree=root, selector_map=selector_map, marks=HighlightMarks(boxes=boxes))
+
+
+def test_queries():
+	state = build_state([
+		# a card spanning several grid cells with a button inside it
+		[0, 10, 10, 300, 200],
+		[1, 200, 150, 80, 30],
+		# far away, partly above the viewport
+		[2, 900, -40, 100, 100],
+	])
+	index = state.spatial_index
+	card, button, far = state.selector_map[0], state.selector_map[1], state.selector_map[2]
+
+	assert index.element_at(220, 160) is button
+	assert index.element_at(20, 20) is card
+	assert index.element_at(950, 0) is far
+	assert index.element_at(600, 600) is None
+
+	assert index.overlapping(250, 170, 700, 10) == [card, button]
+	assert index.overlapping(0, -100, 2000, 80) == [far]
+
+	assert index.nearest(600, 50) is card
+	assert index.nearest(600, 50, max_distance=100) is None
+	assert index.center_of(1) == (240, 165)
+	assert index.box_of(7) is None
+
+
+def test_no_marks_means_no_index():
+	state = build_state([])
+	assert len(state.spatial_index) == 0
+	assert state.spatial_index.element_at(1, 1) is None
+	assert DOMState(element_tree=state.element_tree, selector_map={}).spatial_index is None
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from browzee_agent.dom.extraction.service import REPLAY_HIGHLIGHTS_JS
+from browzee_agent.dom.service import _RUN_RUNTIME_JS, _TILE_CHECK_JS, DomService
+
+VIEWPORT_HEIGHT = 800
+
+
+class StubPage:
+	"""Answers the evaluate calls of the tile prefetch like a page scrolled to `scroll_y`"""
+
+	def __init__(self) -> None:
+		self.scroll_y = 0
+		self.mutations = 0
+		self.replayed: list[dict] = []
+
+	async def evaluate(self, script: str, arg=None):
+		if script == _TILE_CHECK_JS:
+			return {'scrollY': self.scroll_y, 'fingerprint': f'https://example.com|{self.mutations}|40|1200|3000'}
+		if script == REPLAY_HIGHLIGHTS_JS:
+			self.replayed.append(arg)
+			return None
+		assert script == _RUN_RUNTIME_JS
+		scroll_y = max(0, self.scroll_y + arg['tileScrollPages'] * VIEWPORT_HEIGHT)
+		return {
+			'rootId': '1',
+			'map': {
+				'0': {
+					'tagName': 'button',
+					'xpath': 'html/body/button',
+					'attributes': {},
+					'children': [],
+					'isVisible': True,
+					'isTopElement': True,
+					'highlightIndex': 0,
+				},
+				'1': {'tagName': 'body', 'xpath': 'html/body', 'attributes': {}, 'children': ['0'], 'isVisible': True},
+			},
+			'tile': {'fromScrollY': self.scroll_y, 'scrollY': scroll_y},
+		}
+
+
+def prefetch(page: StubPage) -> DomService:
+	dom_service = DomService(page)  # type: ignore
+	asyncio.run(dom_service.prefetch_tiles(highlight_elements=True, viewport_expansion=0))
+	return dom_service
+
+
+def test_prefetched_tile_is_served_after_a_scroll():
+	page = StubPage()
+	page.scroll_y = VIEWPORT_HEIGHT
+	dom_service = prefetch(page)
+	assert [tile.scroll_y for tile in dom_service._tiles] == [2 * VIEWPORT_HEIGHT, 0]
+
+	page.scroll_y = 2 * VIEWPORT_HEIGHT
+	state = asyncio.run(dom_service.take_prefetched_state(highlight_elements=True))
+	assert state is not None and sorted(state.selector_map) == [0]
+	assert page.replayed == [{'offset': 0, 'focusHighlightIndex': -1, 'runName': 'tile+1'}]
+
+	# tiles are used at most once
+	assert asyncio.run(dom_service.take_prefetched_state(highlight_elements=True)) is None
+
+
+def test_prefetched_tiles_are_dropped_when_the_page_changed():
+	page = StubPage()
+	dom_service = prefetch(page)
+	assert [tile.scroll_y for tile in dom_service._tiles] == [VIEWPORT_HEIGHT]
+
+	# e.g. a button got disabled, the size of the page stays the same
+	page.mutations += 1
+	page.scroll_y = VIEWPORT_HEIGHT
+	assert asyncio.run(dom_service.take_prefetched_state(highlight_elements=True)) is None
+	assert page.replayed == []
+
+	# scrolled elsewhere
+	dom_service = prefetch(page)
+	page.scroll_y = 5 * VIEWPORT_HEIGHT
+	assert asyncio.run(dom_service.take_prefetched_state(highlight_elements=True)) is None
+
+
+# Just enough of a document for _TILE_CHECK_JS: mutations are queued by mutate() and handed out by takeRecords
+FAKE_DOCUMENT_JS = """
+const Node = { ELEMENT_NODE: 1, TEXT_NODE: 3 };
+const element = (id, parent = null) => ({ nodeType: 1, id, parent, closest(selector) {
+	for (let node = this; node; node = node.parent) if ('#' + node.id === selector) return node;
+	return null;
+} });
+const body = element('body');
+const overlay = element('playwright-highlight-container', body);
+const button = element('submit', body);
+const label = { nodeType: 3, parentElement: button };
+const observers = [];
+class MutationObserver {
+	constructor(callback) { this.records = []; observers.push(this); }
+	observe() {}
+	takeRecords() { const records = this.records; this.records = []; return records; }
+}
+const mutate = (target, addedNodes = [], removedNodes = []) =>
+	observers.forEach(observer => observer.records.push({ target, addedNodes, removedNodes }));
+const window = { scrollY: 0 };
+const location = { href: 'https://example.com' };
+const document = {
+	body: { textContent: 'Submit' },
+	documentElement: { scrollHeight: 1000 },
+	getElementsByTagName: () => [body, button],
+};
+"""
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='node is not installed')
+def test_tile_check_sees_attribute_and_text_changes():
+	script = FAKE_DOCUMENT_JS + (
+		f'const check = {_TILE_CHECK_JS.strip()};'
+		'const fingerprints = [check().fingerprint];'
+		# the overlays are drawn and removed
+		'mutate(overlay); mutate(body, [overlay]); mutate(body, [], [overlay]);'
+		'fingerprints.push(check().fingerprint);'
+		# the button is disabled
+		'mutate(button);'
+		'fingerprints.push(check().fingerprint);'
+		# and its label changes
+		'mutate(label);'
+		'fingerprints.push(check().fingerprint);'
+		'process.stdout.write(JSON.stringify(fingerprints));'
+	)
+	result = subprocess.run(['node', '-e', script], capture_output=True, text=True, check=True)
+	initial, after_overlays, after_attribute, after_text = json.loads(result.stdout)
+	assert after_overlays == initial
+	assert len({initial, after_attribute, after_text}) == 3
@@ -0,0 +1,112 @@
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from browzee_agent.dom.arena.service import DOMArenaBuilder
+from browzee_agent.dom.service import BUILD_DOM_TREE_JS, DomService
+from browzee_agent.dom.views import DOMElementNode, DOMTextNode
+
+pytestmark = pytest.mark.skipif(shutil.which('node') is None, reason='node is not installed')
+
+ELEMENT_FIELDS = (
+	'tag_name',
+	'xpath',
+	'attributes',
+	'is_visible',
+	'is_interactive',
+	'is_top_element',
+	'is_in_viewport',
+	'highlight_index',
+	'shadow_root',
+	'viewport_info',
+	'frame_id',
+)
+
+
+def encode_columnar(node_map: dict) -> dict:
+	"""Runs `encodeColumnar` of buildDomTree.js on the node map"""
+	start = BUILD_DOM_TREE_JS.index('  function encodeColumnar(')
+	end = BUILD_DOM_TREE_JS.index('\n  }\n', start) + len('\n  }\n')
+	script = BUILD_DOM_TREE_JS[start:end] + (
+		"let input = '';"
+		"process.stdin.on('data', chunk => input += chunk);"
+		"process.stdin.on('end', () => process.stdout.write(JSON.stringify(encodeColumnar(JSON.parse(input)))));"
+	)
+	result = subprocess.run(['node', '-e', script], input=json.dumps(node_map), capture_output=True, text=True, check=True)
+	return json.loads(result.stdout)
+
+
+def make_map() -> dict:
+	return {
+		'0': {'type': 'TEXT_NODE', 'text': 'Sign in', 'isVisible': True},
+		'1': {
+			'tagName': 'button',
+			'xpath': 'html/body/form/button',
+			'attributes': {'type': 'submit', 'aria-label': 'Sign in'},
+			'children': ['0'],
+			'isVisible': True,
+			'isTopElement': True,
+			'isInteractive': True,
+			'isInViewport': True,
+			'highlightIndex': 0,
+		},
+		'2': {'type': 'TEXT_NODE', 'text': 'hidden', 'isVisible': False},
+		'3': {'tagName': 'form', 'xpath': 'html/body/form', 'attributes': {}, 'children': ['1', '2'], 'isVisible': True},
+		'4': {
+			'tagName': 'iframe',
+			'xpath': 'html/body/iframe',
+			'attributes': {'src': '/frame'},
+			'children': [],
+			'isVisible': True,
+			'shadowRoot': True,
+			'frameId': 'frame-0',
+			'viewport': {'width': 800, 'height': 600},
+		},
+		'5': {'tagName': 'body', 'xpath': 'html/body', 'attributes': {}, 'children': ['3', '4'], 'isVisible': True},
+	}
+
+
+def node_fields(node) -> tuple:
+	if isinstance(node, DOMTextNode):
+		return ('text', node.text, node.is_visible)
+	assert isinstance(node, DOMElementNode)
+	return tuple(getattr(node, field) for field in ELEMENT_FIELDS)
+
+
+def test_columnar_and_json_decode_to_the_same_nodes():
+	node_map = make_map()
+	columns = encode_columnar(node_map)
+	assert columns['frameRows'] == [4] and columns['viewportRows'] == [4]
+
+	dom_service = DomService(None)  # type: ignore
+	from_json = {id: (node_fields(node), children) for id, node, children in dom_service._parse_nodes({'map': node_map})}
+	from_columns = {id: (node_fields(node), children) for id, node, children in dom_service._parse_nodes({'columns': columns})}
+	assert from_columns == from_json
+
+	iframe = dict(zip(ELEMENT_FIELDS, from_columns['4'][0]))
+	assert iframe['frame_id'] == 'frame-0'
+	assert (iframe['viewport_info'].width, iframe['viewport_info'].height) == (800, 600)
+
+
+def test_columnar_and_json_build_the_same_arena():
+	node_map = make_map()
+	columns = encode_columnar(node_map)
+
+	def walk(root) -> list[tuple]:
+		nodes, stack = [], [root]
+		while stack:
+			node = stack.pop()
+			if isinstance(node, DOMTextNode):
+				nodes.append(('text', node.text, node.is_visible))
+				continue
+			# the arena does not store viewports, buildDomTree.js never fills them
+			nodes.append(tuple(getattr(node, field) for field in ELEMENT_FIELDS if field != 'viewport_info'))
+			stack.extend(reversed(node.children))
+		return nodes
+
+	json_root, _ = DOMArenaBuilder.from_eval_page({'rootId': '5', 'map': node_map})
+	columns_root, _ = DOMArenaBuilder.from_eval_page({'rootId': '5', 'columns': columns})
+	assert walk(columns_root) == walk(json_root)
+	assert [node[-1] for node in walk(columns_root) if node[0] == 'iframe'] == ['frame-0']
@@ -1,17 +1,37 @@
-from dataclasses import dataclass
+import os
+import re
+from abc import ABC
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Iterator
+from dataclasses import dataclass, field
 from functools import cached_property
 from typing import TYPE_CHECKING, Optional
 
 from browzee_agent.dom.history_tree_processor.view import CoordinateSet, HashedDomElement, ViewportInfo
 from browzee_agent.utils import time_execution_sync
 
+# Rough size of a token, same default as MessageManagerSettings.estimated_characters_per_token
+ESTIMATED_CHARACTERS_PER_TOKEN = 3
+
+# Last line of an element list cut by its token budget
+ELEMENTS_TRUNCATED = '... content truncated to fit the token budget - scroll or extract content to see more ...'
+
+# Runs of at least this many similar siblings are written as one template and a row per item
+MIN_REPEATED_ITEMS = 3
+_SERIALIZED_LINE = re.compile(r'(\t*)(\*?\[\d+\]\*?)?(.*)', re.DOTALL)
+_WORD_BOUNDARIES = re.compile(r'(\W+)')
+
 # Avoid circular import issues
 if TYPE_CHECKING:
+	from .lookup_index.views import DOMLookupIndex
+	from .reidentification.views import ReidentificationIndex
+	from .spatial_index.views import SpatialIndex
 	from .views import DOMElementNode
 
 
 @dataclass(frozen=False)
-class DOMBaseNode:
+class DOMBaseNode(ABC):
+	# ABC so compact representations (see dom/arena) can register as virtual subclasses
 	is_visible: bool
 	# Use None as default and set parent later to avoid circular reference issues
 	parent: Optional['DOMElementNode']
@@ -71,6 +91,8 @@ class DOMElementNode(DOMBaseNode):
 	viewport_coordinates: CoordinateSet | None = None
 	page_coordinates: CoordinateSet | None = None
 	viewport_info: ViewportInfo | None = None
+	# set on <iframe> elements whose document was extracted separately (see `DomService.frames`)
+	frame_id: str | None = None
 
 	"""
 	### State injected by the browser context.
@@ -123,12 +145,17 @@ class DOMElementNode(DOMBaseNode):
 
 	@cached_property
 	def hash(self) -> HashedDomElement:
-		from browser_use.dom.history_tree_processor.service import (
+		from browzee_agent.dom.history_tree_processor.service import (
 			HistoryTreeProcessor,
 		)
 
 		return HistoryTreeProcessor._hash_dom_element(self)
 
+	@property
+	def cached_hash(self) -> HashedDomElement | None:
+		"""`hash` if it was computed already"""
+		return self.__dict__.get('hash')
+
 	def get_all_text_till_next_clickable_element(self, max_depth: int = -1) -> str:
 		text_parts = []
 
@@ -150,89 +177,159 @@ class DOMElementNode(DOMBaseNode):
 		return '\n'.join(text_parts).strip()
 
 	@time_execution_sync('--clickable_elements_to_string')
-	def clickable_elements_to_string(self, include_attributes: list[str] | None = None) -> str:
-		"""Convert the processed DOM content to HTML."""
-		formatted_text = []
-
-		def process_node(node: DOMBaseNode, depth: int) -> None:
-			next_depth = int(depth)
-			depth_str = depth * '\t'
-
-			if isinstance(node, DOMElementNode):
-				# Add element with highlight_index
-				if node.highlight_index is not None:
-					next_depth += 1
-
-					text = node.get_all_text_till_next_clickable_element()
-					attributes_html_str = ''
-					if include_attributes:
-						attributes_to_include = {
-							key: str(value) for key, value in node.attributes.items() if key in include_attributes
-						}
-
-						# Easy LLM optimizations
-						# if tag == role attribute, don't include it
-						if node.tag_name == attributes_to_include.get('role'):
-							del attributes_to_include['role']
-
-						# if aria-label == text of the node, don't include it
-						if (
-							attributes_to_include.get('aria-label')
-							and attributes_to_include.get('aria-label', '').strip() == text.strip()
-						):
-							del attributes_to_include['aria-label']
-
-						# if placeholder == text of the node, don't include it
-						if (
-							attributes_to_include.get('placeholder')
-							and attributes_to_include.get('placeholder', '').strip() == text.strip()
-						):
-							del attributes_to_include['placeholder']
-
-						if attributes_to_include:
-							# Format as key1='value1' key2='value2'
-							attributes_html_str = ' '.join(f"{key}='{value}'" for key, value in attributes_to_include.items())
-
-					# Build the line
-					if node.is_new:
-						highlight_indicator = f'*[{node.highlight_index}]*'
-					else:
-						highlight_indicator = f'[{node.highlight_index}]'
-
-					line = f'{depth_str}{highlight_indicator}<{node.tag_name}'
-
-					if attributes_html_str:
-						line += f' {attributes_html_str}'
-
-					if text:
-						# Add space before >text only if there were NO attributes added before
-						if not attributes_html_str:
-							line += ' '
-						line += f'>{text}'
-					# Add space before /> only if neither attributes NOR text were added
-					elif not attributes_html_str:
-						line += ' '
-
-					line += ' />'  # 1 token
-					formatted_text.append(line)
-
-				# Process children regardless
-				for child in node.children:
-					process_node(child, next_depth)
-
-			elif isinstance(node, DOMTextNode):
-				# Add text only if it doesn't have a highlighted parent
-				if (
-					not node.has_parent_with_highlight_index()
-					and node.parent
-					and node.parent.is_visible
-					and node.parent.is_top_element
-				):  # and node.is_parent_top_element()
-					formatted_text.append(f'{depth_str}{node.text}')
-
-		process_node(self, 0)
+	def clickable_elements_to_string(
+		self,
+		include_attributes: list[str] | None = None,
+		max_tokens: int | None = None,
+		max_text_length: int | None = None,
+		compress_repeated: bool = False,
+		keep: set[int] | None = None,
+		fragment_cache: Optional['SerializedFragmentCache'] = None,
+	) -> str:
+		"""
+		Convert the processed DOM content to HTML.
+
+		Done in a single DFS (see iter_element_texts): every text node is attributed to its nearest
+		highlighted ancestor, so neither the text of an element nor the "has highlighted parent" check
+		needs another walk.
+
+		max_text_length caps the text shown per element. max_tokens stops the serialization once the
+		estimated size of the lines emitted so far exceeds the budget.
+
+		compress_repeated writes runs of similar sibling subtrees (product grids, result lists, table
+		rows) as one template followed by a row per item with its indices and the values that differ,
+		when that is shorter.
+
+		keep restricts the lines to the highlighted elements with these indices, the others and their
+		own text are left out (see ElementRelevanceRanker).
+
+		fragment_cache keeps the compressed lines of the runs across steps, keyed by a hash of the content
+		of their items, so the templates are only built again for the runs that changed. It is only used
+		with compress_repeated.
+		"""
+		return DOMElementNode._serialize_clickable_elements(
+			self, include_attributes, max_tokens, max_text_length, compress_repeated, keep, fragment_cache
+		)
+
+	def _serialize_clickable_elements(
+		self,
+		include_attributes: list[str] | None,
+		max_tokens: int | None,
+		max_text_length: int | None,
+		compress_repeated: bool,
+		keep: set[int] | None = None,
+		fragment_cache: Optional['SerializedFragmentCache'] = None,
+	) -> str:
+		max_chars = max_tokens * ESTIMATED_CHARACTERS_PER_TOKEN if max_tokens is not None else None
+		formatted_text: list[str] = []
+		total_chars = 0
+
+		# shape ids of the subtrees, only computed with compress_repeated
+		shapes: dict[Hashable, int] = {}
+		shape_ids: dict[tuple, int] = {}
+		# content hashes of the subtrees, only computed for the runs with a fragment cache
+		hashes: dict[Hashable, int] = {}
+
+		def group(children: list[DOMBaseNode]) -> list:
+			return _group_repeated_items(children, shapes, shape_ids, include_attributes)
+
+		def compress(run: list[DOMElementNode], depth: int) -> list[str]:
+			lines = None
+			if fragment_cache is not None:
+				# building the template is the expensive part, reuse it while the items are the same
+				fragment_key = (
+					tuple(_subtree_hash(item, hashes, keep, include_attributes) for item in run),
+					depth,
+					tuple(include_attributes or ()),
+					max_text_length,
+				)
+				lines = fragment_cache.get(fragment_key)
+			if lines is None:
+				# an empty list records a run not worth compressing
+				lines = _repeated_items_lines(run, depth, include_attributes, max_text_length, keep) or []
+				if fragment_cache is not None:
+					fragment_cache.put(fragment_key, lines)
+			return lines
+
+		items = iter_element_texts(
+			self,
+			keep,
+			max_text_length,
+			group if compress_repeated else None,
+			compress if compress_repeated else None,
+		)
+		for item in items:
+			if item.lines is not None:
+				lines = item.lines
+			elif isinstance(item.node, DOMTextNode):
+				lines = ['\t' * item.depth + item.text]
+			else:
+				lines = [item.node._clickable_element_line(item.depth, item.text, include_attributes, max_text_length)]
+
+			for line in lines:
+				total_chars += len(line) + 1
+				if max_chars is not None and total_chars > max_chars:
+					formatted_text.append(ELEMENTS_TRUNCATED)
+					return '\n'.join(formatted_text)
+				formatted_text.append(line)
+
 		return '\n'.join(formatted_text)
 
+	def _clickable_element_line(
+		self,
+		depth: int,
+		text: str,
+		include_attributes: list[str] | None,
+		max_text_length: int | None,
+	) -> str:
+		if max_text_length is not None and len(text) > max_text_length:
+			text = text[:max_text_length] + '...'
+
+		attributes_html_str = ''
+		if include_attributes:
+			attributes_to_include = {key: str(value) for key, value in self.attributes.items() if key in include_attributes}
+
+			# Easy LLM optimizations
+			# if tag == role attribute, don't include it
+			if self.tag_name == attributes_to_include.get('role'):
+				del attributes_to_include['role']
+
+			# if aria-label == text of the node, don't include it
+			if attributes_to_include.get('aria-label') and attributes_to_include.get('aria-label', '').strip() == text.strip():
+				del attributes_to_include['aria-label']
+
+			# if placeholder == text of the node, don't include it
+			if attributes_to_include.get('placeholder') and attributes_to_include.get('placeholder', '').strip() == text.strip():
+				del attributes_to_include['placeholder']
+
+			if attributes_to_include:
+				# Format as key1='value1' key2='value2'
+				attributes_html_str = ' '.join(f"{key}='{value}'" for key, value in attributes_to_include.items())
+
+		# Build the line
+		if self.is_new:
+			highlight_indicator = f'*[{self.highlight_index}]*'
+		else:
+			highlight_indicator = f'[{self.highlight_index}]'
+
+		depth_str = depth * '\t'
+		line = f'{depth_str}{highlight_indicator}<{self.tag_name}'
+
+		if attributes_html_str:
+			line += f' {attributes_html_str}'
+
+		if text:
+			# Add space before >text only if there were NO attributes added before
+			if not attributes_html_str:
+				line += ' '
+			line += f'>{text}'
+		# Add space before /> only if neither attributes NOR text were added
+		elif not attributes_html_str:
+			line += ' '
+
+		line += ' />'  # 1 token
+		return line
+
 	def get_file_upload_element(self, check_siblings: bool = True) -> Optional['DOMElementNode']:
 		# Check if current element is a file input
 		if self.tag_name == 'input' and self.attributes.get('type') == 'file':
@@ -256,10 +353,371 @@ class DOMElementNode(DOMBaseNode):
 		return None
 
 
+def node_key(node: DOMElementNode) -> Hashable:
+	"""Dict or set key of an element: DOMElementNode compares by value and is unhashable, arena views hash by their position"""
+	return id(node) if type(node).__hash__ is None else node
+
+
+def _is_element(node: DOMBaseNode) -> bool:
+	# the isinstance check goes through the ABC registry (arena views), skip it for plain nodes
+	return type(node) is DOMElementNode or (type(node) is not DOMTextNode and isinstance(node, DOMElementNode))
+
+
+@dataclass(eq=False)
+class ElementText:
+	"""
+	Item of `iter_element_texts`: a highlighted element with the text it owns, a loose text line (`node`
+	is the text node) or the lines of a compressed run of similar siblings (`node` is None).
+	"""
+
+	node: 'DOMElementNode | DOMTextNode | None'
+	# number of highlighted ancestors, not counting the ones left out by keep
+	depth: int
+	text: str = ''
+	# item of the nearest highlighted ancestor that is kept
+	owner: Optional['ElementText'] = None
+	# whether other highlighted elements are nested in the element
+	wraps: bool = False
+	lines: list[str] | None = None
+
+
+def iter_element_texts(
+	root: DOMElementNode,
+	keep: set[int] | None = None,
+	max_text_length: int | None = None,
+	group: Callable[[list[DOMBaseNode]], list] | None = None,
+	compress: Callable[[list[DOMElementNode], int], list[str] | None] | None = None,
+) -> Iterator[ElementText]:
+	"""
+	The highlighted elements under `root` with their text, and the loose text lines, in document order.
+
+	Every text node belongs to its nearest highlighted ancestor, the texts without one are loose lines
+	when their parent is a visible top element. The elements left out by keep still own their text but
+	are not yielded. With max_text_length an element stops collecting text past that length.
+
+	Outside of highlighted elements, group may turn runs of children into lists and compress return
+	the lines of such a run, or nothing to walk its items one by one.
+	"""
+	# items of the open highlighted elements, yielded once the outermost one is closed
+	pending: list[ElementText] = []
+	# stack items are (node, depth, owner, parent), owner being the open entry of the nearest highlighted
+	# ancestor: [item, text parts, text length, enclosing owner], the item being None when keep leaves
+	# it out, and parent the item of the nearest kept one. None marks the end of an owner.
+	stack: list = [(root, 0, None, None)]
+	while stack:
+		node, depth, owner, parent = stack.pop()
+
+		if node is None:
+			item, text_parts, _, enclosing = owner
+			if item is not None:
+				item.text = '\n'.join(text_parts).strip()
+			if enclosing is None:
+				yield from pending
+				pending.clear()
+		elif isinstance(node, list):
+			lines = compress(node, depth) if compress is not None else None
+			if lines:
+				yield ElementText(None, depth, owner=parent, lines=lines)
+			else:
+				stack.extend((child, depth, owner, parent) for child in reversed(node))
+		elif isinstance(node, DOMElementNode):
+			children = node.children
+			if node.highlight_index is not None:
+				if owner is not None and owner[0] is not None:
+					owner[0].wraps = True
+				item = None
+				if keep is None or node.highlight_index in keep:
+					item = ElementText(node, depth, owner=parent)
+					pending.append(item)
+					parent = item
+					depth += 1
+				owner = [item, [], 0, owner]
+				stack.append((None, depth, owner, parent))
+			elif group is not None and owner is None:
+				children = group(children)
+			stack.extend((child, depth, owner, parent) for child in reversed(children))
+		elif isinstance(node, DOMTextNode):
+			if owner is not None:
+				if owner[0] is not None and (max_text_length is None or owner[2] <= max_text_length):
+					owner[1].append(node.text)
+					owner[2] += len(node.text) + 1
+			elif node.parent and node.parent.is_visible and node.parent.is_top_element:
+				yield ElementText(node, depth, node.text)
+
+
+def _shape_id(
+	node: DOMElementNode,
+	shapes: dict[Hashable, int],
+	shape_ids: dict[tuple, int],
+	include_attributes: list[str] | None,
+) -> int:
+	"""Id of the shape of the subtree (tags, highlighted elements, shown attribute names, text positions)"""
+	shown_attributes = set(include_attributes or ())
+	stack: list[tuple[DOMElementNode, bool]] = [(node, False)]
+	while stack:
+		current, expanded = stack.pop()
+		key = node_key(current)
+		if key in shapes:
+			continue
+		children = current.children
+		if not expanded:
+			stack.append((current, True))
+			stack.extend((child, False) for child in children if isinstance(child, DOMElementNode))
+			continue
+
+		shape = (
+			current.tag_name,
+			current.highlight_index is not None,
+			tuple(name for name in current.attributes if name in shown_attributes),
+			tuple(shapes[node_key(child)] if isinstance(child, DOMElementNode) else -1 for child in children),
+		)
+		shapes[key] = shape_ids.setdefault(shape, len(shape_ids))
+	return shapes[node_key(node)]
+
+
+def _subtree_hash(
+	node: DOMElementNode,
+	hashes: dict[Hashable, int],
+	keep: set[int] | None,
+	include_attributes: list[str] | None,
+) -> int:
+	"""
+	Hash of what the lines of the subtree depend on, memoized in `hashes`: the texts, the tag, shown
+	attributes, index and new flag of the highlighted elements, and whether the other elements show
+	their text outside of a highlighted element.
+	"""
+	shown_attributes = include_attributes or ()
+	# pre-order, so walking it backwards sees the children of an element before the element
+	elements: list[DOMElementNode] = []
+	stack = [node]
+	while stack:
+		current = stack.pop()
+		elements.append(current)
+		stack.extend(child for child in current.children if _is_element(child))
+
+	for current in reversed(elements):
+		content = tuple(hashes[node_key(child)] if _is_element(child) else child.text for child in current.children)  # type: ignore
+		highlight_index = current.highlight_index
+		if highlight_index is not None:
+			attributes = current.attributes
+			content = (
+				current.tag_name,
+				tuple((name, attributes[name]) for name in shown_attributes if name in attributes),
+				highlight_index,
+				bool(current.is_new),
+				keep is None or highlight_index in keep,
+				content,
+			)
+		else:
+			content = (bool(current.is_visible and current.is_top_element), content)
+		hashes[node_key(current)] = hash(content)
+	return hashes[node_key(node)]
+
+
+def _group_repeated_items(
+	children: list[DOMBaseNode],
+	shapes: dict[Hashable, int],
+	shape_ids: dict[tuple, int],
+	include_attributes: list[str] | None,
+) -> list:
+	"""The children with every run of at least MIN_REPEATED_ITEMS same-shaped elements replaced by a list"""
+	if len(children) < MIN_REPEATED_ITEMS:
+		return children
+
+	grouped: list = []
+	run: list[DOMElementNode] = []
+	run_shape = None
+	for child in children:
+		shape = _shape_id(child, shapes, shape_ids, include_attributes) if isinstance(child, DOMElementNode) else None
+		if shape is not None and shape == run_shape:
+			run.append(child)
+			continue
+		grouped.extend([run] if len(run) >= MIN_REPEATED_ITEMS else run)
+		run, run_shape = ([child], shape) if shape is not None else ([], None)
+		if shape is None:
+			grouped.append(child)
+	grouped.extend([run] if len(run) >= MIN_REPEATED_ITEMS else run)
+	return grouped
+
+
+def _template_line(rests: list[str], first_value: int) -> tuple[str, list[list[str]]]:
+	"""
+	Template of the same line across the items, with a {n} placeholder (numbered from `first_value`) per
+	span of words that differ, and the values of each item.
+	"""
+	tokenized = [_WORD_BOUNDARIES.split(rest) for rest in rests]
+	if any(len(tokens) != len(tokenized[0]) for tokens in tokenized):
+		# not aligned word by word: a single placeholder between the common prefix and suffix,
+		# which do not cut a word in two
+		prefix = os.path.commonprefix(rests)
+		while prefix and prefix[-1].isalnum():
+			prefix = prefix[:-1]
+		suffix = os.path.commonprefix([rest[len(prefix) :][::-1] for rest in rests])[::-1]
+		while suffix and suffix[0].isalnum():
+			suffix = suffix[1:]
+		tokenized = [[prefix, rest[len(prefix) : len(rest) - len(suffix)], suffix] for rest in rests]
+
+	template = ''
+	values: list[list[str]] = [[] for _ in rests]
+	open_span = False
+	for column in zip(*tokenized):
+		if all(token == column[0] for token in column):
+			template += column[0]
+			open_span = False
+			continue
+		if open_span:
+			for item_values, token in zip(values, column):
+				item_values[-1] += token
+			continue
+		template += f'{{{first_value + len(values[0])}}}'
+		for item_values, token in zip(values, column):
+			item_values.append(token)
+		open_span = True
+	return template, values
+
+
+def _repeated_items_lines(
+	items: list[DOMElementNode],
+	depth: int,
+	include_attributes: list[str] | None,
+	max_text_length: int | None,
+	keep: set[int] | None = None,
+) -> list[str] | None:
+	"""
+	Lines of a run of similar items: a template with [#n] for the n-th index of an item and {n} for its
+	n-th value, then one row per item with its indices and values. None when the items do not render
+	the same lines or the compressed form is not shorter.
+	"""
+	rendered = [
+		DOMElementNode._serialize_clickable_elements(item, include_attributes, None, max_text_length, True, keep).split('\n')
+		for item in items
+	]
+	if not rendered[0][0] or any(len(lines) != len(rendered[0]) for lines in rendered):
+		return None
+	parsed = [[_SERIALIZED_LINE.fullmatch(line).groups() for line in lines] for lines in rendered]  # type: ignore
+	structure = [(tabs, indicator is None) for tabs, indicator, _ in parsed[0]]
+	if any([(tabs, indicator is None) for tabs, indicator, _ in item_lines] != structure for item_lines in parsed):
+		return None
+
+	indent = '\t' * (depth + 1)
+	template: list[str] = []
+	values: list[list[str]] = [[] for _ in items]
+	index_count = 0
+	for position, (tabs, has_no_index) in enumerate(structure):
+		rests = [item_lines[position][2] for item_lines in parsed]
+		line = indent + tabs
+		if not has_no_index:
+			index_count += 1
+			line += f'[#{index_count}]'
+		line_template, line_values = _template_line(rests, len(values[0]) + 1)
+		template.append(line + line_template)
+		for item_values, values_of_line in zip(values, line_values):
+			item_values.extend(values_of_line)
+
+	lines = [
+		'\t' * depth + f'{len(items)} similar items, template ([#n] is the n-th index of an item, {{n}} its n-th value):',
+		*template,
+		'\t' * depth + 'items:',
+	]
+	for item_lines, item_values in zip(parsed, values):
+		indicators = ''.join(indicator for _, indicator, _ in item_lines if indicator is not None)
+		lines.append(indent + ' '.join(part for part in (indicators, ' | '.join(item_values)) if part))
+
+	original_length = sum(len(line) + depth + 1 for item in rendered for line in item)
+	if sum(len(line) + 1 for line in lines) >= original_length:
+		return None
+	return lines
+
+
 SelectorMap = dict[int, DOMElementNode]
 
 
+@dataclass
+class HighlightMarks:
+	"""Viewport boxes of the highlighted elements, for drawing the set-of-marks on a screenshot"""
+
+	# rows of [highlight_index, left, top, width, height] in CSS pixels
+	boxes: list[list[float]]
+	device_pixel_ratio: float = 1.0
+
+
+class SerializedFragmentCache:
+	"""
+	Bounded LRU of the lines of serialized subtrees, kept on the browser session so the element lists of
+	the next steps reuse the parts that did not change.
+	"""
+
+	def __init__(self, max_size: int = 2048) -> None:
+		self.max_size = max_size
+		self._fragments: OrderedDict[Hashable, list[str]] = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def __len__(self) -> int:
+		return len(self._fragments)
+
+	def get(self, key: Hashable) -> list[str] | None:
+		fragment = self._fragments.get(key)
+		if fragment is None:
+			self.misses += 1
+			return None
+		self._fragments.move_to_end(key)
+		self.hits += 1
+		return fragment
+
+	def put(self, key: Hashable, lines: list[str]) -> None:
+		if self.max_size <= 0:
+			return
+		self._fragments[key] = lines
+		self._fragments.move_to_end(key)
+		while len(self._fragments) > self.max_size:
+			self._fragments.popitem(last=False)
+
+	def clear(self) -> None:
+		self._fragments.clear()
+
+
 @dataclass
 class DOMState:
 	element_tree: DOMElementNode
 	selector_map: SelectorMap
+	# the extraction stopped at its node or time budget, the tree misses part of the page
+	truncated: bool = field(default=False, kw_only=True)
+	# only filled when the extraction was asked to collect the marks, to draw them or to query boxes
+	marks: HighlightMarks | None = field(default=None, kw_only=True)
+	# serialized subtrees of the earlier states of the same session, see clickable_elements_to_string
+	fragment_cache: SerializedFragmentCache | None = field(default=None, kw_only=True, repr=False, compare=False)
+
+	@cached_property
+	def lookup_index(self) -> 'DOMLookupIndex':
+		"""Secondary indexes of the snapshot (xpath, tag, role, text, file inputs), built on first use"""
+		from browzee_agent.dom.lookup_index.service import DOMLookupIndexBuilder
+
+		return DOMLookupIndexBuilder.build(self.element_tree)
+
+	@cached_property
+	def reidentification_index(self) -> 'ReidentificationIndex':
+		"""Highlighted elements keyed for the fuzzy matching of history elements on replay, built on first use"""
+		from browzee_agent.dom.reidentification.service import ReidentificationIndexBuilder
+
+		return ReidentificationIndexBuilder.build(self.selector_map)
+
+	@cached_property
+	def spatial_index(self) -> Optional['SpatialIndex']:
+		"""Grid over the boxes of the highlighted elements, only when the marks were collected"""
+		if self.marks is None:
+			return None
+		from browzee_agent.dom.spatial_index.service import SpatialIndexBuilder
+
+		return SpatialIndexBuilder.from_marks(self.marks, self.selector_map)
+
+
+@dataclass
+class DOMTile:
+	"""DOM state extracted ahead of time for the scroll position the page will have after a scroll"""
+
+	scroll_y: int
+	# cheap page fingerprint taken when the tile was extracted, see DomService.take_prefetched_state
+	fingerprint: str
+	run_name: str
+	state: DOMState